@@ -0,0 +1,27 @@
+"""Add ingest_id to refuelings for exactly-once spool replay
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('refuelings', sa.Column('ingest_id', sa.String(length=32), nullable=True))
+    op.create_unique_constraint('uq_refuelings_ingest_id', 'refuelings', ['ingest_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_refuelings_ingest_id', 'refuelings', type_='unique')
+    op.drop_column('refuelings', 'ingest_id')
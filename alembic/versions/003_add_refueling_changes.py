@@ -0,0 +1,34 @@
+"""Add refueling_changes outbox for the change feed
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('refueling_changes',
+    sa.Column('seq', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('refueling_id', sa.Integer(), nullable=False),
+    sa.Column('operation', sa.String(length=16), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('seq')
+    )
+    op.create_index(op.f('ix_refueling_changes_created_at'), 'refueling_changes', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_refueling_changes_created_at'), table_name='refueling_changes')
+    op.drop_table('refueling_changes')
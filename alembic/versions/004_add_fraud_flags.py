@@ -0,0 +1,25 @@
+"""Add fraud_flags to refuelings
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('refuelings', sa.Column('fraud_flags', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('refuelings', 'fraud_flags')
@@ -0,0 +1,34 @@
+"""Add sketches table for mergeable ingest-time summaries
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('sketches',
+    sa.Column('kind', sa.String(length=32), nullable=False),
+    sa.Column('key', sa.String(length=128), nullable=False),
+    sa.Column('day', sa.Date(), nullable=True),
+    sa.Column('payload', sa.LargeBinary(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'key')
+    )
+    op.create_index(op.f('ix_sketches_day'), 'sketches', ['day'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_sketches_day'), table_name='sketches')
+    op.drop_table('sketches')
@@ -0,0 +1,27 @@
+"""Add rebuild marks to sketches so deltas already counted by a rebuild are dropped
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('sketches', sa.Column('rebuilt_through', sa.BigInteger(), nullable=True))
+    op.add_column('sketches', sa.Column('rebuilt_missing', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('sketches', 'rebuilt_missing')
+    op.drop_column('sketches', 'rebuilt_through')
@@ -1,38 +1,75 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import select, desc, func
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime, date, time
+from datetime import date
 from typing import Optional
 
-from app.core.database import get_db
+from app.core.circuit_breaker import is_outage_error
+from app.core.coalescing import read_key, shared_read
+from app.core.database import CONSISTENCY_HEADER, get_db, get_read_db, issue_consistency_token
 from app.core.security import get_api_key
-from app.core.logging_config import get_logger
-from app.models.abastecimento import Refueling
-from app.schemas.abastecimento import RefuelingCreate, RefuelingResponse
+from app.core.spool import INGEST_MODE, ingest_spool
+from app.core.stale_cache import with_stale_fallback
+from app.core.logging_config import get_logger, mask_cpf
+from app.core.query_guard import guarded
+from app.core.timing import timed_phase
+from app.schemas.abastecimento import (
+    BulkCorrection,
+    BulkCorrectionResponse,
+    RefuelingCreate,
+    RefuelingLookup,
+    RefuelingLookupResponse,
+    RefuelingResponse,
+)
 from app.schemas.pagination import PaginatedResponse
-from app.services.abastecimento_service import RefuelingService
+from app.services import abastecimento_service
+from app.services.abastecimento_service import NOT_FOUND, UNCHANGED, UPDATED, RefuelingService
+from app.services.archival_service import ArchivalService, archive_filters
 from app.utils.enums import FuelType
 
 router = APIRouter(tags=["Refuelings"])
 logger = get_logger(__name__)
 
+
+def _queued(record_id: str, detail: str) -> JSONResponse:
+    return JSONResponse(
+        {"status": "queued", "id": record_id, "detail": detail},
+        status_code=status.HTTP_202_ACCEPTED,
+    )
+
+
 @router.post(
     "/abastecimentos",
     response_model=RefuelingResponse,
-    status_code=201
+    status_code=201,
+    responses={202: {"description": "Accepted into the local ingestion spool"}},
 )
 async def create_refueling(
     refueling: RefuelingCreate,
+    response: Response,
     db: AsyncSession = Depends(get_db),
-    api_key: str = Depends(get_api_key)
+    api_key: str = Depends(get_api_key),
 ):
     try:
-        logger.info(f"Creating refueling for station {refueling.station_id}, driver CPF: {refueling.driver_cpf}")
-        created = await RefuelingService.create_refueling(db, refueling)
-        logger.info(f"Refueling created successfully with ID: {created.id}, improper_data: {created.improper_data}")
+        logger.info("Creating refueling for station %s, driver CPF: %s", refueling.station_id, mask_cpf(refueling.driver_cpf))
+        if INGEST_MODE == "spool":
+            record_id = await ingest_spool.append(refueling.model_dump(mode="json"))
+            return _queued(record_id, "Refueling queued for ingestion")
+        try:
+            created = await RefuelingService.create_refueling(db, refueling)
+        except Exception as e:
+            if not is_outage_error(e):
+                raise
+            # The database is down: keep the refueling on local disk and
+            # acknowledge it; it is inserted once the circuit closes again.
+            record_id = await ingest_spool.spill(refueling.model_dump(mode="json"))
+            logger.warning("Database unavailable, refueling spooled for replay - %s", e)
+            return _queued(record_id, "Database unavailable, refueling queued for replay")
+        logger.info("Refueling created successfully with ID: %s, improper_data: %s", created.id, created.improper_data)
+        response.headers[CONSISTENCY_HEADER] = await issue_consistency_token(db)
         return created
     except ValueError as e:
-        logger.error(f"Validation error creating refueling: {str(e)}")
+        logger.error("Validation error creating refueling: %s", e)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 @router.get(
@@ -44,42 +81,111 @@ async def list_refuelings(
     refueling_date: Optional[date] = Query(None, description="Data do abastecimento"),
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
+    include_archived: bool = False,
 ):
-    logger.info(f"Listing refuelings - page: {page}, size: {size}, fuel_type: {fuel_type}, date: {refueling_date}")
+    logger.info("Listing refuelings - page: %s, size: %s, fuel_type: %s, date: %s", page, size, fuel_type, refueling_date)
     offset = (page - 1) * size
 
-    base_query = select(Refueling)
-    count_query = select(func.count(Refueling.id))
+    count_query, base_query = RefuelingService.list_queries(
+        fuel_type.value if fuel_type else None, refueling_date
+    )
+
+    filters = (fuel_type.value if fuel_type else None, refueling_date)
+
+    async def load_page():
+        if include_archived:
+            with timed_phase("page"):
+                try:
+                    total, data = await guarded(db, ArchivalService.page_with_archive(
+                        db, count_query, base_query, *archive_filters(*filters), offset, size
+                    ))
+                except ValueError as e:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            return {"total": total, "page": page, "size": size, "data": data}
+
+        with timed_phase("count"):
+            total = await guarded(db, shared_read(
+                db,
+                read_key(db, "list_count", *filters),
+                lambda session: RefuelingService.count(session, count_query),
+            ))
 
-    if fuel_type:
-        base_query = base_query.where(Refueling.fuel_type == fuel_type.value)
-        count_query = count_query.where(Refueling.fuel_type == fuel_type.value)
+        data_query = base_query.offset(offset).limit(size)
 
-    if refueling_date:
-        start = datetime.combine(refueling_date, time.min)
-        end = datetime.combine(refueling_date, time.max)
-        base_query = base_query.where(Refueling.timestamp.between(start, end))
-        count_query = count_query.where(Refueling.timestamp.between(start, end))
+        with timed_phase("page"):
+            data = await guarded(db, shared_read(
+                db,
+                read_key(db, "list_page", *filters, offset, size),
+                lambda session: RefuelingService.fetch_page(session, data_query),
+                RefuelingService.serialize_page,
+            ))
 
-    total_result = await db.execute(count_query)
-    total = total_result.scalar()
+        logger.info("Found %s total refuelings, returning %s for current page", total, len(data))
 
-    data_query = (
-        base_query
-        .order_by(desc(Refueling.timestamp))
-        .offset(offset)
-        .limit(size)
+        return {
+            "total": total,
+            "page": page,
+            "size": size,
+            "data": data
+        }
+
+    return await with_stale_fallback(
+        "list_refuelings",
+        ("list_refuelings", *filters, page, size, include_archived),
+        load_page,
+        PaginatedResponse[RefuelingResponse],
     )
 
-    result = await db.execute(data_query)
-    data = result.scalars().all()
-    
-    logger.info(f"Found {total} total refuelings, returning {len(data)} for current page")
-    
+
+@router.post("/abastecimentos/lookup", response_model=RefuelingLookupResponse)
+async def lookup_refuelings(
+    lookup: RefuelingLookup,
+    db: AsyncSession = Depends(get_read_db),
+    api_key: str = Depends(get_api_key),
+):
+    """Refuelings by id, in the order asked for, with one query.
+
+    Ids not found (or already archived) are listed in ``missing``.
+    """
+    if len(lookup.ids) > abastecimento_service.REFUELING_LOOKUP_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Máximo de {abastecimento_service.REFUELING_LOOKUP_MAX_IDS} ids por consulta",
+        )
+    logger.info("Looking up %s refuelings by id", len(lookup.ids))
+    found = await guarded(db, RefuelingService.get_many(db, lookup.ids))
+    found_ids = {refueling.id for refueling in found}
+    return {
+        "data": found,
+        "missing": [refueling_id for refueling_id in dict.fromkeys(lookup.ids) if refueling_id not in found_ids],
+    }
+
+
+@router.patch("/abastecimentos/bulk", response_model=BulkCorrectionResponse)
+async def correct_refuelings(
+    correction: BulkCorrection,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Depends(get_api_key),
+):
+    """Applies ``improper_data`` corrections in one transaction, with the
+    outcome of each id. Every changed row gets an ``update`` entry in the
+    change feed."""
+    if len(correction.updates) > abastecimento_service.REFUELING_BULK_MAX_UPDATES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Máximo de {abastecimento_service.REFUELING_BULK_MAX_UPDATES} correções por lote",
+        )
+    corrections = {item.id: item.improper_data for item in correction.updates}
+    if len(corrections) != len(correction.updates):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cada id pode aparecer uma vez no lote")
+
+    results = await RefuelingService.correct_improper(db, corrections)
+    counts = {result: sum(1 for value in results.values() if value == result) for result in (UPDATED, UNCHANGED, NOT_FOUND)}
+    logger.info("Bulk improper_data correction: %s", counts)
+    response.headers[CONSISTENCY_HEADER] = await issue_consistency_token(db)
     return {
-        "total": total,
-        "page": page,
-        "size": size,
-        "data": data
-    }
\ No newline at end of file
+        **counts,
+        "results": [{"id": refueling_id, "status": result} for refueling_id, result in results.items()],
+    }
@@ -0,0 +1,241 @@
+import asyncio
+import math
+import os
+import re
+import time
+from collections import deque
+from typing import Optional
+
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+
+from app.core.logging_config import get_logger, mask_cpf
+from app.core.metrics import ADMISSION_QUEUE_WAIT, ADMISSION_REJECTED
+
+logger = get_logger(__name__)
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+# Total requests allowed to work at once; match it to the DB pool (pool_size + max_overflow).
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "15"))
+ADMISSION_INGEST_CONCURRENCY = int(os.getenv("ADMISSION_INGEST_CONCURRENCY", "15"))
+ADMISSION_INGEST_QUEUE = int(os.getenv("ADMISSION_INGEST_QUEUE", "200"))
+ADMISSION_INGEST_MAX_WAIT_MS = float(os.getenv("ADMISSION_INGEST_MAX_WAIT_MS", "2000"))
+# Reads are capped below the total so ingestion always has slots of its own.
+ADMISSION_READ_CONCURRENCY = int(os.getenv("ADMISSION_READ_CONCURRENCY", "10"))
+ADMISSION_READ_QUEUE = int(os.getenv("ADMISSION_READ_QUEUE", "50"))
+ADMISSION_READ_MAX_WAIT_MS = float(os.getenv("ADMISSION_READ_MAX_WAIT_MS", "500"))
+# Per-route limits inside the class limits: "METHOD /template=concurrency:queue:max_wait_ms",
+# comma separated. They keep one expensive route from taking every slot of its class.
+ADMISSION_ROUTE_LIMITS = os.getenv(
+    "ADMISSION_ROUTE_LIMITS",
+    "GET /api/v1/abastecimentos=6:30:500,GET /api/v1/motoristas/{cpf}/historico=6:30:500",
+)
+
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RouteClass:
+    def __init__(self, name: str, priority: int, max_concurrency: int, max_queue: int, max_wait_ms: float):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait_ms / 1000
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+
+
+class AdmissionController:
+    """Concurrency limiter with per-class caps and bounded wait queues.
+
+    When a slot frees up, waiters of the class with the lowest ``priority``
+    value go first. A request is rejected with 429 when its class queue is
+    full and with 503 when it waited longer than the class budget.
+    """
+
+    def __init__(self, capacity: int, classes: list[RouteClass]):
+        self.capacity = capacity
+        self.classes = {route_class.name: route_class for route_class in classes}
+        self._by_priority = sorted(classes, key=lambda route_class: route_class.priority)
+        self.active = 0
+
+    def _has_room(self, route_class: RouteClass) -> bool:
+        return self.active < self.capacity and route_class.active < route_class.max_concurrency
+
+    def _grant(self, route_class: RouteClass) -> None:
+        self.active += 1
+        route_class.active += 1
+
+    def _retry_after(self, route_class: RouteClass) -> int:
+        return max(1, math.ceil(route_class.max_wait))
+
+    async def acquire(self, name: str) -> float:
+        route_class = self.classes[name]
+        ahead = any(
+            other.waiters for other in self._by_priority if other.priority <= route_class.priority
+        )
+        if not ahead and self._has_room(route_class):
+            self._grant(route_class)
+            return 0.0
+
+        if len(route_class.waiters) >= route_class.max_queue:
+            raise Rejected(status.HTTP_429_TOO_MANY_REQUESTS, "queue_full", self._retry_after(route_class))
+
+        waiter = asyncio.get_running_loop().create_future()
+        route_class.waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), route_class.max_wait)
+        except asyncio.TimeoutError:
+            # A waiter granted right as the budget ran out keeps its slot.
+            if not waiter.done():
+                waiter.cancel()
+                raise Rejected(
+                    status.HTTP_503_SERVICE_UNAVAILABLE,
+                    "wait_budget_exceeded",
+                    self._retry_after(route_class),
+                )
+        except asyncio.CancelledError:
+            # Client went away while queued: hand back a slot we may have
+            # been granted in the meantime.
+            if waiter.done() and not waiter.cancelled():
+                self.release(name)
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            if waiter in route_class.waiters:
+                route_class.waiters.remove(waiter)
+        return time.perf_counter() - started
+
+    def release(self, name: str) -> None:
+        route_class = self.classes[name]
+        self.active -= 1
+        route_class.active -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        for route_class in self._by_priority:
+            while route_class.waiters and self._has_room(route_class):
+                waiter = route_class.waiters.popleft()
+                if waiter.done():
+                    continue
+                self._grant(route_class)
+                waiter.set_result(None)
+            if self.active >= self.capacity:
+                return
+
+
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENCY,
+    [
+        RouteClass("ingest", 0, ADMISSION_INGEST_CONCURRENCY, ADMISSION_INGEST_QUEUE, ADMISSION_INGEST_MAX_WAIT_MS),
+        RouteClass("read", 1, ADMISSION_READ_CONCURRENCY, ADMISSION_READ_QUEUE, ADMISSION_READ_MAX_WAIT_MS),
+    ],
+)
+
+
+def _template_pattern(template: str) -> re.Pattern:
+    # Routing has not run yet when admission happens, so the route template
+    # is matched against the raw path here.
+    parts = re.split(r"(\{[^}]+\})", template)
+    return re.compile(
+        "^" + "".join("[^/]+" if part.startswith("{") else re.escape(part) for part in parts) + "$"
+    )
+
+
+def parse_route_limits(spec: str) -> list[tuple[str, str, re.Pattern, RouteClass]]:
+    routes = []
+    for item in spec.split(","):
+        route, sep, limits = item.strip().rpartition("=")
+        method, _, template = route.strip().partition(" ")
+        try:
+            concurrency, queue_size, max_wait_ms = limits.split(":")
+            route_class = RouteClass(
+                route.strip(), 0, int(concurrency), int(queue_size), float(max_wait_ms)
+            )
+        except ValueError:
+            if item.strip():
+                logger.warning("Ignoring invalid admission route limit %r", item)
+            continue
+        if not sep or not template:
+            continue
+        routes.append((method.upper(), template, _template_pattern(template), route_class))
+    return routes
+
+
+route_limits = parse_route_limits(ADMISSION_ROUTE_LIMITS)
+# Route classes have no shared capacity of their own: the class controller
+# above already bounds the total.
+route_admission = AdmissionController(math.inf, [route_class for *_, route_class in route_limits])
+
+
+def classify(request: Request) -> Optional[str]:
+    if not request.url.path.startswith("/api/"):
+        return None
+    return "read" if request.method in ("GET", "HEAD") else "ingest"
+
+
+def classify_route(request: Request) -> Optional[str]:
+    for method, _, pattern, route_class in route_limits:
+        if request.method == method and pattern.match(request.url.path):
+            return route_class.name
+    return None
+
+
+_CPF_SEGMENT = re.compile(r"^\d{3}\.?\d{3}\.?\d{3}-?\d{2}$")
+
+
+def _log_path(request: Request) -> str:
+    # No route template yet (routing runs after admission): mask CPF-shaped
+    # path segments such as the one in /motoristas/{cpf}/historico.
+    return "/".join(
+        mask_cpf(part) if _CPF_SEGMENT.match(part) else part for part in request.url.path.split("/")
+    )
+
+
+def _shed(name: str, request: Request, e: Rejected) -> JSONResponse:
+    ADMISSION_REJECTED.labels(name, e.reason).inc()
+    logger.warning("Shedding %s request to %s: %s", name, _log_path(request), e.reason)
+    return JSONResponse(
+        {"detail": "Server overloaded, retry later"},
+        status_code=e.status_code,
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+async def admission_middleware(request: Request, call_next):
+    route_class = classify(request)
+    if route_class is None:
+        return await call_next(request)
+
+    # The route slot is taken first so a request queued on its route limit
+    # never holds one of the class slots meanwhile.
+    route = classify_route(request)
+    if route is not None:
+        try:
+            waited = await route_admission.acquire(route)
+        except Rejected as e:
+            return _shed(route, request, e)
+        ADMISSION_QUEUE_WAIT.labels(route).observe(waited)
+
+    try:
+        try:
+            waited = await admission.acquire(route_class)
+        except Rejected as e:
+            return _shed(route_class, request, e)
+
+        ADMISSION_QUEUE_WAIT.labels(route_class).observe(waited)
+        try:
+            return await call_next(request)
+        finally:
+            admission.release(route_class)
+    finally:
+        if route is not None:
+            route_admission.release(route)
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import socket
+import time
+from typing import Optional
+
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import event, exc
+
+from app.core.logging_config import get_logger
+from app.core.metrics import DB_CIRCUIT_REJECTED, DB_CIRCUIT_STATE
+
+logger = get_logger(__name__)
+
+DB_CIRCUIT_ENABLED = os.getenv("DB_CIRCUIT_ENABLED", "true").lower() == "true"
+# Consecutive connection-level failures that open the circuit.
+DB_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("DB_CIRCUIT_FAILURE_THRESHOLD", "5"))
+# How long the circuit stays open before one probe connection is let through.
+DB_CIRCUIT_RESET_SECONDS = float(os.getenv("DB_CIRCUIT_RESET_SECONDS", "10"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# SQLSTATE classes for connection problems: 08xxx (connection exception)
+# and 57P0x (admin/crash shutdown, cannot connect now).
+_OUTAGE_SQLSTATES = ("08", "57P")
+# Set on errors the engine saw while connecting or that invalidated the
+# connection, so callers further up can tell them from statement errors.
+_OUTAGE_MARK = "_db_outage"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Database circuit '{name}' is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker for one engine.
+
+    Closed: every connection goes through. Open: new connections fail with
+    ``CircuitOpenError`` without touching the network. After
+    ``reset_seconds`` a single probe is let through (half-open); its outcome
+    closes or re-opens the circuit.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_started_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.state != CLOSED
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(self.reset_seconds - (time.monotonic() - self.opened_at), 0.0)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning("Database circuit '%s' %s -> %s", self.name, self.state, state)
+        self.state = state
+        DB_CIRCUIT_STATE.labels(self.name).set(_STATE_VALUES[state])
+
+    def check(self) -> None:
+        """Raises ``CircuitOpenError`` unless a connection may be attempted."""
+        if self.state == CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == OPEN and now - self.opened_at >= self.reset_seconds:
+            self._set_state(HALF_OPEN)
+            self._probe_started_at = now
+            return
+        # A probe that never reported back (e.g. cancelled) must not keep the
+        # circuit half-open forever.
+        if self.state == HALF_OPEN and now - self._probe_started_at >= self.reset_seconds:
+            self._probe_started_at = now
+            return
+        DB_CIRCUIT_REJECTED.labels(self.name).inc()
+        raise CircuitOpenError(self.name, self.retry_after() or self.reset_seconds)
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.state != CLOSED:
+            self.opened_at = None
+            self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def reset(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._set_state(CLOSED)
+
+
+def is_outage_error(error: BaseException) -> bool:
+    """True for errors meaning the database is unreachable, as opposed to a
+    failing statement (constraint violation, syntax error, timeout).
+
+    Only connection failures count: refused/reset connections, name lookup
+    errors, errors raised while connecting or that invalidated the
+    connection, and the outage SQLSTATEs. A bare ``TimeoutError`` (a slow
+    statement or a driver command timeout) is not an outage, even though it
+    is an ``OSError`` on Python 3.11+.
+    """
+    seen = set()
+    current: Optional[BaseException] = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(current, (CircuitOpenError, ConnectionError, socket.gaierror)):
+            return True
+        if getattr(current, _OUTAGE_MARK, False):
+            return True
+        if isinstance(current, exc.DBAPIError) and current.connection_invalidated:
+            return True
+        sqlstate = getattr(current, "sqlstate", None) or getattr(current, "pgcode", None)
+        if isinstance(sqlstate, str) and sqlstate.startswith(_OUTAGE_SQLSTATES):
+            return True
+        current = getattr(current, "orig", None) or current.__cause__ or current.__context__
+    return False
+
+
+def attach_breaker(engine, name: str) -> CircuitBreaker:
+    """Wires a breaker into ``engine``'s connect, checkout and error events."""
+    breaker = CircuitBreaker(name, DB_CIRCUIT_FAILURE_THRESHOLD, DB_CIRCUIT_RESET_SECONDS)
+    DB_CIRCUIT_STATE.labels(name).set(0)
+    if not DB_CIRCUIT_ENABLED:
+        return breaker
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "do_connect")
+    def _before_connect(dialect, conn_rec, cargs, cparams):
+        breaker.check()
+
+    @event.listens_for(sync_engine.pool, "connect")
+    def _connected(dbapi_connection, connection_record):
+        breaker.record_success()
+
+    @event.listens_for(sync_engine.pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        # Pooled connections may point at the failed server: drop them and
+        # let the reconnect attempt hit the breaker in do_connect.
+        if breaker.state == OPEN:
+            raise exc.DisconnectionError("database circuit is open")
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        original = exception_context.original_exception
+        connecting = exception_context.connection is None
+        if not connecting and isinstance(original, (TimeoutError, asyncio.CancelledError)):
+            # SQLAlchemy invalidates a connection whose statement timed out or
+            # was cancelled (is_disconnect), but the server answered fine.
+            return
+        if connecting or exception_context.is_disconnect:
+            # Connect-phase errors (a connect timeout included) and dropped
+            # connections are outages wherever they surface.
+            try:
+                setattr(original, _OUTAGE_MARK, True)
+            except AttributeError:
+                pass
+            breaker.record_failure()
+        elif is_outage_error(original):
+            breaker.record_failure()
+
+    return breaker
+
+
+async def circuit_open_handler(request: Request, error: CircuitOpenError) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Database unavailable, retry later"},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(max(1, int(error.retry_after + 0.999)))},
+    )
@@ -0,0 +1,105 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.metrics import COALESCED_CALLS, record_cache
+
+COALESCING_ENABLED = os.getenv("COALESCING_ENABLED", "true").lower() == "true"
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution.
+
+    The first caller runs ``fn``; callers arriving while it is in flight await
+    the same task and get the same result (or exception). Nothing is cached:
+    the key is released as soon as the call finishes, and the call is
+    cancelled once every caller waiting on it has been cancelled. Keys are tuples whose
+    first item names the query, used as the metrics label.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[tuple, _Call] = {}
+
+    async def do(self, key: tuple[Hashable, ...], fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not COALESCING_ENABLED:
+            return await fn()
+
+        call = self._calls.get(key)
+        leader = call is None or call.task.done()
+        if leader:
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+
+            def _release(done: asyncio.Task) -> None:
+                current = self._calls.get(key)
+                if current is not None and current.task is done:
+                    del self._calls[key]
+
+            call.task.add_done_callback(_release)
+        else:
+            COALESCED_CALLS.labels(key[0]).inc()
+        # A caller joining a call in flight is served without a query of its own.
+        record_cache(f"{self.name}_coalescing", not leader)
+
+        call.waiters += 1
+        try:
+            # Shielded so a departing caller does not cancel the call for the
+            # requests that joined it; the last one to leave cancels it.
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1:
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+read_single_flight = SingleFlight("reads")
+
+
+async def shared_read(
+    db,
+    key: tuple[Hashable, ...],
+    fn: Callable[[Any], Awaitable[Any]],
+    materialize: Optional[Callable[[Any], Any]] = None,
+) -> Any:
+    """Runs ``fn(session)`` through ``read_single_flight``.
+
+    The shared call gets a session of its own on the same engine as ``db``
+    instead of borrowing the leader's request session, so any caller can
+    leave (timeout, disconnect) without waiting for the others or closing a
+    session the call is still using. ``materialize`` turns the result into
+    plain data before the session closes, so waiters never share ORM objects
+    bound to another session. Objects that are not an ``AsyncSession`` (test
+    doubles) are passed to ``fn`` directly.
+    """
+    if not isinstance(db, AsyncSession):
+        return await fn(db)
+
+    async def run() -> Any:
+        async with AsyncSession(bind=db.bind, expire_on_commit=False) as session:
+            # Carry the statement timeout over; the request stays with the caller.
+            session.info["statement_timeout_ms"] = db.info.get("statement_timeout_ms")
+            result = await fn(session)
+            return materialize(result) if materialize is not None else result
+
+    return await read_single_flight.do(key, run)
+
+
+def read_key(db, query: str, *parts) -> tuple:
+    # Requests routed to different engines (replica vs. primary after a
+    # consistency token) must not share results.
+    return (query, *parts, id(getattr(db, "bind", None)))
@@ -1,19 +1,62 @@
+import asyncio
+import itertools
 import os
+import re
+import time
+
+from fastapi import Depends, Request
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from app.core.circuit_breaker import attach_breaker
+from app.core.metrics import instrument_engine
+from app.core.query_guard import configure_session
+
 Base = declarative_base()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable must be set")
 
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=True,
-    connect_args={"ssl": False} if "asyncpg" in DATABASE_URL else {}
-)
+# SQL echo writes every statement synchronously to stdout; keep it for debugging only.
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+
+# Comma separated list of read replicas. When empty every read goes to the primary.
+REPLICA_DATABASE_URLS = [
+    url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()
+]
+# Timestamp tokens (non-PostgreSQL) assume replicas are at most this far
+# behind: a read sent with a token younger than this, by more than the wait
+# budget below, goes straight to the primary.
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "1.0"))
+REPLICA_WAIT_TIMEOUT_SECONDS = float(os.getenv("REPLICA_WAIT_TIMEOUT_SECONDS", "0.5"))
+
+# asyncpg waits 60s by default; during a failover that is how long every
+# request would hang before the circuit breaker sees a failure.
+DB_CONNECT_TIMEOUT_SECONDS = float(os.getenv("DB_CONNECT_TIMEOUT_SECONDS", "5"))
+
+CONSISTENCY_HEADER = "X-Consistency-Token"
+PRIMARY_TOKEN = "primary"
+_LSN = re.compile(r"^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$")
+
+
+def _create_engine(url: str, name: str):
+    new_engine = create_async_engine(
+        url,
+        echo=DB_ECHO,
+        connect_args={"ssl": False, "timeout": DB_CONNECT_TIMEOUT_SECONDS} if "asyncpg" in url else {}
+    )
+    instrument_engine(new_engine)
+    breakers[new_engine] = attach_breaker(new_engine, name)
+    return new_engine
+
+
+breakers: dict = {}
+engine = _create_engine(DATABASE_URL, "primary")
+primary_breaker = breakers[engine]
 
 AsyncSessionLocal = sessionmaker(
     bind=engine,
@@ -21,6 +64,119 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False,
 )
 
-async def get_db(): 
+replica_engines = []
+replica_sessionmakers = []
+_replica_cycle = None
+
+
+def configure_replicas(urls: list[str]) -> None:
+    global replica_engines, replica_sessionmakers, _replica_cycle
+    for replica in replica_engines:
+        breakers.pop(replica, None)
+    replica_engines = [_create_engine(url, f"replica-{i}") for i, url in enumerate(urls)]
+    replica_sessionmakers = [
+        sessionmaker(bind=replica, class_=AsyncSession, expire_on_commit=False)
+        for replica in replica_engines
+    ]
+    _replica_cycle = itertools.cycle(replica_sessionmakers) if replica_sessionmakers else None
+
+
+configure_replicas(REPLICA_DATABASE_URLS)
+
+
+async def get_db():
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+async def issue_consistency_token(db: AsyncSession) -> str:
+    """Token handed back to writers so their next read can observe the write.
+
+    On PostgreSQL it is the WAL position of the primary; other backends fall
+    back to the wall clock time of the write.
+    """
+    if db.bind is not None and db.bind.dialect.name == "postgresql":
+        result = await db.execute(text("SELECT pg_current_wal_lsn()::text"))
+        return f"lsn:{result.scalar()}"
+    return f"ts:{time.time():.6f}"
+
+
+async def _replica_caught_up(session: AsyncSession, token: str) -> bool:
+    kind, _, value = token.partition(":")
+    if kind == "lsn":
+        if session.bind.dialect.name != "postgresql":
+            return False
+        result = await session.execute(
+            text("SELECT pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)"),
+            {"lsn": value},
+        )
+        return bool(result.scalar())
+    if kind == "ts":
+        return time.time() - float(value) >= REPLICA_MAX_LAG_SECONDS
+    return False
+
+
+def _can_catch_up(token: str) -> bool:
+    """Rejects tokens that cannot be satisfied within the wait budget: a
+    malformed value (the token comes from the client), or a timestamp too
+    recent to be past ``REPLICA_MAX_LAG_SECONDS`` before the wait ends."""
+    kind, _, value = token.partition(":")
+    if kind == "lsn":
+        return bool(_LSN.match(value))
+    if kind == "ts":
+        try:
+            age = time.time() - float(value)
+        except ValueError:
+            return False
+        return REPLICA_MAX_LAG_SECONDS - age <= REPLICA_WAIT_TIMEOUT_SECONDS
+    return False
+
+
+async def _wait_for_replica(session: AsyncSession, token: str) -> bool:
+    if not _can_catch_up(token):
+        return False
+    deadline = time.monotonic() + REPLICA_WAIT_TIMEOUT_SECONDS
+    while True:
+        try:
+            if await _replica_caught_up(session, token):
+                return True
+        except (ValueError, TypeError, DBAPIError):
+            return False
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(min(0.05, max(deadline - time.monotonic(), 0)))
+
+
+async def get_read_db(request: Request, primary: AsyncSession = Depends(get_db)):
+    """Session for read-only endpoints.
+
+    Routes to a replica when one is configured. A consistency token sent by
+    the client forces the read onto the primary unless the chosen replica
+    catches up with it within ``REPLICA_WAIT_TIMEOUT_SECONDS``. The primary
+    session is lazy, so it only takes a pool connection when it is used.
+    The session carries the endpoint statement timeout (see ``query_guard``).
+    """
+    token = request.headers.get(CONSISTENCY_HEADER)
+    if _replica_cycle is None or token == PRIMARY_TOKEN:
+        configure_session(primary, request)
+        yield primary
+        return
+
+    replica_factory = next(_replica_cycle)
+    replica_breaker = breakers.get(replica_factory.kw["bind"])
+    if replica_breaker is not None and replica_breaker.is_open:
+        configure_session(primary, request)
+        yield primary
+        return
+
+    async with replica_factory() as replica:
+        caught_up = not token or await _wait_for_replica(replica, token)
+        if caught_up:
+            configure_session(replica, request)
+            yield replica
+            return
+
+    # Closed above, so a lagging replica does not keep its connection
+    # checked out while the request runs on the primary.
+    configure_session(primary, request)
+    yield primary
@@ -0,0 +1,491 @@
+import asyncio
+import fcntl
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.logging_config import get_logger
+from app.core.metrics import DATALAKE_FILES_COMPACTED, DATALAKE_HIGH_WATER_MARK, DATALAKE_ROWS_EXPORTED
+from app.models.abastecimento import Refueling, RefuelingChange
+from app.services.change_feed_service import CHANGE_FEED_SETTLE_SECONDS, UPDATE
+
+logger = get_logger(__name__)
+
+DATALAKE_SINK_ENABLED = os.getenv("DATALAKE_SINK_ENABLED", "false").lower() == "true"
+DATALAKE_DIR = os.getenv("DATALAKE_DIR", "./datalake")
+DATALAKE_FLUSH_INTERVAL_SECONDS = float(os.getenv("DATALAKE_FLUSH_INTERVAL_SECONDS", "60"))
+DATALAKE_FLUSH_BATCH = int(os.getenv("DATALAKE_FLUSH_BATCH", "50000"))
+DATALAKE_ROW_GROUP_SIZE = int(os.getenv("DATALAKE_ROW_GROUP_SIZE", "131072"))
+DATALAKE_COMPRESSION = os.getenv("DATALAKE_COMPRESSION", "zstd")
+DATALAKE_COMPACTION_INTERVAL_SECONDS = float(os.getenv("DATALAKE_COMPACTION_INTERVAL_SECONDS", "3600"))
+# A partition is compacted once it holds this many files below the target size.
+DATALAKE_COMPACTION_MIN_FILES = int(os.getenv("DATALAKE_COMPACTION_MIN_FILES", "8"))
+DATALAKE_TARGET_FILE_BYTES = int(os.getenv("DATALAKE_TARGET_FILE_BYTES", str(128 * 1024 * 1024)))
+# Ids are taken before commit, so a missing id may still be in flight. The
+# high-water mark stops below it until it shows up or this long has passed
+# (then it belonged to a rolled back insert); keep it above the longest
+# ingest transaction.
+DATALAKE_GAP_TIMEOUT_SECONDS = float(os.getenv("DATALAKE_GAP_TIMEOUT_SECONDS", "300"))
+
+_STATE_FILE = "_state.json"
+_LOCK_FILE = "_lock"
+_STAGING_DIR = "_staging"
+# Later improper_data corrections of exported rows, merged on read.
+_CORRECTIONS_DIR = "_corrections"
+# Partition columns live in the directory names (Hive layout), not in the files.
+PARTITION_GLOB = "fuel_type=*/date=*/*.parquet"
+
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("station_id", pa.int32()),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("price_per_liter", pa.decimal128(10, 2)),
+    ("volume_liters", pa.decimal128(10, 2)),
+    ("driver_cpf", pa.string()),
+    ("improper_data", pa.bool_()),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+])
+CORRECTIONS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("improper_data", pa.bool_()),
+    # Change feed offset of the correction: the highest one wins.
+    ("seq", pa.int64()),
+])
+
+
+def _utc(value: datetime) -> datetime:
+    # SQLite hands timestamps back without tzinfo; they are stored in UTC.
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _part_name(first_id: int, last_id: int) -> str:
+    return f"part-{first_id:012d}-{last_id:012d}.parquet"
+
+
+def _fsync_file(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ParquetSink:
+    """Exports ``refuelings`` to ``fuel_type=<x>/date=<yyyy-mm-dd>/`` Parquet files.
+
+    Rows are read in ``id`` order past a high-water mark kept in
+    ``_state.json``. A batch is first written to a staging directory, then
+    journaled in the state file, moved into place and only then is the mark
+    advanced; ``recover`` finishes a journaled batch (or compaction) after a
+    crash, so every row lands in exactly one file. Publishing and compaction
+    hold the lake lock exclusively; readers take it shared.
+
+    Files are never rewritten for a later ``improper_data`` correction: the
+    change feed updates are copied to ``_corrections/`` (past their own
+    offset in the state) and ``query`` applies the latest one per id.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        row_group_size: int = DATALAKE_ROW_GROUP_SIZE,
+        compression: str = DATALAKE_COMPRESSION,
+    ):
+        self.directory = directory
+        self.row_group_size = row_group_size
+        self.compression = compression
+        # First missing id of each gap -> when this process first saw it.
+        self._gaps: dict[int, float] = {}
+
+    # -- state ------------------------------------------------------------
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.directory, *parts)
+
+    @contextmanager
+    def lock(self, shared: bool = False):
+        """Cross-process lock over the published files and the state."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(_LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read_state(self) -> dict:
+        try:
+            with open(self._path(_STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"high_water_mark": 0, "pending": None, "compaction": None}
+
+    def _write_state(self, state: dict) -> None:
+        path = self._path(_STATE_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        DATALAKE_HIGH_WATER_MARK.set(state["high_water_mark"])
+
+    @property
+    def high_water_mark(self) -> int:
+        return self.read_state()["high_water_mark"]
+
+    def files(self, partition: Optional[str] = None) -> list[str]:
+        """Published Parquet files, relative to the lake directory."""
+        found = []
+        root = self._path(partition) if partition else self.directory
+        for current, dirs, names in os.walk(root):
+            dirs[:] = [d for d in dirs if not d.startswith("_")]
+            for name in names:
+                if name.endswith(".parquet"):
+                    found.append(os.path.relpath(os.path.join(current, name), self.directory))
+        return sorted(found)
+
+    def _corrections(self) -> list[str]:
+        try:
+            names = os.listdir(self._path(_CORRECTIONS_DIR))
+        except FileNotFoundError:
+            return []
+        return sorted(os.path.join(_CORRECTIONS_DIR, name) for name in names if name.endswith(".parquet"))
+
+    def query(self, sql: str, params: list, threads: int = 1) -> list[tuple]:
+        """Runs ``sql`` on an embedded DuckDB, ``{source}`` being every
+        published file (with ``fuel_type`` and ``date`` as columns) with the
+        corrections applied.
+
+        Holds the lock shared so compaction cannot swap files mid-scan.
+        """
+        glob = os.path.join(self.directory, PARTITION_GLOB)
+        with self.lock(shared=True):
+            if not self.files():
+                return []
+            source, source_params = "read_parquet(?, hive_partitioning = true)", [glob]
+            if self._corrections():
+                source = (
+                    "(SELECT lake.* REPLACE (coalesce(fix.improper_data, lake.improper_data) AS improper_data) "
+                    f"FROM {source} AS lake LEFT JOIN ("
+                    "SELECT id, arg_max(improper_data, seq) AS improper_data FROM read_parquet(?) GROUP BY id"
+                    ") AS fix ON lake.id = fix.id)"
+                )
+                source_params.append(self._path(_CORRECTIONS_DIR, "*.parquet"))
+            with duckdb.connect(config={"threads": threads}) as conn:
+                return conn.execute(sql.format(source=source), [*source_params, *params]).fetchall()
+
+    # -- recovery ---------------------------------------------------------
+
+    def _recover_locked(self, clean_staging: bool = False) -> dict:
+        state = self.read_state()
+        pending = state.get("pending")
+        if pending:
+            for staged, final in pending["files"]:
+                if os.path.exists(self._path(staged)):
+                    os.makedirs(os.path.dirname(self._path(final)), exist_ok=True)
+                    os.replace(self._path(staged), self._path(final))
+            logger.warning("Data lake: finished publishing batch up to id %s", pending["high_water_mark"])
+            state["high_water_mark"] = pending["high_water_mark"]
+            state["pending"] = None
+        compaction = state.get("compaction")
+        if compaction:
+            if os.path.exists(self._path(compaction["staged"])):
+                os.replace(self._path(compaction["staged"]), self._path(compaction["output"]))
+            if os.path.exists(self._path(compaction["output"])):
+                for old in compaction["inputs"]:
+                    if os.path.exists(self._path(old)):
+                        os.remove(self._path(old))
+            state["compaction"] = None
+        if pending or compaction:
+            self._write_state(state)
+        if clean_staging:
+            # Anything left in staging was never journaled: its rows are still
+            # past the high-water mark and get exported again.
+            shutil.rmtree(self._path(_STAGING_DIR), ignore_errors=True)
+        return state
+
+    def recover(self) -> None:
+        with self.lock():
+            state = self._recover_locked(clean_staging=True)
+        DATALAKE_HIGH_WATER_MARK.set(state["high_water_mark"])
+
+    # -- export -----------------------------------------------------------
+
+    def _write_table(self, rows: list[dict], path: str) -> None:
+        table = pa.Table.from_pylist(rows, schema=SCHEMA)
+        pq.write_table(table, path, row_group_size=self.row_group_size, compression=self.compression)
+        _fsync_file(path)
+
+    def _publish(self, rows: list[dict], expected_mark: int) -> None:
+        partitions: dict[str, list[dict]] = defaultdict(list)
+        for row in rows:
+            partitions[f"fuel_type={row.pop('fuel_type')}/date={row['timestamp'].date().isoformat()}"].append(row)
+
+        batch_dir = os.path.join(_STAGING_DIR, uuid.uuid4().hex)
+        files = []
+        for partition, partition_rows in partitions.items():
+            staged = os.path.join(batch_dir, partition.replace("/", "__") + ".parquet")
+            final = os.path.join(partition, _part_name(partition_rows[0]["id"], partition_rows[-1]["id"]))
+            os.makedirs(os.path.dirname(self._path(staged)), exist_ok=True)
+            self._write_table(partition_rows, self._path(staged))
+            files.append([staged, final])
+
+        with self.lock():
+            state = self._recover_locked()
+            if state["high_water_mark"] != expected_mark:
+                # Another process exported this range meanwhile.
+                shutil.rmtree(self._path(batch_dir), ignore_errors=True)
+                return
+            state["pending"] = {"high_water_mark": rows[-1]["id"], "files": files}
+            self._write_state(state)
+            self._recover_locked()
+        shutil.rmtree(self._path(batch_dir), ignore_errors=True)
+
+    def _exportable(self, ids: list[int], mark: int) -> int:
+        """How many of ``ids`` (ascending, all past ``mark``) can be exported:
+        up to the first gap, unless that gap is older than
+        ``DATALAKE_GAP_TIMEOUT_SECONDS``."""
+        self._gaps = {missing: seen for missing, seen in self._gaps.items() if missing > mark}
+        now = time.monotonic()
+        expected = mark + 1
+        for index, refueling_id in enumerate(ids):
+            if refueling_id != expected:
+                seen = self._gaps.setdefault(expected, now)
+                if now - seen < DATALAKE_GAP_TIMEOUT_SECONDS:
+                    return index
+                logger.warning(
+                    "Data lake: ids %s-%s did not commit within %ss, exporting past them",
+                    expected, refueling_id - 1, DATALAKE_GAP_TIMEOUT_SECONDS,
+                )
+                del self._gaps[expected]
+            expected = refueling_id + 1
+        return len(ids)
+
+    async def flush(self, db: AsyncSession, batch_size: int = DATALAKE_FLUSH_BATCH) -> int:
+        """Exports rows past the high-water mark; returns how many.
+
+        Stops at the first id gap (see ``DATALAKE_GAP_TIMEOUT_SECONDS``): a
+        lower id committing after a higher one would otherwise end up below
+        the mark and never be exported.
+        """
+        await asyncio.to_thread(self.recover)
+        exported = 0
+        while True:
+            mark = await asyncio.to_thread(lambda: self.high_water_mark)
+            result = await db.execute(
+                select(Refueling).where(Refueling.id > mark).order_by(Refueling.id).limit(batch_size)
+            )
+            fetched = result.scalars().all()
+            rows = []
+            for refueling in fetched[:self._exportable([r.id for r in fetched], mark)]:
+                rows.append({
+                    "id": refueling.id,
+                    "station_id": refueling.station_id,
+                    "timestamp": _utc(refueling.timestamp),
+                    "fuel_type": refueling.fuel_type,
+                    "price_per_liter": refueling.price_per_liter,
+                    "volume_liters": refueling.volume_liters,
+                    "driver_cpf": refueling.driver_cpf,
+                    "improper_data": bool(refueling.improper_data),
+                    "created_at": _utc(refueling.created_at),
+                })
+            if not rows:
+                break
+            await asyncio.to_thread(self._publish, rows, mark)
+            exported += len(rows)
+            DATALAKE_ROWS_EXPORTED.inc(len(rows))
+            if len(rows) < len(fetched) or len(fetched) < batch_size:
+                break
+        await self.flush_corrections(db, batch_size)
+        return exported
+
+    def _publish_corrections(self, corrections: list[dict], expected_seq: int) -> None:
+        os.makedirs(self._path(_STAGING_DIR), exist_ok=True)
+        staged = os.path.join(_STAGING_DIR, f"corrections-{uuid.uuid4().hex}.parquet")
+        pq.write_table(pa.Table.from_pylist(corrections, schema=CORRECTIONS_SCHEMA), self._path(staged))
+        _fsync_file(self._path(staged))
+        final = os.path.join(_CORRECTIONS_DIR, _part_name(corrections[0]["seq"], corrections[-1]["seq"]))
+        with self.lock():
+            state = self._recover_locked()
+            if state.get("corrections_seq", 0) != expected_seq:
+                os.remove(self._path(staged))
+                return
+            os.makedirs(self._path(_CORRECTIONS_DIR), exist_ok=True)
+            # Re-exported under the same name if the state write below is lost.
+            os.replace(self._path(staged), self._path(final))
+            state["corrections_seq"] = corrections[-1]["seq"]
+            self._write_state(state)
+
+    async def flush_corrections(self, db: AsyncSession, batch_size: int = DATALAKE_FLUSH_BATCH) -> int:
+        """Copies the change feed's ``improper_data`` updates past the
+        corrections offset; returns how many.
+
+        Updates are taken once settled, as any change feed consumer does.
+        """
+        exported = 0
+        while True:
+            mark = await asyncio.to_thread(lambda: self.read_state().get("corrections_seq", 0))
+            query = select(RefuelingChange.seq, RefuelingChange.refueling_id, RefuelingChange.payload).where(
+                RefuelingChange.seq > mark, RefuelingChange.operation == UPDATE
+            )
+            if CHANGE_FEED_SETTLE_SECONDS > 0:
+                settled = datetime.now(timezone.utc) - timedelta(seconds=CHANGE_FEED_SETTLE_SECONDS)
+                query = query.where(RefuelingChange.created_at <= settled)
+            changes = (await db.execute(query.order_by(RefuelingChange.seq).limit(batch_size))).all()
+            if not changes:
+                break
+            await asyncio.to_thread(self._publish_corrections, [
+                {"id": refueling_id, "improper_data": bool(payload["improper_data"]), "seq": seq}
+                for seq, refueling_id, payload in changes
+            ], mark)
+            exported += len(changes)
+            if len(changes) < batch_size:
+                break
+        return exported
+
+    def fetch(self, ids: list[int]) -> list[dict]:
+        """Rows of the given ids as stored in the lake (corrections applied)."""
+        if not ids or not os.path.isdir(self.directory):
+            return []
+        placeholders = ", ".join("?" for _ in ids)
+        rows = self.query(
+            "SELECT id, station_id, epoch_us(timestamp), CAST(fuel_type AS VARCHAR), price_per_liter, "
+            f"volume_liters, driver_cpf, improper_data, epoch_us(created_at) FROM {{source}} WHERE id IN ({placeholders})",
+            list(ids),
+        )
+        return [
+            {
+                "id": row[0],
+                "station_id": row[1],
+                "timestamp": datetime.fromtimestamp(row[2] / 1_000_000, tz=timezone.utc),
+                "fuel_type": row[3],
+                "price_per_liter": row[4],
+                "volume_liters": row[5],
+                "driver_cpf": row[6],
+                "improper_data": row[7],
+                "created_at": datetime.fromtimestamp(row[8] / 1_000_000, tz=timezone.utc),
+            }
+            for row in rows
+        ]
+
+    # -- compaction -------------------------------------------------------
+
+    def _partitions(self) -> set[str]:
+        return {os.path.dirname(path) for path in self.files()}
+
+    def compact(
+        self,
+        min_files: int = DATALAKE_COMPACTION_MIN_FILES,
+        target_bytes: int = DATALAKE_TARGET_FILE_BYTES,
+    ) -> int:
+        """Merges small files per partition, and the correction files into
+        one; returns how many were replaced."""
+        self.recover()
+        replaced = 0
+        corrections = self._corrections()
+        if len(corrections) >= min_files:
+            self._merge_corrections(corrections)
+            replaced += len(corrections)
+        for partition in sorted(self._partitions()):
+            small = [
+                path for path in self.files(partition)
+                if os.path.getsize(self._path(path)) < target_bytes
+            ]
+            if len(small) < min_files:
+                continue
+            groups, current, size = [], [], 0
+            for path in small:
+                file_size = os.path.getsize(self._path(path))
+                if current and size + file_size > target_bytes:
+                    groups.append(current)
+                    current, size = [], 0
+                current.append(path)
+                size += file_size
+            groups.append(current)
+            for group in groups:
+                if len(group) > 1:
+                    self._merge(partition, group)
+                    replaced += len(group)
+        DATALAKE_FILES_COMPACTED.inc(replaced)
+        return replaced
+
+    def _merge(self, partition: str, inputs: list[str]) -> None:
+        table = pa.concat_tables(pq.read_table(self._path(path), schema=SCHEMA) for path in inputs)
+        table = table.sort_by("id")
+        ids = table.column("id")
+        output = os.path.join(partition, _part_name(ids[0].as_py(), ids[-1].as_py()))
+        staged = os.path.join(_STAGING_DIR, f"compact-{uuid.uuid4().hex}.parquet")
+        os.makedirs(self._path(_STAGING_DIR), exist_ok=True)
+        pq.write_table(table, self._path(staged), row_group_size=self.row_group_size, compression=self.compression)
+        _fsync_file(self._path(staged))
+        with self.lock():
+            state = self._recover_locked()
+            if not all(os.path.exists(self._path(path)) for path in inputs):
+                os.remove(self._path(staged))
+                return
+            state["compaction"] = {"output": output, "staged": staged, "inputs": inputs}
+            self._write_state(state)
+            self._recover_locked()
+        logger.info("Data lake: compacted %s files into %s", len(inputs), output)
+
+    def _merge_corrections(self, inputs: list[str]) -> None:
+        latest: dict[int, dict] = {}
+        for path in inputs:
+            for row in pq.read_table(self._path(path), schema=CORRECTIONS_SCHEMA).to_pylist():
+                if row["id"] not in latest or row["seq"] > latest[row["id"]]["seq"]:
+                    latest[row["id"]] = row
+        seqs = sorted(row["seq"] for row in latest.values())
+        output = os.path.join(_CORRECTIONS_DIR, _part_name(seqs[0], seqs[-1]))
+        if output in inputs:
+            output = os.path.join(_CORRECTIONS_DIR, f"merged-{uuid.uuid4().hex}.parquet")
+        staged = os.path.join(_STAGING_DIR, f"compact-{uuid.uuid4().hex}.parquet")
+        os.makedirs(self._path(_STAGING_DIR), exist_ok=True)
+        table = pa.Table.from_pylist(sorted(latest.values(), key=lambda row: row["id"]), schema=CORRECTIONS_SCHEMA)
+        pq.write_table(table, self._path(staged), compression=self.compression)
+        _fsync_file(self._path(staged))
+        with self.lock():
+            state = self._recover_locked()
+            if not all(os.path.exists(self._path(path)) for path in inputs):
+                os.remove(self._path(staged))
+                return
+            state["compaction"] = {"output": output, "staged": staged, "inputs": inputs}
+            self._write_state(state)
+            self._recover_locked()
+        logger.info("Data lake: compacted %s correction files into %s", len(inputs), output)
+
+
+datalake_sink = ParquetSink(DATALAKE_DIR)
+
+
+async def sink_forever(
+    sink: ParquetSink,
+    session_factory,
+    interval: float = DATALAKE_FLUSH_INTERVAL_SECONDS,
+    compaction_interval: float = DATALAKE_COMPACTION_INTERVAL_SECONDS,
+) -> None:
+    last_compaction = time.monotonic()
+    while True:
+        try:
+            async with session_factory() as session:
+                exported = await sink.flush(session)
+            if exported:
+                logger.info("Data lake: exported %s refuelings", exported)
+            if time.monotonic() - last_compaction >= compaction_interval:
+                last_compaction = time.monotonic()
+                await asyncio.to_thread(sink.compact)
+        except Exception as e:
+            logger.warning("Data lake sink failed, will retry - %s", e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import text
+
+from app.core import database
+from app.core.logging_config import get_logger
+from app.core.redis_client import get_redis
+from app.core.warmup import warmup_state
+
+logger = get_logger(__name__)
+
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", "5"))
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", "2"))
+READINESS_MAX_POOL_SATURATION = float(os.getenv("READINESS_MAX_POOL_SATURATION", "0.9"))
+READINESS_MAX_LOOP_LAG_MS = float(os.getenv("READINESS_MAX_LOOP_LAG_MS", "250"))
+LOOP_LAG_SAMPLE_SECONDS = 0.5
+
+Check = Callable[[], Awaitable[dict]]
+
+
+def pool_stats(engine) -> dict:
+    pool = engine.sync_engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {"checked_out": 0, "capacity": None, "saturation": 0.0}
+    capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+    checked_out = pool.checkedout()
+    return {
+        "checked_out": checked_out,
+        "capacity": capacity,
+        "saturation": round(checked_out / capacity, 3) if capacity else 0.0,
+    }
+
+
+async def check_database(engine) -> dict:
+    async def ping() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    started = time.perf_counter()
+    try:
+        # The timeout covers connecting too: during a failover it is the
+        # connect that hangs, and the snapshot must not go stale meanwhile.
+        await asyncio.wait_for(ping(), HEALTH_CHECK_TIMEOUT_SECONDS)
+        return {"status": "connected", "latency_ms": round((time.perf_counter() - started) * 1000, 3)}
+    except asyncio.TimeoutError:
+        logger.error("Health check: database did not answer within %ss", HEALTH_CHECK_TIMEOUT_SECONDS)
+        return {"status": "error: timeout"}
+    except Exception as e:
+        logger.error("Health check: database connection FAILED - %s", e)
+        return {"status": f"error: {str(e)}"}
+
+
+async def check_redis() -> dict:
+    client = get_redis()
+    if client is None:
+        return {"status": "disabled"}
+    try:
+        await asyncio.wait_for(client.ping(), HEALTH_CHECK_TIMEOUT_SECONDS)
+        return {"status": "connected"}
+    except Exception as e:
+        logger.error("Health check: redis connection FAILED - %s", e)
+        return {"status": f"error: {str(e)}"}
+
+
+class HealthChecker:
+    """Refreshes dependency state in the background so probes only read a
+    cached snapshot and never take a pool connection themselves."""
+
+    def __init__(self, interval: float = HEALTH_CHECK_INTERVAL_SECONDS):
+        self.interval = interval
+        self.snapshot: Optional[dict] = None
+        self.loop_lag_ms = 0.0
+        self.extra_checks: dict[str, Check] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def register_check(self, name: str, check: Check) -> None:
+        # Extra checks return a dict with a "status" key; "ok", "connected"
+        # and "disabled" count as healthy.
+        self.extra_checks[name] = check
+
+    async def refresh(self) -> dict:
+        primary = await check_database(database.engine)
+        replicas = [await check_database(replica) for replica in database.replica_engines]
+        checks = {
+            "database": primary,
+            "replicas": replicas,
+            "redis": await check_redis(),
+        }
+        for name, check in self.extra_checks.items():
+            try:
+                checks[name] = await check()
+            except Exception as e:
+                checks[name] = {"status": f"error: {str(e)}"}
+
+        pool = pool_stats(database.engine)
+        reasons = [
+            name for name, result in checks.items()
+            if isinstance(result, dict) and result["status"] not in ("ok", "connected", "disabled")
+        ]
+        if pool["saturation"] >= READINESS_MAX_POOL_SATURATION:
+            reasons.append("pool_saturated")
+        if self.loop_lag_ms >= READINESS_MAX_LOOP_LAG_MS:
+            reasons.append("event_loop_lag")
+        if warmup_state.error is not None:
+            reasons.append("warmup_failed")
+        elif not warmup_state.is_warm:
+            reasons.append("warming_up")
+
+        self.snapshot = {
+            "ready": not reasons,
+            "reasons": reasons,
+            "checked_at": time.time(),
+            "checks": checks,
+            "pool": pool,
+            "event_loop_lag_ms": round(self.loop_lag_ms, 3),
+            "warmup": warmup_state.as_dict(),
+        }
+        return self.snapshot
+
+    async def _refresh_forever(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Health check refresh failed - %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def _measure_loop_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(LOOP_LAG_SAMPLE_SECONDS)
+            self.loop_lag_ms = max(loop.time() - started - LOOP_LAG_SAMPLE_SECONDS, 0.0) * 1000
+
+    def start(self) -> None:
+        # Tasks left over from another event loop (e.g. a previous app
+        # instance in the same process) are dead; start fresh ones.
+        loop = asyncio.get_running_loop()
+        if self._tasks and self._tasks[0].get_loop() is loop:
+            return
+        self._tasks = [
+            loop.create_task(self._refresh_forever()),
+            loop.create_task(self._measure_loop_lag()),
+        ]
+
+    async def stop(self) -> None:
+        loop = asyncio.get_running_loop()
+        tasks = [task for task in self._tasks if task.get_loop() is loop]
+        self._tasks = []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+health_checker = HealthChecker()
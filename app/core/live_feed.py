@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+from typing import Optional
+
+from app.core.logging_config import get_logger
+from app.core.metrics import LIVE_FEED_DROPPED, LIVE_FEED_EVENTS, LIVE_FEED_SUBSCRIBERS
+from app.core.redis_client import get_redis
+
+logger = get_logger(__name__)
+
+# Events buffered per subscriber; past it the oldest are dropped.
+LIVE_FEED_QUEUE_SIZE = int(os.getenv("LIVE_FEED_QUEUE_SIZE", "100"))
+LIVE_FEED_MAX_SUBSCRIBERS = int(os.getenv("LIVE_FEED_MAX_SUBSCRIBERS", "1000"))
+LIVE_FEED_KEEPALIVE_SECONDS = float(os.getenv("LIVE_FEED_KEEPALIVE_SECONDS", "15"))
+# With REDIS_URL set, events go through this channel so subscribers of every
+# worker see refuelings ingested by any of them.
+LIVE_FEED_REDIS_BRIDGE = os.getenv("LIVE_FEED_REDIS_BRIDGE", "true").lower() == "true"
+LIVE_FEED_REDIS_CHANNEL = os.getenv("LIVE_FEED_REDIS_CHANNEL", "vlab:refuelings")
+
+REFUELING, LAGGED = "refueling", "lagged"
+
+
+class HubFull(Exception):
+    pass
+
+
+class FeedFilter:
+    def __init__(
+        self,
+        fuel_type: Optional[str] = None,
+        station_id: Optional[int] = None,
+        improper: Optional[bool] = None,
+    ):
+        self.fuel_type = fuel_type
+        self.station_id = station_id
+        self.improper = improper
+
+    def matches(self, event: dict) -> bool:
+        return (
+            (self.fuel_type is None or event.get("fuel_type") == self.fuel_type)
+            and (self.station_id is None or event.get("station_id") == self.station_id)
+            and (self.improper is None or bool(event.get("improper_data")) == self.improper)
+        )
+
+
+class Subscription:
+    """Bounded queue of one subscriber.
+
+    ``offer`` never blocks: a full queue loses its oldest event and the
+    subscriber gets a ``lagged`` message with the count before the next one.
+    """
+
+    def __init__(self, feed_filter: FeedFilter, max_size: int):
+        self.filter = feed_filter
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.missed = 0
+
+    def offer(self, event: dict) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.missed += 1
+            LIVE_FEED_DROPPED.inc()
+        self._queue.put_nowait(event)
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[tuple[str, dict]]:
+        """Next ``(kind, data)``, or None when ``timeout`` passes first."""
+        if self.missed:
+            missed, self.missed = self.missed, 0
+            return LAGGED, {"missed": missed}
+        try:
+            event = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return REFUELING, event
+
+
+class BroadcastHub:
+    def __init__(self, queue_size: int = LIVE_FEED_QUEUE_SIZE, max_subscribers: int = LIVE_FEED_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscriptions: set[Subscription] = set()
+        self._pending: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, feed_filter: FeedFilter) -> Subscription:
+        if len(self._subscriptions) >= self.max_subscribers:
+            raise HubFull()
+        subscription = Subscription(feed_filter, self.queue_size)
+        self._subscriptions.add(subscription)
+        LIVE_FEED_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        if subscription in self._subscriptions:
+            self._subscriptions.discard(subscription)
+            LIVE_FEED_SUBSCRIBERS.dec()
+
+    def publish(self, events: list[dict]) -> None:
+        """Fans ``events`` out to the matching subscribers of this process."""
+        for event in events:
+            LIVE_FEED_EVENTS.inc()
+            for subscription in self._subscriptions:
+                if subscription.filter.matches(event):
+                    subscription.offer(event)
+
+    @property
+    def bridged(self) -> bool:
+        return LIVE_FEED_REDIS_BRIDGE and get_redis() is not None
+
+    def broadcast(self, events: list[dict]) -> None:
+        """Ingest listener: publishes through Redis when bridged, else locally.
+
+        The Redis publish runs as a task so ingestion never waits on it; if it
+        fails the events are still delivered to this worker's subscribers.
+        """
+        if not self.bridged:
+            self.publish(events)
+            return
+        task = asyncio.get_running_loop().create_task(self._publish_remote(events))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _publish_remote(self, events: list[dict]) -> None:
+        try:
+            await get_redis().publish(LIVE_FEED_REDIS_CHANNEL, json.dumps(events))
+        except Exception as e:
+            logger.warning("Live feed Redis publish failed, delivering locally - %s", e)
+            self.publish(events)
+
+    async def bridge_forever(self, retry_seconds: float = 1.0) -> None:
+        """Relays events published by any worker to local subscribers."""
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis().pubsub()
+                await pubsub.subscribe(LIVE_FEED_REDIS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.publish(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Live feed Redis bridge failed, reconnecting - %s", e)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+            await asyncio.sleep(retry_seconds)
+
+
+live_hub = BroadcastHub()
+
+
+def encode_sse(kind: str, data: dict) -> str:
+    lines = [f"event: {kind}"]
+    if kind == REFUELING and "id" in data:
+        lines.insert(0, f"id: {data['id']}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
@@ -1,21 +1,154 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import random
 import sys
+from collections import Counter
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Optional
 
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Per logger sampling of records below WARNING, e.g.
+# "app.api.v1.abastecimento=0.1,app.routers.motoristas=0.05".
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the records below WARNING, per logger.
+
+    The rate of the closest configured ancestor applies, so ``app.api`` also
+    covers ``app.api.v1.abastecimento``.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._resolved: dict[str, float] = {}
+
+    def _rate_for(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            candidate = name
+            while candidate:
+                if candidate in self.rates:
+                    rate = self.rates[candidate]
+                    break
+                candidate = candidate.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Non-blocking QueueHandler: when the queue is full the record is dropped
+    and counted instead of stalling the caller."""
+
+    def __init__(self, log_queue: queue.Queue, on_drop: Optional[Callable[[str], None]] = None):
+        super().__init__(log_queue)
+        self.dropped: Counter[str] = Counter()
+        self.on_drop = on_drop
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting is left to the listener thread; the record is handed
+        # over as-is (same process, nothing to pickle).
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped[record.name] += 1
+            if self.on_drop is not None:
+                self.on_drop(record.name)
+
+
+def _parse_sample_rates(raw: str) -> dict[str, float]:
+    rates = {}
+    for item in raw.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_logging(on_drop: Optional[Callable[[str], None]] = None) -> DroppingQueueHandler:
+    global _listener
+
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S',
+        )
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    if _listener is not None:
+        _listener.stop()
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue, on_drop=on_drop)
+    sample_rates = _parse_sample_rates(LOG_SAMPLE_RATES)
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+    logging.basicConfig(level=LOG_LEVEL, handlers=[queue_handler], force=True)
 
-def setup_logging():
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S',
-        handlers=[
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-    
     logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
     logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
+    return queue_handler
+
+
+def shutdown_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
 
 
 def get_logger(name: str) -> logging.Logger:
     return logging.getLogger(name)
 
+
+def mask_cpf(cpf: Optional[str]) -> str:
+    """Keeps only the last two digits, enough to correlate log lines."""
+    if not cpf:
+        return ""
+    return "*" * max(len(cpf) - 2, 0) + cpf[-2:]
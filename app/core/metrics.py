@@ -0,0 +1,319 @@
+import os
+import time
+
+from fastapi import Request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+
+from app.core.request_context import current_request, route_template
+from app.core.slow_query import observe_statement
+from app.core.timing import record_statement
+
+# When PROMETHEUS_MULTIPROC_DIR is set (one directory shared by every uvicorn
+# worker) each process writes its samples to mmap'd files and /metrics
+# aggregates all of them, so counts stay correct behind `--workers N`.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests processed",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Counter(
+    "db_queries_total",
+    "SQL statements executed",
+    ["operation"],
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total",
+    "SQL statements that raised an error",
+    ["operation"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement latency",
+    ["operation"],
+    buckets=DB_LATENCY_BUCKETS,
+)
+REFUELINGS_INGESTED = Counter(
+    "refuelings_ingested_total",
+    "Refuelings persisted",
+    ["fuel_type"],
+)
+REFUELINGS_IMPROPER = Counter(
+    "refuelings_improper_total",
+    "Refuelings persisted with improper_data flagged",
+    ["fuel_type"],
+)
+REFUELINGS_IMPROPER_CLEARED = Counter(
+    "refuelings_improper_cleared_total",
+    "Flagged refuelings corrected back to proper; subtract from refuelings_improper_total",
+    ["fuel_type"],
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records dropped because the logging queue was full",
+    ["logger"],
+)
+WARMUP_SECONDS = Gauge(
+    "app_warmup_seconds",
+    "Time spent warming pool connections, statements and statistics at startup",
+    multiprocess_mode="max",
+)
+COALESCED_CALLS = Counter(
+    "db_coalesced_calls_total",
+    "Read queries served by joining an identical in-flight query",
+    ["query"],
+)
+ADMISSION_QUEUE_WAIT = Histogram(
+    "admission_queue_wait_seconds",
+    "Time requests waited for an admission slot",
+    ["route_class"],
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total",
+    "Requests shed by admission control",
+    ["route_class", "reason"],
+)
+API_KEY_REQUESTS = Counter(
+    "api_key_requests_total",
+    "Authenticated requests per API key by outcome (allowed/limited/rejected)",
+    ["key", "result"],
+)
+STATEMENT_TIMEOUTS = Counter(
+    "db_statement_timeouts_total",
+    "Read queries aborted by the endpoint statement timeout",
+    ["endpoint"],
+)
+QUERY_CANCELLATIONS = Counter(
+    "db_query_cancellations_total",
+    "Read queries cancelled because the client disconnected",
+    ["endpoint"],
+)
+RATE_LIMIT_FALLBACKS = Counter(
+    "rate_limit_fallbacks_total",
+    "Rate limit checks served by in-memory buckets because Redis failed",
+)
+DB_CIRCUIT_STATE = Gauge(
+    "db_circuit_state",
+    "Database circuit breaker state (0 closed, 1 half-open, 2 open)",
+    ["engine"],
+    multiprocess_mode="max",
+)
+DB_CIRCUIT_REJECTED = Counter(
+    "db_circuit_rejected_total",
+    "Connection attempts refused because the circuit was open",
+    ["engine"],
+)
+STALE_RESPONSES = Counter(
+    "stale_responses_total",
+    "Read responses served from the last cached page while the database was unavailable",
+    ["endpoint"],
+)
+INGEST_SPILLED = Counter(
+    "ingest_spilled_total",
+    "Refuelings spooled locally because the database was unavailable",
+)
+SPOOL_REPLAYED = Counter(
+    "spool_replayed_total",
+    "Spooled refuelings drained into the database",
+)
+SPOOL_FSYNC_BATCH = Histogram(
+    "spool_fsync_batch_records",
+    "Records made durable by one spool write + fsync",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+SPOOL_PENDING_BYTES = Gauge(
+    "spool_pending_bytes",
+    "Spooled bytes not drained into the database yet",
+    multiprocess_mode="livesum",
+)
+SPOOL_CORRUPT_RECORDS = Counter(
+    "spool_corrupt_records_total",
+    "Spool frames rejected by checksum",
+)
+SPOOL_DEAD_LETTERS = Counter(
+    "spool_dead_letter_total",
+    "Spooled refuelings moved to the dead-letter file after failing to drain",
+)
+OUTBOX_PRUNED = Counter(
+    "outbox_pruned_total",
+    "Change feed entries deleted by retention",
+)
+DATALAKE_ROWS_EXPORTED = Counter(
+    "datalake_rows_exported_total",
+    "Refuelings written to the Parquet data lake",
+)
+DATALAKE_FILES_COMPACTED = Counter(
+    "datalake_files_compacted_total",
+    "Small Parquet files merged by compaction",
+)
+DATALAKE_HIGH_WATER_MARK = Gauge(
+    "datalake_high_water_mark",
+    "Highest refueling id exported to the data lake",
+    multiprocess_mode="max",
+)
+ANALYTICS_QUERIES = Counter(
+    "analytics_queries_total",
+    "Analytics report queries by the engine that answered them",
+    ["report", "source"],
+)
+ARCHIVED_ROWS = Counter(
+    "refuelings_archived_total",
+    "Refuelings deleted from the hot table after being archived in the data lake",
+)
+LIVE_FEED_SUBSCRIBERS = Gauge(
+    "live_feed_subscribers",
+    "Open live feed subscriptions (SSE and WebSocket)",
+    multiprocess_mode="livesum",
+)
+LIVE_FEED_EVENTS = Counter(
+    "live_feed_events_total",
+    "Refuelings published to the local live feed hub",
+)
+LIVE_FEED_DROPPED = Counter(
+    "live_feed_dropped_total",
+    "Live feed events dropped from full subscriber queues",
+)
+FRAUD_FLAGS = Counter(
+    "fraud_flags_total",
+    "Refuelings flagged at ingest time, by rule",
+    ["rule"],
+)
+FRAUD_INDEX_DRIVERS = Gauge(
+    "fraud_index_drivers",
+    "Drivers with recent refuelings in the fraud window index",
+    multiprocess_mode="max",
+)
+REFUELING_CORRECTIONS = Counter(
+    "refueling_corrections_total",
+    "improper_data corrections received in bulk, by outcome",
+    ["result"],
+)
+EXPORT_JOBS = Counter(
+    "export_jobs_total",
+    "Export jobs finished, by outcome",
+    ["status"],
+)
+EXPORT_ROWS = Counter(
+    "export_rows_total",
+    "Refuelings written to export files",
+    ["format"],
+)
+SKETCH_FLUSHES = Counter(
+    "sketch_flushes_total",
+    "Pending sketch deltas merged into the sketches table",
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by outcome (hit/miss)",
+    ["cache", "result"],
+)
+
+
+def record_refueling(fuel_type: str, improper: bool) -> None:
+    REFUELINGS_INGESTED.labels(fuel_type).inc()
+    if improper:
+        REFUELINGS_IMPROPER.labels(fuel_type).inc()
+
+
+def record_improper_correction(fuel_type: str, improper: bool) -> None:
+    if improper:
+        REFUELINGS_IMPROPER.labels(fuel_type).inc()
+    else:
+        REFUELINGS_IMPROPER_CLEARED.labels(fuel_type).inc()
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_log_drop(logger_name: str) -> None:
+    LOG_RECORDS_DROPPED.labels(logger_name).inc()
+
+
+def _operation(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    operation = _operation(statement)
+    DB_QUERIES.labels(operation).inc()
+    DB_QUERY_DURATION.labels(operation).observe(elapsed)
+    record_statement(elapsed)
+    observe_statement(conn, statement, parameters, context, executemany, elapsed)
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute never fires for a failed statement; pop its start
+    # time here, or it would stay in the pooled connection's info for good.
+    conn = exception_context.connection
+    started = conn.info.get("query_start_time") if conn is not None else None
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    operation = _operation(exception_context.statement or "")
+    DB_QUERIES.labels(operation).inc()
+    DB_QUERY_ERRORS.labels(operation).inc()
+    DB_QUERY_DURATION.labels(operation).observe(elapsed)
+    record_statement(elapsed)
+
+
+def instrument_engine(engine) -> None:
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+async def metrics_middleware(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    token = current_request.set(request)
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        current_request.reset(token)
+        labels = (request.method, route_template(request), str(status))
+        HTTP_REQUESTS.labels(*labels).inc()
+        HTTP_REQUEST_DURATION.labels(*labels).observe(time.perf_counter() - started)
+
+
+def render_latest() -> tuple[bytes, str]:
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,148 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Optional
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.logging_config import get_logger
+from app.core.metrics import QUERY_CANCELLATIONS, STATEMENT_TIMEOUTS
+
+logger = get_logger(__name__)
+
+# Default budget for the queries of a read request; <= 0 disables it.
+STATEMENT_TIMEOUT_MS = float(os.getenv("STATEMENT_TIMEOUT_MS", "5000"))
+# Per-endpoint overrides, e.g. "list_refuelings=2000,historico_por_cpf=1000".
+STATEMENT_TIMEOUTS_MS = os.getenv("STATEMENT_TIMEOUTS_MS", "")
+DISCONNECT_POLL_INTERVAL_MS = float(os.getenv("DISCONNECT_POLL_INTERVAL_MS", "100"))
+# Extra time given to the server-side statement_timeout before the client
+# side gives up, so PostgreSQL normally reports the timeout itself.
+CLIENT_TIMEOUT_GRACE_SECONDS = 0.25
+
+# Client Closed Request (nginx convention); the client never sees it.
+HTTP_499_CLIENT_CLOSED_REQUEST = 499
+
+
+def _parse_timeouts(spec: str) -> dict[str, float]:
+    timeouts = {}
+    for item in spec.split(","):
+        name, sep, value = item.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            timeouts[name.strip()] = float(value)
+        except ValueError:
+            logger.warning("Ignoring invalid statement timeout %r", item)
+    return timeouts
+
+
+endpoint_timeouts = _parse_timeouts(STATEMENT_TIMEOUTS_MS)
+
+
+def endpoint_name(request: Request) -> Optional[str]:
+    return getattr(request.scope.get("endpoint"), "__name__", None)
+
+
+def timeout_for(endpoint: Optional[str]) -> Optional[float]:
+    """Statement timeout in milliseconds for ``endpoint``, or None when disabled."""
+    timeout_ms = endpoint_timeouts.get(endpoint, STATEMENT_TIMEOUT_MS)
+    return timeout_ms if timeout_ms > 0 else None
+
+
+def configure_session(session, request: Request) -> None:
+    """Attaches the request and its endpoint timeout to a read session."""
+    info = getattr(session, "info", None)
+    if info is None:
+        return
+    endpoint = endpoint_name(request)
+    info["request"] = request
+    info["endpoint"] = endpoint
+    info["statement_timeout_ms"] = timeout_for(endpoint)
+
+
+@event.listens_for(Session, "after_begin")
+def _apply_statement_timeout(session, transaction, connection):
+    timeout_ms = session.info.get("statement_timeout_ms")
+    if timeout_ms and connection.dialect.name == "postgresql":
+        # SET LOCAL only lasts for this transaction, so the pooled connection
+        # goes back with the server default. It does not accept bind params.
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    interval = DISCONNECT_POLL_INTERVAL_MS / 1000
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+
+
+async def guarded(db, query: Awaitable[Any]) -> Any:
+    """Runs ``query`` within the endpoint's statement timeout.
+
+    The query is cancelled when the timeout expires (504) or when the client
+    disconnects (499), and the session is rolled back so its connection goes
+    back to the pool right away instead of after the query would have ended.
+    Sessions not set up by ``configure_session`` run the query unguarded.
+    """
+    info = getattr(db, "info", None) or {}
+    request = info.get("request")
+    timeout_ms = info.get("statement_timeout_ms")
+    if request is None and timeout_ms is None:
+        return await query
+
+    endpoint = info.get("endpoint") or "unknown"
+    task = asyncio.ensure_future(query)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request)) if request is not None else None
+    timeout = timeout_ms / 1000 + CLIENT_TIMEOUT_GRACE_SECONDS if timeout_ms else None
+    try:
+        done, _ = await asyncio.wait(
+            [t for t in (task, watcher) if t is not None],
+            timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+    if task in done:
+        try:
+            return task.result()
+        except Exception as e:
+            if not _is_statement_timeout(e):
+                raise
+            timed_out = True
+    else:
+        timed_out = watcher not in done
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    await _release_connection(db)
+    if timed_out:
+        STATEMENT_TIMEOUTS.labels(endpoint).inc()
+        logger.warning("Statement timeout (%sms) exceeded on %s", timeout_ms, endpoint)
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Query exceeded the statement timeout",
+        )
+    QUERY_CANCELLATIONS.labels(endpoint).inc()
+    logger.info("Client disconnected, cancelled query on %s", endpoint)
+    raise HTTPException(status_code=HTTP_499_CLIENT_CLOSED_REQUEST, detail="Client closed request")
+
+
+def _is_statement_timeout(error: Exception) -> bool:
+    # asyncpg raises QueryCanceledError (SQLSTATE 57014), wrapped by SQLAlchemy.
+    original = getattr(error, "orig", error)
+    return getattr(original, "sqlstate", None) == "57014" or "statement timeout" in str(error)
+
+
+async def _release_connection(db) -> None:
+    try:
+        await db.rollback()
+    except Exception as e:
+        # The connection may be mid-protocol after a cancel; drop it instead
+        # of handing a broken one back to the pool.
+        logger.warning("Rollback after cancelled query failed, invalidating - %s", e)
+        await db.invalidate()
@@ -0,0 +1,26 @@
+import os
+from typing import Optional
+
+import redis.asyncio as redis
+
+# Redis is optional: every feature backed by it falls back to in-process state
+# when REDIS_URL is not set.
+REDIS_URL = os.getenv("REDIS_URL")
+
+_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> Optional[redis.Redis]:
+    global _client
+    if not REDIS_URL:
+        return None
+    if _client is None:
+        _client = redis.from_url(REDIS_URL)
+    return _client
+
+
+async def close_redis() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
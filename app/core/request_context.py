@@ -0,0 +1,24 @@
+from contextvars import ContextVar
+
+from fastapi import Request
+
+current_request: ContextVar[Request | None] = ContextVar("current_request", default=None)
+
+
+def route_template(request: Request) -> str:
+    # Use the path template, never the raw path, so CPFs and ids in the URL do
+    # not leak into labels and logs.
+    # Newer FastAPI keeps included routers nested and exposes the prefixed
+    # template separately; older versions copy the route with its prefix.
+    context = request.scope.get("fastapi", {}).get("effective_route_context")
+    if context is not None:
+        return context.path
+    route = request.scope.get("route")
+    return getattr(route, "path_format", getattr(route, "path", "unmatched"))
+
+
+def current_endpoint() -> str | None:
+    request = current_request.get()
+    if request is None:
+        return None
+    return f"{request.method} {route_template(request)}"
@@ -1,16 +1,174 @@
+import hashlib
+import json
+import math
 import os
+import time
+from typing import Optional
+
 from fastapi import Security, HTTPException, status
 from fastapi.security import APIKeyHeader
+from redis.exceptions import RedisError
+
+from app.core.logging_config import get_logger
+from app.core.metrics import API_KEY_REQUESTS, RATE_LIMIT_FALLBACKS
+from app.core.redis_client import get_redis
+
+logger = get_logger(__name__)
 
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
+DEFAULT_RATE_PER_SECOND = float(os.getenv("API_KEY_DEFAULT_RATE", "50"))
+DEFAULT_BURST = float(os.getenv("API_KEY_DEFAULT_BURST", "100"))
+# "memory" keeps one bucket per worker; "redis" shares buckets across workers.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+
+
+class ApiKey:
+    def __init__(self, name: str, key_hash: str, rate: float, burst: float):
+        self.name = name
+        self.key_hash = key_hash
+        self.rate = rate
+        self.burst = burst
+
+
+def hash_key(key: str) -> str:
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ApiKeyRegistry:
+    """API keys indexed by their SHA-256 digest, so lookup is a single dict
+    access and plain keys are never kept in memory. The digest of the
+    presented key is what gets compared, so lookup timing says nothing
+    about the stored keys."""
+
+    def __init__(self, keys: list[ApiKey]):
+        self._by_hash = {api_key.key_hash: api_key for api_key in keys}
+
+    def __len__(self) -> int:
+        return len(self._by_hash)
+
+    def lookup(self, key: Optional[str]) -> Optional[ApiKey]:
+        if not key:
+            return None
+        return self._by_hash.get(hash_key(key))
+
+
+def load_registry() -> ApiKeyRegistry:
+    """Builds the registry from the environment.
+
+    ``API_KEYS`` is a JSON list of ``{"name", "key_sha256", "rate", "burst"}``
+    objects; ``API_KEY``, when set, keeps working as a single key named
+    ``default``. There is no built-in key: with neither set every request
+    is rejected.
+    """
+    keys = [
+        ApiKey(
+            entry["name"],
+            entry["key_sha256"].lower(),
+            float(entry.get("rate", DEFAULT_RATE_PER_SECOND)),
+            float(entry.get("burst", DEFAULT_BURST)),
+        )
+        for entry in json.loads(os.getenv("API_KEYS", "[]"))
+    ]
+    for api_key in keys:
+        if api_key.rate <= 0 or api_key.burst < 1:
+            raise ValueError(f"API key {api_key.name!r} needs rate > 0 and burst >= 1")
+    legacy_key = os.getenv("API_KEY")
+    if legacy_key:
+        keys.append(ApiKey("default", hash_key(legacy_key), DEFAULT_RATE_PER_SECOND, DEFAULT_BURST))
+    if not keys:
+        logger.warning("No API keys configured (API_KEY / API_KEYS); every request will be rejected")
+    return ApiKeyRegistry(keys)
+
+
+class TokenBucketLimiter:
+    def __init__(self):
+        self._buckets: dict[str, list[float]] = {}
+
+    async def acquire(self, api_key: ApiKey) -> float:
+        """Takes one token; returns 0 when allowed, else seconds until one is available."""
+        now = time.monotonic()
+        bucket = self._buckets.get(api_key.name)
+        if bucket is None:
+            bucket = self._buckets[api_key.name] = [api_key.burst, now]
+        tokens = min(api_key.burst, bucket[0] + (now - bucket[1]) * api_key.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / api_key.rate if api_key.rate > 0 else math.inf
+
+
+_REDIS_TOKEN_BUCKET = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisTokenBucketLimiter:
+    """Same bucket, kept in Redis and updated atomically by a Lua script."""
+
+    def __init__(self, client):
+        self._script = client.register_script(_REDIS_TOKEN_BUCKET)
+        # Used while Redis is unreachable so an outage degrades to
+        # per-worker limits instead of failing every authenticated request.
+        self._fallback = TokenBucketLimiter()
+
+    async def acquire(self, api_key: ApiKey) -> float:
+        try:
+            wait = await self._script(
+                keys=[f"ratelimit:{api_key.name}"],
+                args=[api_key.rate, api_key.burst, time.time()],
+            )
+        except RedisError as e:
+            RATE_LIMIT_FALLBACKS.inc()
+            logger.warning("Redis rate limiter unavailable, using in-memory buckets - %s", e)
+            return await self._fallback.acquire(api_key)
+        return float(wait)
+
+
+def _build_limiter():
+    client = get_redis()
+    if RATE_LIMIT_BACKEND == "redis" and client is not None:
+        return RedisTokenBucketLimiter(client)
+    return TokenBucketLimiter()
+
+
+api_key_registry = load_registry()
+rate_limiter = _build_limiter()
+
+
+def reload_api_keys() -> None:
+    global api_key_registry
+    api_key_registry = load_registry()
+
+
 async def get_api_key(api_key: str = Security(api_key_header)):
-    expected_key = os.getenv("API_KEY", "vlab-secret-key")
-    if not api_key or api_key != expected_key:
+    resolved = api_key_registry.lookup(api_key)
+    if resolved is None:
+        API_KEY_REQUESTS.labels("unknown", "rejected").inc()
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid or missing API Key"
         )
-    return api_key
 
+    wait = await rate_limiter.acquire(resolved)
+    if wait > 0:
+        API_KEY_REQUESTS.labels(resolved.name, "limited").inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded for API Key",
+            headers={"Retry-After": str(max(1, math.ceil(min(wait, 3600))))},
+        )
+    API_KEY_REQUESTS.labels(resolved.name, "allowed").inc()
+    return api_key
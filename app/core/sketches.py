@@ -0,0 +1,529 @@
+import asyncio
+import hashlib
+import heapq
+import json
+import math
+import os
+import random
+import struct
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.logging_config import get_logger
+from app.core.metrics import SKETCH_FLUSHES
+from app.models.abastecimento import Sketch
+
+logger = get_logger(__name__)
+
+# Deltas collected on ingest are merged into the ``sketches`` table this often.
+SKETCH_FLUSH_INTERVAL_SECONDS = float(os.getenv("SKETCH_FLUSH_INTERVAL_SECONDS", "10"))
+# Larger k: more accurate quantiles, bigger sketches (about 3k values each).
+SKETCH_KLL_K = int(os.getenv("SKETCH_KLL_K", "200"))
+# 2^p registers: relative standard error 1.04 / sqrt(2^p) (1.6% for p=12).
+SKETCH_HLL_PRECISION = int(os.getenv("SKETCH_HLL_PRECISION", "12"))
+# Counters per top-K sketch; any key above total / capacity is guaranteed kept.
+SKETCH_TOPK_CAPACITY = int(os.getenv("SKETCH_TOPK_CAPACITY", "1000"))
+# Width of the fixed histogram buckets (1 centavo); changing it needs a rebuild.
+SKETCH_HISTOGRAM_BUCKET = Decimal(os.getenv("SKETCH_HISTOGRAM_BUCKET", "0.01"))
+
+_KEYS_PER_QUERY = 500
+
+
+class KllSketch:
+    """KLL quantile sketch (Karnin, Lang and Liberty).
+
+    Values enter level 0; a full level is sorted and every other value moves
+    up a level with twice the weight. Capacities shrink by 2/3 per level
+    below the top, so the sketch holds at most about 3k values whatever the
+    stream size, and two sketches merge by concatenating their levels.
+    """
+
+    def __init__(self, k: int = SKETCH_KLL_K):
+        self.k = k
+        self.n = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.levels: list[list[float]] = [[]]
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, math.ceil(self.k * (2 / 3) ** depth))
+
+    def update(self, value: float) -> None:
+        self.n += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.levels[0].append(value)
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other: "KllSketch") -> None:
+        if not other.n:
+            return
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, values in enumerate(other.levels):
+            self.levels[level].extend(values)
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+
+    def _compress(self) -> None:
+        while True:
+            level = next(
+                (h for h, values in enumerate(self.levels) if len(values) >= self._capacity(h)), None
+            )
+            if level is None:
+                return
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            values = sorted(self.levels[level])
+            # An odd value out stays behind so the total weight is exact.
+            kept = [values.pop()] if len(values) % 2 else []
+            self.levels[level + 1].extend(values[random.getrandbits(1)::2])
+            self.levels[level] = kept
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.n:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        weighted = sorted(
+            (value, 1 << level) for level, values in enumerate(self.levels) for value in values
+        )
+        target, seen = q * self.n, 0
+        for value, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return value
+        return self.max
+
+    def to_bytes(self) -> bytes:
+        return json.dumps(
+            {"k": self.k, "n": self.n, "min": self.min, "max": self.max, "levels": self.levels},
+            separators=(",", ":"),
+        ).encode()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "KllSketch":
+        data = json.loads(payload)
+        sketch = cls(data["k"])
+        sketch.n, sketch.min, sketch.max, sketch.levels = data["n"], data["min"], data["max"], data["levels"]
+        return sketch
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with ``2^p`` one-byte registers.
+
+    Merging keeps the larger register, so the union of any number of
+    sketches estimates the distinct count of the union of their inputs
+    with the same error as a single sketch.
+    """
+
+    _SPARSE, _DENSE = b"S", b"D"
+
+    def __init__(self, p: int = SKETCH_HLL_PRECISION):
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def add(self, value: str) -> None:
+        h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = 64 - self.p - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.p != self.p:
+            raise ValueError(f"Cannot merge HyperLogLog of precision {other.p} into {self.p}")
+        size = len(self.registers)
+        a = int.from_bytes(self.registers, "little")
+        b = int.from_bytes(other.registers, "little")
+        # Byte-wise max on whole integers: registers stay below 128, so
+        # (b | 0x80) - a never borrows across bytes and keeps the high bit
+        # exactly where b >= a.
+        high = int.from_bytes(b"\x80" * size, "little")
+        b_wins = (((b | high) - a) & high) >> 7
+        mask = (b_wins << 8) - b_wins
+        self.registers = bytearray(((b & mask) | (a & ~mask)).to_bytes(size, "little"))
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        # bytes.count runs in C; stop once every register is accounted for.
+        counts, seen = [], 0
+        while seen < m:
+            counts.append(self.registers.count(len(counts)))
+            seen += counts[-1]
+        harmonic = sum(count * 2.0 ** -rank for rank, count in enumerate(counts))
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / harmonic
+        if estimate <= 2.5 * m and counts[0]:
+            # Small cardinalities: linear counting over the empty registers.
+            estimate = m * math.log(m / counts[0])
+        return estimate
+
+    @property
+    def standard_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def to_bytes(self) -> bytes:
+        # Sparse (index, rank) pairs while they are smaller than the registers.
+        used = len(self.registers) - self.registers.count(0)
+        if used * 3 < len(self.registers):
+            pairs = b"".join(
+                struct.pack(">HB", index, rank) for index, rank in enumerate(self.registers) if rank
+            )
+            return self._SPARSE + bytes([self.p]) + pairs
+        return self._DENSE + bytes([self.p]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "HyperLogLog":
+        sketch = cls(payload[1])
+        if payload[:1] == cls._DENSE:
+            sketch.registers = bytearray(payload[2:])
+        else:
+            for index, rank in struct.iter_unpack(">HB", payload[2:]):
+                sketch.registers[index] = rank
+        return sketch
+
+
+class SpaceSaving:
+    """Weighted Space-Saving heavy hitters (Metwally, Agrawal and El Abbadi).
+
+    At most ``capacity`` counters: a new key takes over the smallest one and
+    inherits its count as ``error``, so each count overestimates the key's
+    total by at most its error. A heap with lazy deletion finds the smallest
+    counter in O(log capacity).
+    """
+
+    def __init__(self, capacity: int = SKETCH_TOPK_CAPACITY):
+        self.capacity = capacity
+        self.total = 0.0
+        # key -> [count, error]
+        self.counters: dict[str, list[float]] = {}
+        self._heap: list[tuple[float, str]] = []
+
+    def add(self, key: str, weight: float) -> None:
+        self.total += weight
+        counter = self.counters.get(key)
+        if counter is None:
+            if len(self.counters) < self.capacity:
+                counter = self.counters[key] = [0.0, 0.0]
+            else:
+                floor, _ = self._pop_min()
+                counter = self.counters[key] = [floor, floor]
+        counter[0] += weight
+        heapq.heappush(self._heap, (counter[0], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def _pop_min(self) -> tuple[float, str]:
+        while True:
+            count, key = heapq.heappop(self._heap)
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == count:
+                del self.counters[key]
+                return count, key
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [(count, key) for key, (count, _) in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    def _floor(self) -> float:
+        # Upper bound on the total of any key without a counter.
+        if len(self.counters) < self.capacity:
+            return 0.0
+        return min(count for count, _ in self.counters.values())
+
+    def merge(self, other: "SpaceSaving") -> None:
+        # Agarwal et al.: a key missing from one side may have had up to
+        # that side's smallest count there.
+        own_floor, other_floor = self._floor(), other._floor()
+        merged = {}
+        for key in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(key, (own_floor, own_floor))
+            other_count, other_error = other.counters.get(key, (other_floor, other_floor))
+            merged[key] = [count + other_count, error + other_error]
+        self.capacity = max(self.capacity, other.capacity)
+        if len(merged) > self.capacity:
+            merged = dict(heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0]))
+        self.counters = merged
+        self.total += other.total
+        self._rebuild_heap()
+
+    def top(self, k: int) -> list[tuple[str, float, float]]:
+        """``(key, count, error)`` of the ``k`` largest counters."""
+        ranked = heapq.nlargest(k, self.counters.items(), key=lambda item: (item[1][0], item[0]))
+        return [(key, count, error) for key, (count, error) in ranked]
+
+    def to_bytes(self) -> bytes:
+        return json.dumps(
+            {"capacity": self.capacity, "total": self.total, "counters": self.counters},
+            separators=(",", ":"),
+        ).encode()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "SpaceSaving":
+        data = json.loads(payload)
+        sketch = cls(data["capacity"])
+        sketch.total, sketch.counters = data["total"], data["counters"]
+        sketch._rebuild_heap()
+        return sketch
+
+
+class BucketHistogram:
+    """Counts per fixed-width bucket: bucket ``i`` holds ``[i * width, (i + 1) * width)``.
+
+    Exact for the chosen width; merging adds the counters, so any range of
+    per-day histograms combines into the histogram of the whole range.
+    """
+
+    def __init__(self, width: Decimal = SKETCH_HISTOGRAM_BUCKET):
+        self.width = width
+        self.counts: dict[int, int] = {}
+
+    @property
+    def n(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, value: Decimal, count: int = 1) -> None:
+        index = int(value // self.width)
+        self.counts[index] = self.counts.get(index, 0) + count
+
+    def merge(self, other: "BucketHistogram") -> None:
+        if other.width == self.width:
+            for index, count in other.counts.items():
+                self.counts[index] = self.counts.get(index, 0) + count
+            return
+        # Re-bucketed by lower edge: exact when self.width is a multiple of other.width.
+        for index, count in other.counts.items():
+            self.add(index * other.width, count)
+
+    def coarsen(self, width: Decimal) -> "BucketHistogram":
+        coarse = BucketHistogram(width)
+        coarse.merge(self)
+        return coarse
+
+    def buckets(self) -> list[tuple[Decimal, Decimal, int]]:
+        """``(lower, upper, count)`` of the non-empty buckets, in order."""
+        return [
+            (index * self.width, (index + 1) * self.width, count)
+            for index, count in sorted(self.counts.items())
+        ]
+
+    def to_bytes(self) -> bytes:
+        return json.dumps(
+            {"width": str(self.width), "counts": {str(index): count for index, count in self.counts.items()}},
+            separators=(",", ":"),
+        ).encode()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> "BucketHistogram":
+        data = json.loads(payload)
+        sketch = cls(Decimal(data["width"]))
+        sketch.counts = {int(index): count for index, count in data["counts"].items()}
+        return sketch
+
+
+class SketchStore:
+    """Mergeable sketches kept per ``(kind, key)``.
+
+    Ingest only touches this process's pending deltas; ``flush`` merges them
+    into the ``sketches`` table, so every worker contributes to the same
+    rows. Reads merge the stored sketches with the local deltas.
+
+    Deltas recorded with a refueling id are kept per row until flushed, so
+    a row rebuilt by ``replace`` (in any process) can tell which of them it
+    already counts: ids up to its ``rebuilt_through`` mark, except the ones
+    listed in ``rebuilt_missing``, are dropped instead of merged.
+    """
+
+    def __init__(self):
+        self._types: dict[str, type] = {}
+        self._pending: dict[tuple[str, str, Optional[int]], tuple[Optional[date], object]] = {}
+
+    def register(self, kind: str, sketch_type: type) -> None:
+        self._types[kind] = sketch_type
+
+    def pending(self, kind: str, key: str, day: Optional[date] = None, row_id: Optional[int] = None):
+        """The local delta for ``(kind, key)`` (for refueling ``row_id`` when
+        given), for the caller to update."""
+        entry = self._pending.get((kind, key, row_id))
+        if entry is None:
+            entry = self._pending[(kind, key, row_id)] = (day, self._types[kind]())
+        return entry[1]
+
+    @staticmethod
+    def _uncounted(deltas: list[tuple[Optional[int], object]], through: Optional[int], missing) -> list[object]:
+        if through is None:
+            return [delta for _, delta in deltas]
+        missing = set(missing or ())
+        return [delta for row_id, delta in deltas if row_id is None or row_id > through or row_id in missing]
+
+    def _merged(self, kind: str, deltas: list[object]):
+        merged = self._types[kind].from_bytes(deltas[0].to_bytes())
+        for delta in deltas[1:]:
+            merged.merge(delta)
+        return merged
+
+    async def flush(self, db: AsyncSession) -> int:
+        """Merges the pending deltas into the table; returns how many rows."""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        now = datetime.now(timezone.utc)
+        by_kind: dict[str, dict[str, tuple[Optional[date], list]]] = {}
+        for (kind, key, row_id), (day, delta) in pending.items():
+            by_kind.setdefault(kind, {}).setdefault(key, (day, []))[1].append((row_id, delta))
+        try:
+            for kind, by_key in by_kind.items():
+                sketch_type = self._types[kind]
+                keys = list(by_key)
+                for i in range(0, len(keys), _KEYS_PER_QUERY):
+                    chunk = keys[i:i + _KEYS_PER_QUERY]
+                    rows = {
+                        row.key: row
+                        for row in (await db.execute(
+                            select(Sketch).where(Sketch.kind == kind, Sketch.key.in_(chunk)).with_for_update()
+                        )).scalars()
+                    }
+                    for key in chunk:
+                        day, deltas = by_key[key]
+                        row = rows.get(key)
+                        if row is None:
+                            merged = self._merged(kind, [delta for _, delta in deltas])
+                            db.add(Sketch(kind=kind, key=key, day=day, payload=merged.to_bytes(), updated_at=now))
+                            continue
+                        uncounted = self._uncounted(deltas, row.rebuilt_through, row.rebuilt_missing)
+                        if not uncounted:
+                            continue
+                        merged = sketch_type.from_bytes(row.payload)
+                        for delta in uncounted:
+                            merged.merge(delta)
+                        row.payload = merged.to_bytes()
+                        row.updated_at = now
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            # Nothing was written: the deltas go back for the next flush.
+            for (kind, key, row_id), (day, delta) in pending.items():
+                self.pending(kind, key, day, row_id).merge(delta)
+            raise
+        SKETCH_FLUSHES.inc()
+        return sum(len(by_key) for by_key in by_kind.values())
+
+    async def fetch(
+        self,
+        db: AsyncSession,
+        kind: str,
+        key_prefix: str = "",
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+    ) -> dict[str, object]:
+        """Stored sketches of ``kind`` merged with the local deltas, by key.
+
+        ``start``/``end`` (inclusive) only apply to per-day sketches.
+        """
+        sketch_type = self._types[kind]
+        query = select(Sketch.key, Sketch.payload, Sketch.rebuilt_through, Sketch.rebuilt_missing).where(
+            Sketch.kind == kind
+        )
+        if key_prefix:
+            query = query.where(Sketch.key.startswith(key_prefix, autoescape=True))
+        if start is not None:
+            query = query.where(Sketch.day >= start)
+        if end is not None:
+            query = query.where(Sketch.day <= end)
+        sketches, marks = {}, {}
+        for key, payload, through, missing in (await db.execute(query)).all():
+            sketches[key] = sketch_type.from_bytes(payload)
+            marks[key] = (through, missing)
+
+        local: dict[str, list] = {}
+        for (pending_kind, key, row_id), (day, delta) in list(self._pending.items()):
+            if pending_kind != kind or not key.startswith(key_prefix):
+                continue
+            if (start is not None or end is not None) and (
+                day is None or (start is not None and day < start) or (end is not None and day > end)
+            ):
+                continue
+            local.setdefault(key, []).append((row_id, delta))
+        for key, deltas in local.items():
+            uncounted = self._uncounted(deltas, *marks.get(key, (None, None)))
+            if not uncounted:
+                continue
+            if key in sketches:
+                for delta in uncounted:
+                    sketches[key].merge(delta)
+            else:
+                sketches[key] = self._merged(kind, uncounted)
+        return sketches
+
+    async def replace(
+        self,
+        db: AsyncSession,
+        kind: str,
+        build: Callable[[], Awaitable[tuple[dict[str, tuple[Optional[date], object]], int, list[int]]]],
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+    ) -> int:
+        """Swaps the stored sketches of ``kind`` (in ``[start, end]`` when
+        given) for the ones ``build`` returns, in one transaction; returns
+        how many rows.
+
+        ``build`` runs once the stored rows are locked, so no flush lands
+        between its read and the swap, and returns ``(sketches, through,
+        missing)``: the refueling ids it counted are those up to ``through``
+        except ``missing``. The mark is kept on the rows and every process
+        drops its deltas for those ids on the next flush instead of counting
+        them twice.
+        """
+        query = select(Sketch).where(Sketch.kind == kind)
+        if start is not None:
+            query = query.where(Sketch.day >= start)
+        if end is not None:
+            query = query.where(Sketch.day <= end)
+        now = datetime.now(timezone.utc)
+        try:
+            stored = {row.key: row for row in (await db.execute(query.with_for_update())).scalars()}
+            sketches, through, missing = await build()
+            for key, row in stored.items():
+                if key not in sketches:
+                    await db.delete(row)
+            for key, (day, sketch) in sketches.items():
+                row = stored.get(key)
+                if row is None:
+                    row = Sketch(kind=kind, key=key, day=day)
+                    db.add(row)
+                row.payload = sketch.to_bytes()
+                row.updated_at = now
+                row.rebuilt_through = through
+                row.rebuilt_missing = missing
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+        return len(sketches)
+
+    def clear(self) -> None:
+        self._pending.clear()
+
+
+sketch_store = SketchStore()
+
+
+async def flush_forever(session_factory, interval: float = SKETCH_FLUSH_INTERVAL_SECONDS) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as session:
+                await sketch_store.flush(session)
+        except Exception as e:
+            logger.warning("Sketch flush failed, will retry - %s", e)
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import random
+import re
+from collections import deque
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.logging_config import get_logger
+from app.core.request_context import current_endpoint
+
+logger = get_logger(__name__)
+
+# Statements slower than this are captured; a value <= 0 disables the log.
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "500"))
+# Fraction of slow statements that also get their plan captured.
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", "0"))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "100"))
+SLOW_QUERY_LOG_FILE = os.getenv("SLOW_QUERY_LOG_FILE")
+
+_MAX_PARAMETERS_LENGTH = 500
+# Bind parameters whose name contains one of these markers (``driver_cpf``,
+# ``driver_cpf_1``, ``cpf``) are masked before an entry is buffered, logged
+# or served by /debug/slow-queries.
+PII_PARAMETER_MARKERS = ("cpf",)
+# Raw SQL may use any parameter name; CPF-shaped values are masked as well.
+_CPF_VALUE = re.compile(r"^\d{3}\.?\d{3}\.?\d{3}-?\d{2}$")
+REDACTED = "***"
+
+slow_queries: deque[dict] = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+_explain_tasks: set[asyncio.Task] = set()
+
+slow_query_logger = get_logger("app.slow_queries")
+if SLOW_QUERY_LOG_FILE:
+    _file_handler = RotatingFileHandler(SLOW_QUERY_LOG_FILE, maxBytes=10 * 1024 * 1024, backupCount=5)
+    slow_query_logger.addHandler(_file_handler)
+    slow_query_logger.propagate = False
+
+
+def _explain_statement(dialect: str, statement: str) -> str | None:
+    if dialect == "postgresql":
+        # ANALYZE executes the statement again, so only do it for reads.
+        if statement.lstrip().upper().startswith("SELECT"):
+            return f"EXPLAIN (ANALYZE, BUFFERS) {statement}"
+        return f"EXPLAIN {statement}"
+    if dialect == "sqlite":
+        return f"EXPLAIN QUERY PLAN {statement}"
+    return None
+
+
+async def _capture_plan(engine: AsyncEngine, explain: str, parameters, entry: dict) -> None:
+    try:
+        async with engine.connect() as conn:
+            result = await conn.exec_driver_sql(
+                explain, parameters, execution_options={"slow_query_log": False}
+            )
+            entry["plan"] = "\n".join(" | ".join(str(col) for col in row) for row in result)
+            await conn.rollback()
+    except Exception as e:
+        entry["plan_error"] = str(e)
+        logger.warning("Could not capture plan for slow query: %s", e)
+    slow_query_logger.info(json.dumps(entry, default=str))
+
+
+def _redact_value(name, value):
+    if name is not None and any(marker in str(name).lower() for marker in PII_PARAMETER_MARKERS):
+        return REDACTED
+    if isinstance(value, str) and _CPF_VALUE.match(value):
+        return REDACTED
+    return value
+
+
+def _redact_parameters(parameters, context, executemany: bool):
+    # Positional dialects (asyncpg, sqlite) send a tuple; the compiled
+    # statement knows which bind name sits at each position.
+    names = getattr(getattr(context, "compiled", None), "positiontup", None) or ()
+
+    def redact(params):
+        if isinstance(params, dict):
+            return {key: _redact_value(key, value) for key, value in params.items()}
+        if isinstance(params, (list, tuple)):
+            return tuple(
+                _redact_value(names[i] if i < len(names) else None, value)
+                for i, value in enumerate(params)
+            )
+        return params
+
+    if executemany and isinstance(parameters, (list, tuple)):
+        return [redact(params) for params in parameters]
+    return redact(parameters)
+
+
+def observe_statement(conn, statement, parameters, context, executemany, elapsed: float) -> None:
+    duration_ms = elapsed * 1000
+    if SLOW_QUERY_THRESHOLD_MS <= 0 or duration_ms < SLOW_QUERY_THRESHOLD_MS:
+        return
+    if context is not None and context.execution_options.get("slow_query_log") is False:
+        return
+
+    entry = {
+        "captured_at": datetime.now(timezone.utc).isoformat(),
+        "duration_ms": round(duration_ms, 3),
+        "statement": statement,
+        "parameters": repr(_redact_parameters(parameters, context, executemany))[:_MAX_PARAMETERS_LENGTH],
+        "endpoint": current_endpoint(),
+    }
+    slow_queries.append(entry)
+
+    explain = None
+    if not executemany and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE_RATE:
+        explain = _explain_statement(conn.dialect.name, statement)
+    if explain is None:
+        slow_query_logger.info(json.dumps(entry, default=str))
+        return
+
+    # The plan is captured on a separate connection after the fact so the
+    # request's own transaction is never touched.
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        slow_query_logger.info(json.dumps(entry, default=str))
+        return
+    task = loop.create_task(_capture_plan(AsyncEngine(conn.engine), explain, parameters, entry))
+    _explain_tasks.add(task)
+    task.add_done_callback(_explain_tasks.discard)
+
+
+def recent_slow_queries(limit: int | None = None) -> list[dict]:
+    entries = list(slow_queries)
+    entries.reverse()
+    return entries[:limit] if limit else entries
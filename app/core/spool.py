@@ -0,0 +1,400 @@
+import asyncio
+import fcntl
+import itertools
+import json
+import os
+import re
+import struct
+import threading
+import uuid
+import zlib
+from typing import Awaitable, Callable, Optional
+
+from app.core.circuit_breaker import is_outage_error
+from app.core.logging_config import get_logger
+from app.core.metrics import (
+    INGEST_SPILLED,
+    SPOOL_CORRUPT_RECORDS,
+    SPOOL_DEAD_LETTERS,
+    SPOOL_FSYNC_BATCH,
+    SPOOL_PENDING_BYTES,
+    SPOOL_REPLAYED,
+)
+
+logger = get_logger(__name__)
+
+# "direct" inserts on the request and only spools while the database is down;
+# "spool" acknowledges every refueling once it is durable on local disk.
+INGEST_MODE = os.getenv("INGEST_MODE", "direct").lower()
+SPOOL_DIR = os.getenv("SPOOL_DIR", "./spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+# Appends arriving within this window share one write + fsync.
+SPOOL_FSYNC_INTERVAL_MS = float(os.getenv("SPOOL_FSYNC_INTERVAL_MS", "5"))
+SPOOL_DRAIN_BATCH = int(os.getenv("SPOOL_DRAIN_BATCH", "500"))
+SPOOL_DRAIN_INTERVAL_SECONDS = float(os.getenv("SPOOL_DRAIN_INTERVAL_SECONDS", "1"))
+# Failed drains of the same batch (database up) before its records are
+# retried one by one and the ones still failing go to the dead-letter file.
+SPOOL_MAX_ATTEMPTS = int(os.getenv("SPOOL_MAX_ATTEMPTS", "5"))
+
+_HEADER = struct.Struct(">II")  # body length, crc32 of body
+_SEGMENT_NAME = re.compile(r"^(\d{10})\.wal$")
+_CHECKPOINT_FILE = "checkpoint.json"
+_DEAD_LETTER_FILE = "dead-letter.wal"
+
+Record = tuple[str, dict]
+
+
+def _encode(record_id: str, payload: dict) -> bytes:
+    body = json.dumps({"id": record_id, "payload": payload}, default=str).encode()
+    return _HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def _fsync_directory(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Spool:
+    """Segmented write-ahead log of accepted refuelings.
+
+    Records are ``length | crc32 | json`` frames appended to numbered segment
+    files. Concurrent appends are grouped into one write and one fsync, and
+    ``append`` returns only once its record is durable. A checkpoint file
+    holds the position drained into the database so far; segments entirely
+    behind it are deleted. Each record carries an id that the database
+    stores, so records drained right before a crash are skipped on replay.
+
+    Each process owns one ``worker-<n>`` directory under ``root``, held with
+    an exclusive ``flock`` while open: uvicorn workers never truncate or
+    drain each other's segments, and a restarted worker takes over the
+    lowest free directory together with whatever was left pending in it.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        segment_bytes: int = SPOOL_SEGMENT_BYTES,
+        fsync_interval_ms: float = SPOOL_FSYNC_INTERVAL_MS,
+    ):
+        self.root = root
+        self.directory: Optional[str] = None
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval_ms / 1000
+        self._lock_file = None
+        self._segment: Optional[int] = None
+        self._file = None
+        # Consecutive failed drains of the batch starting at this position.
+        self._failures: tuple[Optional[tuple[int, int]], int] = (None, 0)
+        self._durable_size = 0
+        self._buffer: list[tuple[bytes, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._drain_lock = asyncio.Lock()
+        # Guards (segment, durable size): the writer and the drain run in
+        # worker threads.
+        self._position_lock = threading.Lock()
+
+    def _position(self) -> tuple[Optional[int], int]:
+        with self._position_lock:
+            return self._segment, self._durable_size
+
+    # -- segments ---------------------------------------------------------
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:010d}.wal")
+
+    def _segments(self) -> list[int]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(m.group(1)) for m in map(_SEGMENT_NAME.match, names) if m)
+
+    def _scan(self, segment: int, offset: int, limit: Optional[int] = None):
+        """Yields ``(record, end_offset)`` from ``offset``; stops at a torn or
+        corrupt frame, which can only be the unacknowledged tail."""
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            data = f.read() if limit is None else f.read(max(limit - offset, 0))
+        position = 0
+        while position + _HEADER.size <= len(data):
+            length, checksum = _HEADER.unpack_from(data, position)
+            start, end = position + _HEADER.size, position + _HEADER.size + length
+            if end > len(data):
+                return
+            body = data[start:end]
+            if zlib.crc32(body) != checksum:
+                SPOOL_CORRUPT_RECORDS.inc()
+                logger.error("Spool segment %s: checksum mismatch at offset %s", segment, offset + position)
+                return
+            decoded = json.loads(body)
+            position = end
+            yield (decoded["id"], decoded["payload"]), offset + position
+
+    def _claim_directory(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        for slot in itertools.count():
+            lock_file = open(os.path.join(self.root, f"worker-{slot}.lock"), "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                continue
+            self._lock_file = lock_file
+            self.directory = os.path.join(self.root, f"worker-{slot}")
+            return
+
+    def _open_sync(self) -> None:
+        self._claim_directory()
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self._segments()
+        self._segment = segments[-1] if segments else 1
+        path = self._segment_path(self._segment)
+        valid_end = 0
+        if os.path.exists(path):
+            for _, valid_end in self._scan(self._segment, 0):
+                pass
+            if valid_end < os.path.getsize(path):
+                # A frame cut short by a crash was never acknowledged.
+                logger.warning("Truncating torn spool tail of segment %s at %s", self._segment, valid_end)
+                with open(path, "r+b") as f:
+                    f.truncate(valid_end)
+                    os.fsync(f.fileno())
+        self._file = open(path, "ab")
+        with self._position_lock:
+            self._durable_size = valid_end
+        _fsync_directory(self.directory)
+        self._update_pending()
+
+    async def open(self) -> None:
+        if self._file is None:
+            await asyncio.to_thread(self._open_sync)
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock_file is not None:
+            # Closing the file releases the flock for the next process.
+            self._lock_file.close()
+            self._lock_file = None
+
+    # -- appends ----------------------------------------------------------
+
+    async def append(self, payload: dict) -> str:
+        """Durably appends ``payload`` and returns its record id."""
+        await self.open()
+        record_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((_encode(record_id, payload), future))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush())
+        # Shielded: a client going away must not lose the fsync outcome for
+        # the rest of its batch.
+        await asyncio.shield(future)
+        return record_id
+
+    def _write_sync(self, frames: list[bytes]) -> None:
+        try:
+            self._file.write(b"".join(frames))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError:
+            # Cut off any partial frame so later appends stay readable.
+            os.ftruncate(self._file.fileno(), self._position()[1])
+            raise
+        size = self._file.tell()
+        if size < self.segment_bytes:
+            with self._position_lock:
+                self._durable_size = size
+            return
+        self._file.close()
+        self._file = open(self._segment_path(self._segment + 1), "ab")
+        _fsync_directory(self.directory)
+        with self._position_lock:
+            self._segment += 1
+            self._durable_size = 0
+
+    async def _flush(self) -> None:
+        await asyncio.sleep(self.fsync_interval)
+        while self._buffer:
+            batch, self._buffer = self._buffer, []
+            try:
+                await asyncio.to_thread(self._write_sync, [frame for frame, _ in batch])
+            except Exception as e:
+                logger.error("Spool write failed - %s", e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            SPOOL_FSYNC_BATCH.observe(len(batch))
+            self._update_pending()
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    # -- draining ---------------------------------------------------------
+
+    def _read_checkpoint(self) -> tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, _CHECKPOINT_FILE)) as f:
+                checkpoint = json.load(f)
+            return checkpoint["segment"], checkpoint["offset"]
+        except FileNotFoundError:
+            segments = self._segments()
+            return (segments[0] if segments else 1), 0
+
+    def _write_checkpoint(self, segment: int, offset: int) -> None:
+        path = os.path.join(self.directory, _CHECKPOINT_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segment": segment, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        for old in self._segments():
+            if old < segment:
+                os.remove(self._segment_path(old))
+
+    def _read_batch(self, max_records: int) -> tuple[list[Record], tuple[int, int]]:
+        active, durable_size = self._position()
+        segment, offset = self._read_checkpoint()
+        records: list[Record] = []
+        for current in self._segments():
+            if current < segment or (active is not None and current > active):
+                continue
+            if current > segment:
+                segment, offset = current, 0
+            # Only what has been fsynced is visible to the drain.
+            limit = durable_size if current == active else None
+            for record, end in self._scan(current, offset, limit):
+                records.append(record)
+                offset = end
+                if len(records) >= max_records:
+                    return records, (segment, offset)
+        return records, (segment, offset)
+
+    def _pending_bytes(self) -> int:
+        active, durable_size = self._position()
+        segment, offset = self._read_checkpoint()
+        total = 0
+        for current in self._segments():
+            if current < segment or (active is not None and current > active):
+                continue
+            size = durable_size if current == active else os.path.getsize(self._segment_path(current))
+            total += size - (offset if current == segment else 0)
+        return max(total, 0)
+
+    def _update_pending(self) -> None:
+        SPOOL_PENDING_BYTES.set(self._pending_bytes())
+
+    def pending(self) -> int:
+        """Bytes appended but not drained yet."""
+        if self.directory is None or not os.path.isdir(self.directory):
+            return 0
+        return self._pending_bytes()
+
+    def _dead_letter_sync(self, records: list[Record]) -> None:
+        with open(os.path.join(self.directory, _DEAD_LETTER_FILE), "ab") as f:
+            f.write(b"".join(_encode(record_id, payload) for record_id, payload in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def dead_letters(self) -> list[Record]:
+        """Records set aside by ``drain``, for inspection or manual replay."""
+        path = os.path.join(self.directory, _DEAD_LETTER_FILE) if self.directory else None
+        if path is None or not os.path.exists(path):
+            return []
+        with open(path, "rb") as f:
+            data = f.read()
+        records, position = [], 0
+        while position + _HEADER.size <= len(data):
+            length, _ = _HEADER.unpack_from(data, position)
+            body = json.loads(data[position + _HEADER.size:position + _HEADER.size + length])
+            records.append((body["id"], body["payload"]))
+            position += _HEADER.size + length
+        return records
+
+    async def _isolate(self, handler, records: list[Record]) -> None:
+        """Retries ``records`` one at a time; those failing for a reason other
+        than an outage are appended to the dead-letter file."""
+        dead = []
+        for record in records:
+            try:
+                await handler([record])
+            except Exception as e:
+                if is_outage_error(e):
+                    raise
+                logger.error("Spool record %s moved to the dead-letter file - %s", record[0], e)
+                dead.append(record)
+        if dead:
+            await asyncio.to_thread(self._dead_letter_sync, dead)
+            SPOOL_DEAD_LETTERS.inc(len(dead))
+
+    async def drain(
+        self,
+        handler: Callable[[list[Record]], Awaitable[None]],
+        batch_size: int = SPOOL_DRAIN_BATCH,
+    ) -> int:
+        """Hands pending records to ``handler`` in batches; returns how many.
+
+        The checkpoint only moves after ``handler`` returns, so a failure or
+        crash replays the batch, and ``handler`` must skip record ids it
+        already stored. After ``SPOOL_MAX_ATTEMPTS`` failures of the same
+        batch that are not outages, its records are retried one by one and
+        the failing ones set aside (``dead_letters``) so the rest can go on.
+        """
+        await self.open()
+        drained = 0
+        async with self._drain_lock:
+            while True:
+                start = await asyncio.to_thread(self._read_checkpoint)
+                records, (segment, offset) = await asyncio.to_thread(self._read_batch, batch_size)
+                if not records:
+                    break
+                failed_at, failures = self._failures
+                if failed_at == start and failures >= SPOOL_MAX_ATTEMPTS:
+                    await self._isolate(handler, records)
+                else:
+                    try:
+                        await handler(records)
+                    except Exception as e:
+                        if not is_outage_error(e):
+                            self._failures = (start, failures + 1 if failed_at == start else 1)
+                        raise
+                self._failures = (None, 0)
+                await asyncio.to_thread(self._write_checkpoint, segment, offset)
+                drained += len(records)
+                SPOOL_REPLAYED.inc(len(records))
+                if len(records) < batch_size:
+                    break
+        self._update_pending()
+        return drained
+
+    async def spill(self, payload: dict) -> str:
+        INGEST_SPILLED.inc()
+        return await self.append(payload)
+
+
+ingest_spool = Spool(SPOOL_DIR)
+
+
+async def drain_forever(
+    spool: Spool,
+    handler: Callable[[list[Record]], Awaitable[None]],
+    is_available: Callable[[], bool],
+    interval: float = SPOOL_DRAIN_INTERVAL_SECONDS,
+) -> None:
+    while True:
+        if is_available() and spool.pending():
+            try:
+                drained = await spool.drain(handler)
+                if drained:
+                    logger.info("Drained %s spooled refuelings", drained)
+            except Exception as e:
+                logger.warning("Spool drain stopped, will retry - %s", e)
+        await asyncio.sleep(interval)
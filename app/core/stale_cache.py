@@ -0,0 +1,92 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from fastapi import status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.core.circuit_breaker import CircuitOpenError, is_outage_error
+from app.core.logging_config import get_logger
+from app.core.metrics import STALE_RESPONSES, record_cache
+
+logger = get_logger(__name__)
+
+# Last good page per read key, kept to answer while the database is down.
+STALE_CACHE_ENTRIES = int(os.getenv("STALE_CACHE_ENTRIES", "1000"))
+STALE_HEADER = "X-Data-Stale"
+
+
+class StaleCache:
+    """LRU of the last successful response body per key."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, key: Hashable, body: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (body, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: Hashable) -> Optional[tuple[Any, float]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+stale_pages = StaleCache(STALE_CACHE_ENTRIES)
+
+
+async def with_stale_fallback(
+    endpoint: str,
+    key: Hashable,
+    compute: Callable[[], Awaitable[Any]],
+    response_model=None,
+) -> Any:
+    """Returns ``compute()`` and remembers it under ``key``.
+
+    When the database is unavailable (open circuit or connection failure)
+    the last body stored under ``key`` is returned instead, flagged with
+    ``X-Data-Stale: true`` and a ``Warning`` header; without one the request
+    fails with 503.
+    """
+    try:
+        body = await compute()
+    except Exception as e:
+        if not is_outage_error(e):
+            raise
+        cached = stale_pages.get(key)
+        record_cache("stale_pages", cached is not None)
+        retry_after = e.retry_after if isinstance(e, CircuitOpenError) else 1
+        headers = {"Retry-After": str(max(1, int(retry_after + 0.999)))}
+        if cached is None:
+            logger.warning("Database unavailable and no cached page for %s", endpoint)
+            return JSONResponse(
+                {"detail": "Database unavailable, retry later"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers=headers,
+            )
+        body, stored_at = cached
+        STALE_RESPONSES.labels(endpoint).inc()
+        if response_model is not None:
+            body = response_model.model_validate(body)
+        headers.update({
+            STALE_HEADER: "true",
+            "Warning": '110 - "Response is Stale"',
+            "Age": str(int(time.time() - stored_at)),
+        })
+        return JSONResponse(jsonable_encoder(body), headers=headers)
+    stale_pages.put(key, body)
+    return body
@@ -0,0 +1,123 @@
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from fastapi import Request
+
+from app.core.logging_config import get_logger
+from app.core.request_context import route_template
+
+logger = get_logger(__name__)
+
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+_NO_PHASE = nullcontext()
+
+
+class RequestTiming:
+    """Per-request accounting of wall time and SQL statements by phase.
+
+    Statements executed outside an explicit phase are attributed to ``other``.
+    Whatever happens after the last phase closes (building and serializing the
+    response) is reported as ``serialize``.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.current = "other"
+        self.last_phase_end = None
+        self.phases: dict[str, dict[str, float]] = {}
+
+    def _phase(self, name: str) -> dict[str, float]:
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = {"wall": 0.0, "db": 0.0, "statements": 0}
+        return phase
+
+    @contextmanager
+    def phase(self, name: str):
+        previous, self.current = self.current, name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last_phase_end = time.perf_counter()
+            self._phase(name)["wall"] += self.last_phase_end - started
+            self.current = previous
+
+    def record_statement(self, elapsed: float) -> None:
+        phase = self._phase(self.current)
+        phase["db"] += elapsed
+        phase["statements"] += 1
+
+    def summary(self) -> dict:
+        finished = time.perf_counter()
+        db_time = sum(p["db"] for p in self.phases.values())
+        summary = {
+            "total_ms": round((finished - self.started) * 1000, 3),
+            "db_ms": round(db_time * 1000, 3),
+            "statements": int(sum(p["statements"] for p in self.phases.values())),
+            "orm_ms": round(
+                sum(max(p["wall"] - p["db"], 0.0) for p in self.phases.values()) * 1000, 3
+            ),
+            "phases": {
+                name: {
+                    "ms": round(p["wall"] * 1000, 3),
+                    "db_ms": round(p["db"] * 1000, 3),
+                    "statements": int(p["statements"]),
+                }
+                for name, p in self.phases.items()
+            },
+        }
+        if self.last_phase_end is not None:
+            summary["serialize_ms"] = round((finished - self.last_phase_end) * 1000, 3)
+        return summary
+
+
+_current_timing: ContextVar[RequestTiming | None] = ContextVar("request_timing", default=None)
+
+
+def timed_phase(name: str):
+    timing = _current_timing.get()
+    if timing is None:
+        return _NO_PHASE
+    return timing.phase(name)
+
+
+def record_statement(elapsed: float) -> None:
+    timing = _current_timing.get()
+    if timing is not None:
+        timing.record_statement(elapsed)
+
+
+def format_server_timing(summary: dict) -> str:
+    entries = [
+        f'{name};dur={phase["ms"]};desc="{phase["statements"]} stmt, db {phase["db_ms"]}ms"'
+        for name, phase in summary["phases"].items()
+    ]
+    entries.append(f'db;dur={summary["db_ms"]};desc="{summary["statements"]} stmt"')
+    entries.append(f'orm;dur={summary["orm_ms"]}')
+    if "serialize_ms" in summary:
+        entries.append(f'serialize;dur={summary["serialize_ms"]}')
+    entries.append(f'total;dur={summary["total_ms"]}')
+    return ", ".join(entries)
+
+
+async def server_timing_middleware(request: Request, call_next):
+    timing = RequestTiming()
+    token = _current_timing.set(timing)
+    try:
+        response = await call_next(request)
+    finally:
+        _current_timing.reset(token)
+
+    summary = timing.summary()
+    response.headers["Server-Timing"] = format_server_timing(summary)
+    logger.info(
+        "request timing %s %s %s total=%sms db=%sms statements=%s",
+        request.method, route_template(request), response.status_code,
+        summary["total_ms"], summary["db_ms"], summary["statements"],
+        extra={"server_timing": summary},
+    )
+    return response
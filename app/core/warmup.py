@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from contextlib import AsyncExitStack
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.core import database
+from app.core.logging_config import get_logger
+from app.core.metrics import WARMUP_SECONDS
+from app.models.abastecimento import Refueling
+from app.services.abastecimento_service import RefuelingService, price_statistics
+from app.services.fraud_service import FRAUD_DETECTION_ENABLED, fraud_index
+from app.utils.enums import FuelType
+
+logger = get_logger(__name__)
+
+WARMUP_POOL_CONNECTIONS = int(os.getenv("WARMUP_POOL_CONNECTIONS", "5"))
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "10"))
+WARMUP_PAGE_SIZE = 10
+
+
+class WarmupState:
+    def __init__(self):
+        self.started_at: Optional[float] = None
+        self.duration_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def is_warm(self) -> bool:
+        return self.duration_seconds is not None and self.error is None
+
+    def as_dict(self) -> dict:
+        return {
+            "warm": self.is_warm,
+            "duration_seconds": self.duration_seconds,
+            "error": self.error,
+        }
+
+
+warmup_state = WarmupState()
+
+
+def _hot_statements():
+    today = date.today()
+    for fuel_type, refueling_date in (
+        (None, None),
+        (FuelType.GASOLINA.value, None),
+        (None, today),
+        (FuelType.GASOLINA.value, today),
+    ):
+        count_query, data_query = RefuelingService.list_queries(fuel_type, refueling_date)
+        yield count_query
+        yield data_query.offset(0).limit(WARMUP_PAGE_SIZE)
+
+    count_query, data_query = RefuelingService.history_queries("00000000000")
+    yield count_query
+    yield data_query.offset(0).limit(WARMUP_PAGE_SIZE)
+
+
+async def _prepare_connection(conn: AsyncConnection) -> None:
+    # Running each hot statement once fills SQLAlchemy's compiled cache and,
+    # on asyncpg, the per-connection prepared statement cache. The insert is
+    # flushed and rolled back so it gets prepared without persisting a row.
+    session = AsyncSession(bind=conn, expire_on_commit=False)
+    try:
+        for statement in _hot_statements():
+            await session.execute(statement)
+        session.add(Refueling(
+            station_id=0,
+            timestamp=datetime.now(timezone.utc),
+            fuel_type=FuelType.GASOLINA.value,
+            price_per_liter=Decimal("1.00"),
+            volume_liters=Decimal("1.00"),
+            driver_cpf="00000000000",
+            improper_data=False,
+            created_at=datetime.now(timezone.utc),
+        ))
+        await session.flush()
+    finally:
+        await session.rollback()
+        await session.close()
+
+
+async def warm_up(connections: int = WARMUP_POOL_CONNECTIONS) -> WarmupState:
+    warmup_state.started_at = time.perf_counter()
+    warmup_state.duration_seconds = None
+    warmup_state.error = None
+    try:
+        # Hold every connection until all are open so the pool really ends up
+        # with `connections` distinct, prepared connections.
+        async with AsyncExitStack() as stack:
+            opened = [
+                await stack.enter_async_context(database.engine.connect())
+                for _ in range(max(connections, 0))
+            ]
+            for conn in opened:
+                await _prepare_connection(conn)
+
+        async with database.AsyncSessionLocal() as session:
+            await price_statistics.load(session)
+            if FRAUD_DETECTION_ENABLED and fraud_index.synced_id is None:
+                rebuilt = await fraud_index.sync(session)
+                logger.info("Fraud index rebuilt from %s recent refuelings", rebuilt)
+    except Exception as e:
+        warmup_state.error = str(e)
+        logger.error("Warmup failed - %s", e)
+
+    warmup_state.duration_seconds = time.perf_counter() - warmup_state.started_at
+    if warmup_state.is_warm:
+        WARMUP_SECONDS.set(warmup_state.duration_seconds)
+        logger.info(
+            "Warmup finished in %.3fs (%s connections)", warmup_state.duration_seconds, connections
+        )
+    return warmup_state
+
+
+async def warm_up_until_ready(retry_seconds: float = WARMUP_RETRY_SECONDS) -> WarmupState:
+    # A failed warmup keeps readiness red (reason "warmup_failed"), so keep
+    # retrying instead of leaving the instance out of rotation for good.
+    while not (await warm_up()).is_warm:
+        await asyncio.sleep(retry_seconds)
+    return warmup_state
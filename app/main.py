@@ -1,28 +1,152 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from app.core.logging_config import setup_logging, get_logger
+from app.core import database
+from app.core.admission import ADMISSION_CONTROL_ENABLED, admission_middleware
+from app.core.circuit_breaker import CircuitOpenError, circuit_open_handler
+from app.core.datalake import DATALAKE_SINK_ENABLED, datalake_sink, sink_forever
+from app.core.health_checker import health_checker
+from app.core.live_feed import live_hub
+from app.core.logging_config import setup_logging, shutdown_logging, get_logger
+from app.core.metrics import mark_process_dead, metrics_middleware, record_log_drop
+from app.core.redis_client import close_redis
+from app.core.sketches import flush_forever, sketch_store
+from app.core.spool import drain_forever, ingest_spool
+from app.core.timing import SERVER_TIMING_ENABLED, server_timing_middleware
+from app.core.warmup import warm_up_until_ready
+from app.routers.changes import router as changes_router
+from app.routers.debug import router as debug_router
+from app.routers.estatisticas import router as estatisticas_router
+from app.routers.exports import router as exports_router
 from app.routers.health import router as health_router
+from app.routers.live_feed import router as live_feed_router
+from app.routers.metrics import router as metrics_router
 from app.routers.motoristas import router as motoristas_router
 from app.api.v1.abastecimento import router as abastecimento_router
+from app.schemas.abastecimento import RefuelingCreate
+from app.services.abastecimento_service import (
+    RefuelingService,
+    add_ingest_listener,
+    price_statistics,
+    price_thresholds,
+)
+from app.services.archival_service import ARCHIVAL_ENABLED, archive_forever
+from app.services.change_feed_service import prune_forever
+from app.services.export_service import EXPORT_WORKERS, export_workers_forever
+from app.services.fraud_service import FRAUD_DETECTION_ENABLED, fraud_index, sync_forever
+from app.services.histogram_service import record_price_histograms
+from app.services.percentile_service import record_prices
+from app.services.ranking_service import record_rankings
+from app.services.unique_drivers_service import record_drivers
 
-setup_logging()
+setup_logging(on_drop=record_log_drop)
 logger = get_logger(__name__)
 
-app = FastAPI(
-    title="Vlab API",
-    description="API de Gateway para Data Lake de Abastecimento",
-    version="1.0.0"
-)
+_background_tasks: set[asyncio.Task] = set()
+
+add_ingest_listener(live_hub.broadcast)
+add_ingest_listener(record_prices)
+add_ingest_listener(record_drivers)
+add_ingest_listener(record_rankings)
+add_ingest_listener(record_price_histograms)
+
+
+def _start_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _drain_spooled(records: list[tuple[str, dict]]) -> None:
+    async with database.AsyncSessionLocal() as session:
+        await RefuelingService.create_refuelings(
+            session, [(record_id, RefuelingCreate(**payload)) for record_id, payload in records]
+        )
+
 
-@app.on_event("startup")
 async def startup_event():
     logger.info("Starting Vlab API...")
     logger.info("API version: 1.0.0")
+    # Opened before any background task starts so a crash-truncated tail is
+    # repaired before the drain (or a request) touches the spool.
+    await ingest_spool.open()
+    health_checker.start()
+    # Warmup runs in the background: liveness answers right away and
+    # readiness only turns green once it is done.
+    _start_background(warm_up_until_ready())
+    # Spooled refuelings (INGEST_MODE=spool, or spilled while the database
+    # was down) are drained whenever the primary's circuit is closed; the
+    # health checker probes it meanwhile. Unacknowledged segments left by a
+    # previous process are replayed the same way.
+    _start_background(
+        drain_forever(ingest_spool, _drain_spooled, lambda: not database.primary_breaker.is_open)
+    )
+    _start_background(prune_forever(database.AsyncSessionLocal))
+    if DATALAKE_SINK_ENABLED:
+        _start_background(sink_forever(datalake_sink, database.AsyncSessionLocal))
+    if ARCHIVAL_ENABLED:
+        _start_background(archive_forever(database.AsyncSessionLocal))
+    if live_hub.bridged:
+        _start_background(live_hub.bridge_forever())
+    if FRAUD_DETECTION_ENABLED:
+        _start_background(sync_forever(database.AsyncSessionLocal))
+    _start_background(flush_forever(database.AsyncSessionLocal))
+    if EXPORT_WORKERS > 0:
+        # Jobs left running by a previous process are resumed once their lease expires.
+        _start_background(export_workers_forever(database.AsyncSessionLocal))
+
 
-@app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down Vlab API...")
+    for task in list(_background_tasks):
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    try:
+        async with database.AsyncSessionLocal() as session:
+            await sketch_store.flush(session)
+    except Exception as e:
+        logger.warning("Final sketch flush failed - %s", e)
+    await health_checker.stop()
+    await ingest_spool.close()
+    await close_redis()
+    price_statistics.clear()
+    price_thresholds.clear()
+    fraud_index.clear()
+    mark_process_dead()
+    shutdown_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup_event()
+    yield
+    await shutdown_event()
+
+
+app = FastAPI(
+    title="Vlab API",
+    description="API de Gateway para Data Lake de Abastecimento",
+    version="1.0.0",
+    lifespan=lifespan,
+)
+app.add_exception_handler(CircuitOpenError, circuit_open_handler)
+
+# Registered innermost first: metrics wraps admission control so shed
+# requests are still counted, and sheds happen before any session is opened.
+if SERVER_TIMING_ENABLED:
+    app.middleware("http")(server_timing_middleware)
+if ADMISSION_CONTROL_ENABLED:
+    app.middleware("http")(admission_middleware)
+app.middleware("http")(metrics_middleware)
 
+app.include_router(live_feed_router, prefix="/api/v1")
 app.include_router(abastecimento_router, prefix="/api/v1")
 app.include_router(motoristas_router, prefix="/api/v1")
-app.include_router(health_router)
\ No newline at end of file
+app.include_router(changes_router, prefix="/api/v1")
+app.include_router(estatisticas_router, prefix="/api/v1")
+app.include_router(exports_router, prefix="/api/v1")
+app.include_router(health_router)
+app.include_router(metrics_router)
+app.include_router(debug_router)
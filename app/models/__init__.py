@@ -1 +1 @@
-from app.models.abastecimento import Refueling
+from app.models.abastecimento import ExportJob, Refueling, RefuelingChange, Sketch
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Numeric, Boolean, Index
+from sqlalchemy import Column, Integer, String, Date, DateTime, Numeric, Boolean, Index, JSON, BigInteger, LargeBinary
 from sqlalchemy.orm import declarative_base
 from datetime import datetime, timezone
 
@@ -15,8 +15,65 @@ class Refueling(Base):
     volume_liters = Column(Numeric(10, 2), nullable=False)
     driver_cpf = Column(String, nullable=False, index=True)
     improper_data = Column(Boolean, default=False)
+    # Rules matched by the ingest-time fraud index (station hop, daily volume).
+    fraud_flags = Column(JSON, nullable=True)
+    # Spool record id for refuelings ingested through the local spool; unique
+    # so a replayed batch can never insert the same record twice.
+    ingest_id = Column(String(32), nullable=True, unique=True)
     created_at = Column(DateTime(timezone=True), default=datetime.now(timezone.utc))
     
     __table_args__ = (
         Index('idx_fuel_type_timestamp', 'fuel_type', 'timestamp'),
-    )
\ No newline at end of file
+    )
+
+
+class RefuelingChange(Base):
+    """Outbox row written in the same transaction as each refueling insert;
+    ``seq`` is the offset downstream consumers tail the change feed by."""
+    __tablename__ = "refueling_changes"
+
+    seq = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    refueling_id = Column(Integer, nullable=False)
+    operation = Column(String(16), nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class Sketch(Base):
+    """Serialized mergeable summary (quantiles, distinct counts, ...) of the
+    refuelings that map to ``key``; workers merge their deltas into it."""
+    __tablename__ = "sketches"
+
+    kind = Column(String(32), primary_key=True)
+    key = Column(String(128), primary_key=True)
+    # Set for per-day sketches so date ranges are an index scan.
+    day = Column(Date, nullable=True, index=True)
+    payload = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+    # Set by a rebuild: refueling ids up to ``rebuilt_through``, except
+    # ``rebuilt_missing``, are already counted, so deltas for them are dropped.
+    rebuilt_through = Column(BigInteger, nullable=True)
+    rebuilt_missing = Column(JSON, nullable=True)
+
+
+class ExportJob(Base):
+    """Queued export of refuelings to a file. ``last_id`` and ``checkpoint``
+    (bytes or Parquet parts already on disk) let another worker resume it."""
+    __tablename__ = "export_jobs"
+
+    id = Column(String(32), primary_key=True)
+    status = Column(String(16), nullable=False, index=True)
+    format = Column(String(16), nullable=False)
+    filters = Column(JSON, nullable=False)
+    total_rows = Column(Integer, nullable=True)
+    exported_rows = Column(Integer, nullable=False, default=0)
+    last_id = Column(Integer, nullable=False, default=0)
+    checkpoint = Column(BigInteger, nullable=False, default=0)
+    # Claim token of the worker running the job and until when it holds it.
+    worker = Column(String(32), nullable=True)
+    lease_until = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
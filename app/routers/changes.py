@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.core.logging_config import get_logger
+from app.core.query_guard import configure_session
+from app.core.security import get_api_key
+from app.schemas.changes import ChangeFeedResponse
+from app.services import change_feed_service
+from app.services.change_feed_service import ChangeFeedService
+
+router = APIRouter(prefix="/changes", tags=["Change feed"])
+logger = get_logger(__name__)
+
+
+@router.get("", response_model=ChangeFeedResponse)
+async def list_changes(
+    request: Request,
+    since: int = Query(0, ge=0, description="Último seq já processado pelo consumidor"),
+    limit: int = Query(None, ge=1, description="Máximo de mudanças no lote"),
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Depends(get_api_key),
+):
+    """Changes after ``since`` in sequence order.
+
+    Consumers persist ``next_since`` and pass it back on the next call; while
+    ``has_more`` is true another full batch is already waiting. Always read
+    from the primary: the settle window only covers commit order there, and
+    a replica can apply a lower ``seq`` after a consumer already passed it.
+    """
+    configure_session(db, request)
+    limit = min(limit or change_feed_service.CHANGE_FEED_BATCH, change_feed_service.CHANGE_FEED_MAX_BATCH)
+    changes = await ChangeFeedService.fetch_changes(db, since, limit)
+    logger.info("Change feed since %s: returning %s changes", since, len(changes))
+    return {
+        "since": since,
+        "next_since": changes[-1].seq if changes else since,
+        "has_more": len(changes) == limit,
+        "changes": changes,
+    }
@@ -0,0 +1,21 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from app.core.security import get_api_key
+from app.core.slow_query import SLOW_QUERY_THRESHOLD_MS, recent_slow_queries
+
+router = APIRouter(prefix="/debug", tags=["Debug"])
+
+
+@router.get("/slow-queries")
+async def slow_queries(
+    limit: Optional[int] = Query(None, ge=1),
+    api_key: str = Depends(get_api_key),
+):
+    entries = recent_slow_queries(limit)
+    return {
+        "threshold_ms": SLOW_QUERY_THRESHOLD_MS,
+        "total": len(entries),
+        "data": entries,
+    }
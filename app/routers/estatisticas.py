@@ -0,0 +1,137 @@
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_read_db
+from app.core.logging_config import get_logger
+from app.core.query_guard import guarded
+from app.schemas.estatisticas import (
+    AnalyticsResponse,
+    AnomalyRate,
+    DistinctDrivers,
+    PriceHistogram,
+    PricePercentiles,
+    PriceStatistics,
+    RankingResponse,
+    StationDayVolume,
+)
+from app.core.sketches import SKETCH_HISTOGRAM_BUCKET
+from app.services.analytics_service import AnalyticsService
+from app.services.histogram_service import HistogramService
+from app.services.percentile_service import PercentileService
+from app.services.ranking_service import RankingService
+from app.services.unique_drivers_service import UniqueDriversService
+from app.utils.enums import FuelType, RankingMetric
+
+router = APIRouter(prefix="/estatisticas", tags=["Estatísticas"])
+logger = get_logger(__name__)
+
+
+def _check_range(start: Optional[date], end: Optional[date]) -> None:
+    if start and end and start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start deve ser anterior a end")
+
+
+@router.get("/precos", response_model=AnalyticsResponse[PriceStatistics])
+async def price_statistics_report(
+    start: Optional[date] = Query(None, description="Data inicial (inclusive)"),
+    end: Optional[date] = Query(None, description="Data final (inclusive)"),
+    fuel_type: Optional[FuelType] = Query(None, description="Tipo de combustível"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    _check_range(start, end)
+    logger.info("Price statistics report - start: %s, end: %s, fuel_type: %s", start, end, fuel_type)
+    return await guarded(db, AnalyticsService.price_statistics(
+        db, start, end, fuel_type.value if fuel_type else None
+    ))
+
+
+@router.get("/volume", response_model=AnalyticsResponse[StationDayVolume])
+async def volume_by_station_day(
+    start: Optional[date] = Query(None, description="Data inicial (inclusive)"),
+    end: Optional[date] = Query(None, description="Data final (inclusive)"),
+    station_id: Optional[int] = Query(None, description="Posto"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    _check_range(start, end)
+    logger.info("Volume report - start: %s, end: %s, station: %s", start, end, station_id)
+    return await guarded(db, AnalyticsService.volume_by_station_day(db, start, end, station_id))
+
+
+@router.get("/anomalias", response_model=AnalyticsResponse[AnomalyRate])
+async def anomaly_rates(
+    start: Optional[date] = Query(None, description="Data inicial (inclusive)"),
+    end: Optional[date] = Query(None, description="Data final (inclusive)"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    _check_range(start, end)
+    logger.info("Anomaly rate report - start: %s, end: %s", start, end)
+    return await guarded(db, AnalyticsService.anomaly_rates(db, start, end))
+
+
+@router.get("/percentis", response_model=AnalyticsResponse[PricePercentiles])
+async def price_percentiles(
+    fuel_type: Optional[FuelType] = Query(None, description="Tipo de combustível"),
+    station_id: Optional[int] = Query(None, description="Posto"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    logger.info("Price percentiles - fuel_type: %s, station: %s", fuel_type, station_id)
+    return await guarded(db, PercentileService.price_percentiles(
+        db, fuel_type.value if fuel_type else None, station_id
+    ))
+
+
+@router.get("/motoristas-unicos", response_model=AnalyticsResponse[DistinctDrivers])
+async def distinct_drivers(
+    start: date = Query(..., description="Data inicial (inclusive)"),
+    end: date = Query(..., description="Data final (inclusive)"),
+    station_id: Optional[int] = Query(None, description="Posto"),
+    fuel_type: Optional[FuelType] = Query(None, description="Tipo de combustível"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    _check_range(start, end)
+    logger.info("Distinct drivers - start: %s, end: %s, station: %s, fuel_type: %s", start, end, station_id, fuel_type)
+    return await guarded(db, UniqueDriversService.distinct_drivers(
+        db, start, end, station_id, fuel_type.value if fuel_type else None
+    ))
+
+
+@router.get("/histograma", response_model=AnalyticsResponse[PriceHistogram])
+async def price_histogram(
+    start: date = Query(..., description="Data inicial (inclusive)"),
+    end: date = Query(..., description="Data final (inclusive)"),
+    fuel_type: Optional[FuelType] = Query(None, description="Tipo de combustível"),
+    station_id: Optional[int] = Query(None, description="Posto"),
+    bucket_width: Optional[Decimal] = Query(
+        None, gt=0, description="Largura das faixas, múltipla de SKETCH_HISTOGRAM_BUCKET"
+    ),
+    db: AsyncSession = Depends(get_read_db),
+):
+    _check_range(start, end)
+    if bucket_width is not None and bucket_width % SKETCH_HISTOGRAM_BUCKET:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"bucket_width deve ser múltiplo de {SKETCH_HISTOGRAM_BUCKET}",
+        )
+    logger.info(
+        "Price histogram - start: %s, end: %s, fuel_type: %s, station: %s, bucket_width: %s",
+        start, end, fuel_type, station_id, bucket_width,
+    )
+    return await guarded(db, HistogramService.price_histogram(
+        db, start, end, fuel_type.value if fuel_type else None, station_id, bucket_width
+    ))
+
+
+@router.get("/ranking", response_model=RankingResponse, response_model_exclude_none=True)
+async def ranking(
+    metric: RankingMetric = Query(..., description="Motoristas por litros ou gasto, ou postos por volume"),
+    days: int = Query(7, ge=1, le=366, description="Janela em dias (UTC), terminando hoje"),
+    limit: int = Query(10, ge=1, le=100, description="Tamanho do ranking"),
+    verify: bool = Query(False, description="Compara com o ranking exato via SQL (varre a tabela)"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    logger.info("Ranking - metric: %s, days: %s, limit: %s, verify: %s", metric.value, days, limit, verify)
+    return await guarded(db, RankingService.ranking(db, metric.value, days, limit, verify))
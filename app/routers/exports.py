@@ -0,0 +1,96 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.core.logging_config import get_logger
+from app.core.security import get_api_key
+from app.models.abastecimento import ExportJob
+from app.schemas.exports import ExportCreate, ExportStatus
+from app.services import export_service
+from app.services.export_service import DONE, MEDIA_TYPES, ExportService, artifact_path
+
+router = APIRouter(prefix="/exports", tags=["Exports"])
+logger = get_logger(__name__)
+
+
+def _status(job: ExportJob) -> dict:
+    if job.status == DONE:
+        progress = 1.0
+    elif job.total_rows:
+        progress = min(job.exported_rows / job.total_rows, 1.0)
+    else:
+        progress = 0.0
+    return {
+        "id": job.id,
+        "status": job.status,
+        "format": job.format,
+        "filters": job.filters,
+        "total_rows": job.total_rows,
+        "exported_rows": job.exported_rows,
+        "progress": progress,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "download_url": f"/api/v1/exports/{job.id}/download" if job.status == DONE else None,
+    }
+
+
+async def _job(db: AsyncSession, job_id: str) -> ExportJob:
+    job = await ExportService.get(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Exportação não encontrada")
+    return job
+
+
+@router.post("", response_model=ExportStatus, status_code=status.HTTP_202_ACCEPTED)
+async def create_export(
+    export: ExportCreate,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Depends(get_api_key),
+):
+    """Queues an export; a background worker writes the file."""
+    if export.start and export.end and export.start > export.end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start deve ser anterior a end")
+    if await ExportService.pending(db) >= export_service.EXPORT_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Fila de exportações cheia, tente mais tarde",
+            headers={"Retry-After": "60"},
+        )
+    filters = export.model_dump(mode="json", exclude={"format"}, exclude_none=True)
+    job = await ExportService.create(db, export.format.value, filters)
+    logger.info("Export %s queued - format: %s, filters: %s", job.id, job.format, sorted(filters))
+    response.headers["Location"] = f"/api/v1/exports/{job.id}"
+    return _status(job)
+
+
+@router.get("/{job_id}", response_model=ExportStatus)
+async def get_export(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Depends(get_api_key),
+):
+    return _status(await _job(db, job_id))
+
+
+@router.get("/{job_id}/download", response_class=FileResponse)
+async def download_export(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Depends(get_api_key),
+):
+    """The finished file. Range requests are honoured, and servers with the
+    ASGI pathsend extension send it straight from disk."""
+    job = await _job(db, job_id)
+    if job.status != DONE:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Exportação ainda não concluída ({job.status})")
+    path = artifact_path(job)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Arquivo da exportação não está mais disponível")
+    return FileResponse(path, media_type=MEDIA_TYPES[job.format], filename=f"abastecimentos-{job.id}.{job.format}")
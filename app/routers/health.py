@@ -1,25 +1,41 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response, status
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
+from app.core.database import get_read_db
+from app.core.health_checker import health_checker
 from app.core.logging_config import get_logger
 
 router = APIRouter()
 logger = get_logger(__name__)
 
 @router.get("/health")
-async def health(db: AsyncSession = Depends(get_db)):
+async def health(db: AsyncSession = Depends(get_read_db)):
     try:
         await db.execute(text("SELECT 1"))
         db_status = "connected"
         logger.debug("Health check: database connection OK")
     except Exception as e:
         db_status = f"error: {str(e)}"
-        logger.error(f"Health check: database connection FAILED - {str(e)}")
+        logger.error("Health check: database connection FAILED - %s", e)
     
     return {
         "status": "ok",
         "version": "1.0.0",
         "database": db_status
-    }
\ No newline at end of file
+    }
+
+@router.get("/health/live")
+async def liveness():
+    return {"status": "ok"}
+
+
+@router.get("/health/ready")
+async def readiness(response: Response):
+    snapshot = health_checker.snapshot
+    if snapshot is None:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"ready": False, "reasons": ["starting"]}
+    if not snapshot["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return snapshot
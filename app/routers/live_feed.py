@@ -0,0 +1,109 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketException, status
+from fastapi.responses import StreamingResponse
+
+from app.core.live_feed import (
+    LIVE_FEED_KEEPALIVE_SECONDS,
+    FeedFilter,
+    HubFull,
+    Subscription,
+    encode_sse,
+    live_hub,
+)
+from app.core.logging_config import get_logger
+from app.core.security import API_KEY_NAME, get_api_key
+from app.utils.enums import FuelType
+
+router = APIRouter(prefix="/abastecimentos", tags=["Live feed"])
+logger = get_logger(__name__)
+
+# Close code for "try again later" (RFC 6455 registry).
+WS_TRY_AGAIN_LATER = 1013
+
+
+async def websocket_api_key(websocket: WebSocket) -> str:
+    # APIKeyHeader only resolves for HTTP requests; same checks, WS close codes.
+    try:
+        return await get_api_key(websocket.headers.get(API_KEY_NAME))
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+
+
+def _subscribe(fuel_type: Optional[FuelType], station_id: Optional[int], improper: Optional[bool]) -> Subscription:
+    return live_hub.subscribe(FeedFilter(fuel_type.value if fuel_type else None, station_id, improper))
+
+
+async def sse_events(request: Request, subscription: Subscription, keepalive: float = LIVE_FEED_KEEPALIVE_SECONDS):
+    try:
+        while True:
+            message = await subscription.next(timeout=keepalive)
+            if message is None:
+                if await request.is_disconnected():
+                    break
+                # Comment line: keeps proxies from closing an idle stream.
+                yield ": keepalive\n\n"
+                continue
+            yield encode_sse(*message)
+    finally:
+        live_hub.unsubscribe(subscription)
+
+
+@router.get("/stream")
+async def stream_refuelings(
+    request: Request,
+    fuel_type: Optional[FuelType] = Query(None, description="Tipo de combustível"),
+    station_id: Optional[int] = Query(None, description="Posto"),
+    improper: Optional[bool] = Query(None, description="Só anomalias (true) ou só normais (false)"),
+    api_key: str = Depends(get_api_key),
+):
+    try:
+        subscription = _subscribe(fuel_type, station_id, improper)
+    except HubFull:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many live feed subscribers")
+    logger.info("Live feed SSE subscriber - fuel_type: %s, station: %s, improper: %s", fuel_type, station_id, improper)
+    return StreamingResponse(
+        sse_events(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def websocket_refuelings(
+    websocket: WebSocket,
+    fuel_type: Optional[FuelType] = None,
+    station_id: Optional[int] = None,
+    improper: Optional[bool] = None,
+    api_key: str = Depends(websocket_api_key),
+):
+    try:
+        subscription = _subscribe(fuel_type, station_id, improper)
+    except HubFull:
+        await websocket.close(code=WS_TRY_AGAIN_LATER)
+        return
+    await websocket.accept()
+
+    async def pump():
+        await websocket.send_json({"type": "subscribed"})
+        while True:
+            kind, data = await subscription.next()
+            await websocket.send_json({"type": kind, "data": data})
+
+    async def until_disconnect():
+        # Inbound messages are ignored; this only notices the client leaving.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(until_disconnect())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        live_hub.unsubscribe(subscription)
+    for task in done:
+        # A send racing the client's disconnect fails; nothing left to do.
+        if task.exception() is not None:
+            logger.debug("Live feed WebSocket closed - %s", task.exception())
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy import select, desc, func
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
-from app.core.logging_config import get_logger
-from app.models.abastecimento import Refueling
+from app.core.coalescing import read_key, shared_read
+from app.core.database import get_read_db
+from app.core.logging_config import get_logger, mask_cpf
+from app.core.query_guard import guarded
+from app.core.stale_cache import with_stale_fallback
+from app.core.timing import timed_phase
 from app.schemas.abastecimento import RefuelingResponse
 from app.schemas.pagination import PaginatedResponse
+from app.services.abastecimento_service import RefuelingService
+from app.services.archival_service import ArchivalService, archive_filters
 
 router = APIRouter(prefix="/motoristas", tags=["Motoristas"])
 logger = get_logger(__name__)
@@ -16,31 +20,53 @@ async def historico_por_cpf(
     cpf: str,
     page: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
+    include_archived: bool = False,
 ):
-    logger.info(f"Fetching refueling history for CPF: {cpf}, page: {page}, size: {size}")
+    logger.info("Fetching refueling history for CPF: %s, page: %s, size: %s", mask_cpf(cpf), page, size)
     offset = (page - 1) * size
 
-    count_query = select(func.count(Refueling.id)).where(Refueling.driver_cpf == cpf)
-    total_result = await db.execute(count_query)
-    total = total_result.scalar()
+    async def load_page():
+        count_query, base_query = RefuelingService.history_queries(cpf)
+        if include_archived:
+            with timed_phase("page"):
+                try:
+                    total, data = await guarded(db, ArchivalService.page_with_archive(
+                        db, count_query, base_query, *archive_filters(cpf=cpf), offset, size
+                    ))
+                except ValueError as e:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            return {"total": total, "page": page, "size": size, "data": data}
 
-    data_query = (
-        select(Refueling)
-        .where(Refueling.driver_cpf == cpf)
-        .order_by(desc(Refueling.timestamp))
-        .offset(offset)
-        .limit(size)
-    )
+        with timed_phase("count"):
+            total = await guarded(db, shared_read(
+                db,
+                read_key(db, "history_count", cpf),
+                lambda session: RefuelingService.count(session, count_query),
+            ))
+
+        data_query = base_query.offset(offset).limit(size)
+
+        with timed_phase("page"):
+            data = await guarded(db, shared_read(
+                db,
+                read_key(db, "history_page", cpf, offset, size),
+                lambda session: RefuelingService.fetch_page(session, data_query),
+                RefuelingService.serialize_page,
+            ))
 
-    result = await db.execute(data_query)
-    data = result.scalars().all()
-    
-    logger.info(f"Found {total} total refuelings for CPF {cpf}, returning {len(data)} for current page")
-
-    return {
-        "total": total,
-        "page": page,
-        "size": size,
-        "data": data
-    }
+        logger.info("Found %s total refuelings for CPF %s, returning %s for current page", total, mask_cpf(cpf), len(data))
+
+        return {
+            "total": total,
+            "page": page,
+            "size": size,
+            "data": data
+        }
+
+    return await with_stale_fallback(
+        "historico_por_cpf",
+        ("historico_por_cpf", cpf, page, size, include_archived),
+        load_page,
+        PaginatedResponse[RefuelingResponse],
+    )
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, field_validator
 from datetime import datetime
 from decimal import Decimal
-from typing import List
+from typing import List, Optional
     
 from app.utils.enums import FuelType
 from app.utils.validators import validate_volume_positive
@@ -43,7 +43,44 @@ class RefuelingCreate(BaseModel):
 class RefuelingResponse(RefuelingCreate):
     id: int
     improper_data: bool
+    fraud_flags: List[str] = []
     created_at: datetime
 
+    @field_validator('fraud_flags', mode='before')
+    @classmethod
+    def validate_fraud_flags(cls, v: Optional[List[str]]) -> List[str]:
+        # Rows ingested before fraud detection existed have no flags stored.
+        return v or []
+
     class Config:
         from_attributes = True
+
+
+class RefuelingLookup(BaseModel):
+    ids: List[int]
+
+
+class RefuelingLookupResponse(BaseModel):
+    data: List[RefuelingResponse]
+    missing: List[int]
+
+
+class ImproperCorrection(BaseModel):
+    id: int
+    improper_data: bool
+
+
+class BulkCorrection(BaseModel):
+    updates: List[ImproperCorrection]
+
+
+class CorrectionResult(BaseModel):
+    id: int
+    status: str
+
+
+class BulkCorrectionResponse(BaseModel):
+    updated: int
+    unchanged: int
+    not_found: int
+    results: List[CorrectionResult]
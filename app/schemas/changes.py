@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class ChangeResponse(BaseModel):
+    seq: int
+    refueling_id: int
+    operation: str
+    payload: dict
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ChangeFeedResponse(BaseModel):
+    since: int
+    next_since: int
+    has_more: bool
+    changes: list[ChangeResponse]
@@ -0,0 +1,86 @@
+from datetime import date
+from decimal import Decimal
+from typing import Generic, Optional, TypeVar
+
+from pydantic import BaseModel
+
+T = TypeVar('T')
+
+
+class AnalyticsResponse(BaseModel, Generic[T]):
+    sources: list[str]
+    data: list[T]
+
+
+class PriceStatistics(BaseModel):
+    fuel_type: str
+    count: int
+    avg_price: Decimal
+    min_price: Decimal
+    max_price: Decimal
+
+
+class StationDayVolume(BaseModel):
+    station_id: int
+    date: date
+    total_volume: Decimal
+    count: int
+
+
+class AnomalyRate(BaseModel):
+    fuel_type: str
+    total: int
+    improper: int
+    rate: float
+
+
+class PricePercentiles(BaseModel):
+    fuel_type: str
+    station_id: Optional[int] = None
+    count: int
+    min_price: Decimal
+    p50: Decimal
+    p90: Decimal
+    p99: Decimal
+    max_price: Decimal
+
+
+class DistinctDrivers(BaseModel):
+    station_id: int
+    distinct_drivers: int
+    standard_error: float
+
+
+class HistogramBucket(BaseModel):
+    lower: Decimal
+    upper: Decimal
+    count: int
+
+
+class PriceHistogram(BaseModel):
+    fuel_type: str
+    station_id: Optional[int] = None
+    bucket_width: Decimal
+    count: int
+    buckets: list[HistogramBucket]
+
+
+class RankingEntry(BaseModel):
+    rank: int
+    key: str
+    value: Decimal
+    error: Decimal
+
+
+class RankingVerification(BaseModel):
+    exact: list[RankingEntry]
+    matches: bool
+
+
+class RankingResponse(BaseModel):
+    metric: str
+    start: date
+    end: date
+    sources: list[str]
+    data: list[RankingEntry]
+    verification: Optional[RankingVerification] = None
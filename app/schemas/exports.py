@@ -0,0 +1,31 @@
+from datetime import date, datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+from app.utils.enums import ExportFormat, FuelType
+
+
+class ExportCreate(BaseModel):
+    format: ExportFormat
+    fuel_type: Optional[FuelType] = None
+    station_id: Optional[int] = None
+    start: Optional[date] = None
+    end: Optional[date] = None
+    driver_cpf: Optional[str] = None
+
+
+class ExportStatus(BaseModel):
+    id: str
+    status: str
+    format: str
+    filters: dict
+    total_rows: Optional[int] = None
+    exported_rows: int
+    progress: float
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    download_url: Optional[str] = None
@@ -1,51 +1,384 @@
-from datetime import datetime, timezone
+import asyncio
+import os
+import time as monotonic_time
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
 from decimal import Decimal
-from sqlalchemy import func, select
+from typing import Callable, Optional
+
+from sqlalchemy import desc, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core import datalake
 from app.core.logging_config import get_logger
-from app.schemas.abastecimento import RefuelingCreate
+from app.core.metrics import REFUELING_CORRECTIONS, record_cache, record_improper_correction, record_refueling
+from app.core.stale_cache import stale_pages
+from app.core.timing import timed_phase
+from app.schemas.abastecimento import RefuelingCreate, RefuelingResponse
 from app.models.abastecimento import Refueling
+from app.services.change_feed_service import ChangeFeedService
+from app.services.fraud_service import fraud_index
+from app.services.percentile_service import PercentileService
 
 logger = get_logger(__name__)
 
+# How long preloaded price statistics are trusted before being reloaded from
+# the database (other workers insert rows this process never sees).
+ANOMALY_STATS_REFRESH_SECONDS = float(os.getenv("ANOMALY_STATS_REFRESH_SECONDS", "60"))
+# "mean": a price above 1.25x its fuel type's average is improper.
+# "percentile": above the ANOMALY_PERCENTILE quantile of its fuel type's price
+# sketch instead, once the sketch holds ANOMALY_PERCENTILE_MIN_SAMPLES prices
+# (the mean rule applies until then).
+ANOMALY_RULE = os.getenv("ANOMALY_RULE", "mean").lower()
+ANOMALY_PERCENTILE = float(os.getenv("ANOMALY_PERCENTILE", "0.99"))
+ANOMALY_PERCENTILE_MIN_SAMPLES = int(os.getenv("ANOMALY_PERCENTILE_MIN_SAMPLES", "1000"))
+# Largest id list / correction batch accepted by the bulk endpoints.
+REFUELING_LOOKUP_MAX_IDS = int(os.getenv("REFUELING_LOOKUP_MAX_IDS", "1000"))
+REFUELING_BULK_MAX_UPDATES = int(os.getenv("REFUELING_BULK_MAX_UPDATES", "5000"))
+
+UPDATED, UNCHANGED, NOT_FOUND = "updated", "unchanged", "not_found"
+
+
+class PriceStatistics:
+    """Running sum and count of ``price_per_liter`` per fuel type.
+
+    Once loaded it replaces the per-insert ``AVG`` over the whole table; until
+    then (or after it expires) the service falls back to the query.
+    """
+
+    def __init__(self):
+        self._totals: dict[str, list] = {}
+        self.loaded_at: Optional[float] = None
+
+    @property
+    def is_fresh(self) -> bool:
+        return (
+            self.loaded_at is not None
+            and monotonic_time.monotonic() - self.loaded_at < ANOMALY_STATS_REFRESH_SECONDS
+        )
+
+    async def load(self, db: AsyncSession) -> None:
+        result = await db.execute(
+            select(
+                Refueling.fuel_type,
+                func.sum(Refueling.price_per_liter),
+                func.count(Refueling.id),
+            ).group_by(Refueling.fuel_type)
+        )
+        self._totals = {
+            fuel_type: [Decimal(str(total)), count] for fuel_type, total, count in result.all()
+        }
+        self.loaded_at = monotonic_time.monotonic()
+
+    def average(self, fuel_type: str) -> Optional[Decimal]:
+        total = self._totals.get(fuel_type)
+        if not total or not total[1]:
+            return None
+        return total[0] / total[1]
+
+    def add(self, fuel_type: str, price: Decimal) -> None:
+        if self.loaded_at is None:
+            return
+        total = self._totals.setdefault(fuel_type, [Decimal("0"), 0])
+        total[0] += price
+        total[1] += 1
+
+    def clear(self) -> None:
+        self._totals = {}
+        self.loaded_at = None
+
+
+price_statistics = PriceStatistics()
+
+
+class PriceThresholds:
+    """``ANOMALY_PERCENTILE`` price per fuel type, from the price sketches.
+
+    Reloaded every ``ANOMALY_STATS_REFRESH_SECONDS`` like the averages.
+    """
+
+    def __init__(self):
+        self._thresholds: dict[str, Decimal] = {}
+        self.loaded_at: Optional[float] = None
+
+    @property
+    def is_fresh(self) -> bool:
+        return (
+            self.loaded_at is not None
+            and monotonic_time.monotonic() - self.loaded_at < ANOMALY_STATS_REFRESH_SECONDS
+        )
+
+    async def load(self, db: AsyncSession) -> None:
+        sketches = await PercentileService.fuel_sketches(db)
+        self._thresholds = {
+            fuel_type: Decimal(str(sketch.quantile(ANOMALY_PERCENTILE)))
+            for fuel_type, sketch in sketches.items()
+            if sketch.n >= ANOMALY_PERCENTILE_MIN_SAMPLES
+        }
+        self.loaded_at = monotonic_time.monotonic()
+
+    def threshold(self, fuel_type: str) -> Optional[Decimal]:
+        return self._thresholds.get(fuel_type)
+
+    def clear(self) -> None:
+        self._thresholds = {}
+        self.loaded_at = None
+
+
+price_thresholds = PriceThresholds()
+
+# Called with the serialized refuelings after every committed insert (live
+# feed, sketches). They run on the request path and must not block.
+_ingest_listeners: list[Callable[[list[dict]], None]] = []
+
+
+def add_ingest_listener(listener: Callable[[list[dict]], None]) -> None:
+    if listener not in _ingest_listeners:
+        _ingest_listeners.append(listener)
+
+
+def remove_ingest_listener(listener: Callable[[list[dict]], None]) -> None:
+    if listener in _ingest_listeners:
+        _ingest_listeners.remove(listener)
+
 
 class RefuelingService:
     @staticmethod
-    async def create_refueling(db: AsyncSession, data: RefuelingCreate) -> Refueling:
-        logger.debug(f"Calculating average price for fuel type: {data.fuel_type.value}")
-        
+    def list_queries(fuel_type: Optional[str] = None, refueling_date: Optional[date] = None):
+        base_query = select(Refueling)
+        count_query = select(func.count(Refueling.id))
+
+        if fuel_type:
+            base_query = base_query.where(Refueling.fuel_type == fuel_type)
+            count_query = count_query.where(Refueling.fuel_type == fuel_type)
+
+        if refueling_date:
+            # The UTC day, as stored and as the archive partitions by it.
+            start = datetime.combine(refueling_date, time.min, tzinfo=timezone.utc)
+            end = start + timedelta(days=1)
+            day = (Refueling.timestamp >= start) & (Refueling.timestamp < end)
+            base_query = base_query.where(day)
+            count_query = count_query.where(day)
+
+        return count_query, base_query.order_by(desc(Refueling.timestamp))
+
+    @staticmethod
+    def history_queries(cpf: str):
+        count_query = select(func.count(Refueling.id)).where(Refueling.driver_cpf == cpf)
+        data_query = (
+            select(Refueling)
+            .where(Refueling.driver_cpf == cpf)
+            .order_by(desc(Refueling.timestamp))
+        )
+        return count_query, data_query
+
+    @staticmethod
+    async def count(db: AsyncSession, count_query) -> int:
+        result = await db.execute(count_query)
+        return result.scalar()
+
+    @staticmethod
+    async def fetch_page(db: AsyncSession, data_query) -> list[Refueling]:
+        result = await db.execute(data_query)
+        return result.scalars().all()
+
+    @staticmethod
+    def serialize_page(rows) -> list[dict]:
+        # Plain dicts can be shared between requests; ORM instances cannot.
+        return [RefuelingResponse.model_validate(row).model_dump() for row in rows]
+
+    @staticmethod
+    async def average_price(db: AsyncSession, fuel_type: str) -> Optional[Decimal]:
+        record_cache("price_statistics", price_statistics.is_fresh)
+        if not price_statistics.is_fresh and price_statistics.loaded_at is not None:
+            await price_statistics.load(db)
+        if price_statistics.is_fresh:
+            return price_statistics.average(fuel_type)
+
         result = await db.execute(
             select(func.avg(Refueling.price_per_liter))
-            .where(Refueling.fuel_type == data.fuel_type.value)
+            .where(Refueling.fuel_type == fuel_type)
         )
-        avg_price = result.scalar()
-
-        improper = False
-        if avg_price is not None:
-            avg_price_decimal = Decimal(str(avg_price))
-            if data.price_per_liter > avg_price_decimal * Decimal("1.25"):
-                improper = True
-                logger.warning(
-                    f"Anomalous price detected! Price: {data.price_per_liter}, "
-                    f"Average: {avg_price_decimal}, Threshold: {avg_price_decimal * Decimal('1.25')}"
-                )
-
-        refueling = Refueling(
+        return result.scalar()
+
+    @staticmethod
+    async def _is_improper(db: AsyncSession, data: RefuelingCreate) -> bool:
+        if ANOMALY_RULE == "percentile":
+            record_cache("price_thresholds", price_thresholds.is_fresh)
+            if not price_thresholds.is_fresh:
+                with timed_phase("stats"):
+                    await price_thresholds.load(db)
+            threshold = price_thresholds.threshold(data.fuel_type.value)
+            if threshold is not None:
+                if data.price_per_liter > threshold:
+                    logger.warning(
+                        "Anomalous price detected! Price: %s, p%s: %s",
+                        data.price_per_liter, ANOMALY_PERCENTILE * 100, threshold,
+                    )
+                    return True
+                return False
+
+        logger.debug("Calculating average price for fuel type: %s", data.fuel_type.value)
+
+        with timed_phase("stats"):
+            avg_price = await RefuelingService.average_price(db, data.fuel_type.value)
+
+        if avg_price is None:
+            return False
+        avg_price_decimal = Decimal(str(avg_price))
+        if data.price_per_liter > avg_price_decimal * Decimal("1.25"):
+            logger.warning(
+                "Anomalous price detected! Price: %s, Average: %s, Threshold: %s",
+                data.price_per_liter, avg_price_decimal, avg_price_decimal * Decimal("1.25"),
+            )
+            return True
+        return False
+
+    @staticmethod
+    def _build(data: RefuelingCreate, improper: bool, ingest_id: Optional[str] = None) -> Refueling:
+        # Recorded as it is built, so later records of a spooled batch are
+        # checked against the earlier ones.
+        flags = fraud_index.observe(data.driver_cpf, data.timestamp, data.station_id, data.volume_liters)
+        return Refueling(
             station_id=data.station_id,
-            timestamp=data.timestamp,
+            # Stored in UTC so SQL day boundaries match the UTC days of the
+            # data lake partitions and sketches on every backend.
+            timestamp=data.timestamp.astimezone(timezone.utc) if data.timestamp.tzinfo else data.timestamp,
             fuel_type=data.fuel_type.value,
             price_per_liter=data.price_per_liter,
             volume_liters=data.volume_liters,
             driver_cpf=data.driver_cpf,
             improper_data=improper,
+            fraud_flags=flags or None,
+            ingest_id=ingest_id,
             created_at=datetime.now(timezone.utc),
         )
 
-        db.add(refueling)
-        await db.commit()
-        await db.refresh(refueling)
-        
-        logger.debug(f"Refueling saved to database with ID: {refueling.id}")
+    @staticmethod
+    def _after_insert(refuelings: list[Refueling]) -> None:
+        for refueling in refuelings:
+            record_refueling(refueling.fuel_type, refueling.improper_data)
+        if not _ingest_listeners or not refuelings:
+            return
+        events = [RefuelingResponse.model_validate(r).model_dump(mode="json") for r in refuelings]
+        for listener in _ingest_listeners:
+            try:
+                listener(events)
+            except Exception as e:
+                logger.error("Ingest listener %s failed - %s", getattr(listener, "__qualname__", listener), e)
+
+    @staticmethod
+    async def create_refueling(db: AsyncSession, data: RefuelingCreate) -> Refueling:
+        improper = await RefuelingService._is_improper(db, data)
+        refueling = RefuelingService._build(data, improper)
+
+        with timed_phase("insert"):
+            db.add(refueling)
+            await ChangeFeedService.record_inserts(db, [refueling])
+            await db.commit()
+            await db.refresh(refueling)
+        price_statistics.add(refueling.fuel_type, Decimal(str(refueling.price_per_liter)))
+        RefuelingService._after_insert([refueling])
+
+        logger.debug("Refueling saved to database with ID: %s", refueling.id)
 
         return refueling
+
+    @staticmethod
+    async def create_refuelings(db: AsyncSession, records: list[tuple[str, RefuelingCreate]]) -> list[Refueling]:
+        """Inserts a batch of spooled refuelings in one transaction.
+
+        ``records`` pairs each payload with its spool record id. Ids already
+        in the table (a batch committed right before a crash, replayed again)
+        are skipped, which makes the replay exactly-once.
+        """
+        ids = [ingest_id for ingest_id, _ in records]
+        existing = set((await db.execute(
+            select(Refueling.ingest_id).where(Refueling.ingest_id.in_(ids))
+        )).scalars().all())
+
+        refuelings = []
+        for ingest_id, data in records:
+            if ingest_id in existing:
+                continue
+            existing.add(ingest_id)
+            improper = await RefuelingService._is_improper(db, data)
+            refuelings.append(RefuelingService._build(data, improper, ingest_id))
+            # Later records of the batch see the earlier ones in the average.
+            price_statistics.add(data.fuel_type.value, data.price_per_liter)
+
+        with timed_phase("insert"):
+            db.add_all(refuelings)
+            await ChangeFeedService.record_inserts(db, refuelings)
+            await db.commit()
+        RefuelingService._after_insert(refuelings)
+        return refuelings
+
+    @staticmethod
+    async def get_many(db: AsyncSession, ids: list[int]) -> list[Refueling]:
+        """Refuelings with the given ids, in the order asked for, in one query;
+        ids not in the table (or already archived) are left out."""
+        rows = (await db.execute(select(Refueling).where(Refueling.id.in_(ids)))).scalars().all()
+        by_id = {row.id: row for row in rows}
+        return [by_id[refueling_id] for refueling_id in dict.fromkeys(ids) if refueling_id in by_id]
+
+    @staticmethod
+    async def correct_improper(db: AsyncSession, corrections: dict[int, bool]) -> dict[int, str]:
+        """Sets ``improper_data`` per id; returns ``updated``, ``unchanged``
+        or ``not_found`` for each.
+
+        The rows are locked and read in one query, the ones that change are
+        written by a single ``UPDATE`` and their change feed entries go into
+        the same transaction. Ids already archived are read from the data
+        lake and only get the change feed entry. The lake sink copies every
+        such entry into its corrections, so lake reads (analytics,
+        ``include_archived`` pages, exports) pick the new value up too.
+        """
+        current = dict((await db.execute(
+            select(Refueling.id, Refueling.improper_data)
+            .where(Refueling.id.in_(list(corrections)))
+            .with_for_update()
+        )).all())
+        archived = {
+            row["id"]: row
+            for row in await asyncio.to_thread(
+                datalake.datalake_sink.fetch, [refueling_id for refueling_id in corrections if refueling_id not in current]
+            )
+        }
+        current.update({refueling_id: row["improper_data"] for refueling_id, row in archived.items()})
+        changed = [
+            refueling_id for refueling_id, improper in corrections.items()
+            if refueling_id in current and bool(current[refueling_id]) != improper
+        ]
+        rows = []
+        if changed:
+            flagged = [refueling_id for refueling_id in changed if corrections[refueling_id]]
+            with timed_phase("update"):
+                rows = (await db.execute(
+                    update(Refueling)
+                    .where(Refueling.id.in_([refueling_id for refueling_id in changed if refueling_id not in archived]))
+                    .values(improper_data=Refueling.id.in_(flagged))
+                    .returning(Refueling)
+                    .execution_options(synchronize_session=False)
+                )).scalars().all()
+                # Not added to the session: they only feed the change entries.
+                rows += [
+                    Refueling(**{**archived[refueling_id], "improper_data": corrections[refueling_id]})
+                    for refueling_id in changed if refueling_id in archived
+                ]
+                await ChangeFeedService.record_updates(db, rows)
+        await db.commit()
+
+        for row in rows:
+            record_improper_correction(row.fuel_type, row.improper_data)
+        if rows:
+            # Pages kept for outages would still show the old flag.
+            stale_pages.clear()
+        results = {
+            refueling_id: NOT_FOUND if refueling_id not in current else UNCHANGED
+            for refueling_id in corrections
+        }
+        results.update(dict.fromkeys(changed, UPDATED))
+        for result, count in Counter(results.values()).items():
+            REFUELING_CORRECTIONS.labels(result).inc(count)
+        return results
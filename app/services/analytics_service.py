@@ -0,0 +1,243 @@
+import asyncio
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Optional
+
+from sqlalchemy import Date, case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from app.core import datalake
+from app.core.logging_config import get_logger
+from app.core.metrics import ANALYTICS_QUERIES
+from app.models.abastecimento import Refueling
+
+logger = get_logger(__name__)
+
+# Ranges starting inside this window are answered from the OLTP tables alone;
+# older ones read everything the sink exported from the Parquet archive.
+ANALYTICS_HOT_WINDOW_DAYS = float(os.getenv("ANALYTICS_HOT_WINDOW_DAYS", "30"))
+ANALYTICS_DUCKDB_THREADS = int(os.getenv("ANALYTICS_DUCKDB_THREADS", "4"))
+
+OLTP, ARCHIVE = "oltp", "archive"
+AVG_PRICE_QUANTUM = Decimal("0.0001")
+
+
+def time_range(start: Optional[date], end: Optional[date]) -> tuple[Optional[datetime], Optional[datetime]]:
+    """Inclusive dates to a half-open UTC ``[start, end)`` range."""
+    start_dt = datetime.combine(start, time.min, tzinfo=timezone.utc) if start else None
+    end_dt = datetime.combine(end + timedelta(days=1), time.min, tzinfo=timezone.utc) if end else None
+    return start_dt, end_dt
+
+
+class utc_date(FunctionElement):
+    """UTC calendar day of a timestamp column, the day the Parquet ``date``
+    partition and the per-day sketches use. ``date()`` alone would follow
+    the PostgreSQL session time zone."""
+
+    type = Date()
+    name = "utc_date"
+    inherit_cache = True
+
+
+@compiles(utc_date)
+def _utc_date_default(element, compiler, **kw):
+    # SQLite has no time zones; ingestion stores timestamps in UTC.
+    return f"date({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(utc_date, "postgresql")
+def _utc_date_postgresql(element, compiler, **kw):
+    return f"CAST(timezone('UTC', {compiler.process(element.clauses, **kw)}) AS DATE)"
+
+
+class QueryPlan:
+    """Where each part of a range is read from.
+
+    Rows up to the sink's high-water mark come from Parquet, the rest from
+    OLTP, so the two parts never overlap; the OLTP part is an ``id`` range
+    scan over rows exported since the last flush.
+    """
+
+    def __init__(self, high_water_mark: int, use_archive: bool):
+        self.high_water_mark = high_water_mark if use_archive else 0
+        self.use_archive = use_archive
+
+    @property
+    def sources(self) -> list[str]:
+        return [ARCHIVE, OLTP] if self.use_archive else [OLTP]
+
+
+def plan_query(start: Optional[datetime], sink: Optional[datalake.ParquetSink] = None) -> QueryPlan:
+    sink = sink or datalake.datalake_sink
+    hot_since = datetime.now(timezone.utc) - timedelta(days=ANALYTICS_HOT_WINDOW_DAYS)
+    if start is not None and start >= hot_since:
+        return QueryPlan(0, use_archive=False)
+    high_water_mark = sink.high_water_mark
+    return QueryPlan(high_water_mark, use_archive=high_water_mark > 0)
+
+
+def _archive_query(sink: datalake.ParquetSink, plan: QueryPlan, select_sql: str, where: list[str],
+                   params: list[Any], group_by: str) -> list[tuple]:
+    conditions = " AND ".join(["id <= ?", *where])
+    sql = f"SELECT {select_sql} FROM {{source}} WHERE {conditions} GROUP BY {group_by}"
+    return sink.query(sql, [plan.high_water_mark, *params], threads=ANALYTICS_DUCKDB_THREADS)
+
+
+def _archive_filters(start, end, fuel_type=None, station_id=None) -> tuple[list[str], list[Any]]:
+    where, params = [], []
+    if start is not None:
+        where.append("timestamp >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("timestamp < ?")
+        params.append(end)
+    if fuel_type is not None:
+        # Partition column: only the matching directories are read.
+        where.append("fuel_type = ?")
+        params.append(fuel_type)
+    if station_id is not None:
+        where.append("station_id = ?")
+        params.append(station_id)
+    return where, params
+
+
+def _oltp_filters(query, plan: QueryPlan, start, end, fuel_type=None, station_id=None):
+    if plan.use_archive:
+        query = query.where(Refueling.id > plan.high_water_mark)
+    if start is not None:
+        query = query.where(Refueling.timestamp >= start)
+    if end is not None:
+        query = query.where(Refueling.timestamp < end)
+    if fuel_type is not None:
+        query = query.where(Refueling.fuel_type == fuel_type)
+    if station_id is not None:
+        query = query.where(Refueling.station_id == station_id)
+    return query
+
+
+async def _run(db: AsyncSession, plan: QueryPlan, report: str, oltp_query, archive_args) -> list[tuple]:
+    tasks = [db.execute(oltp_query)]
+    if plan.use_archive:
+        tasks.append(asyncio.to_thread(_archive_query, datalake.datalake_sink, plan, *archive_args))
+    results = await asyncio.gather(*tasks)
+    for source in plan.sources:
+        ANALYTICS_QUERIES.labels(report, source).inc()
+    rows = list(results[0].all())
+    if plan.use_archive:
+        rows.extend(results[1])
+    return rows
+
+
+def _decimal(value) -> Decimal:
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+class AnalyticsService:
+    @staticmethod
+    async def price_statistics(db: AsyncSession, start: Optional[date], end: Optional[date],
+                               fuel_type: Optional[str] = None) -> dict:
+        start_dt, end_dt = time_range(start, end)
+        plan = plan_query(start_dt)
+        oltp_query = _oltp_filters(
+            select(
+                Refueling.fuel_type,
+                func.count(Refueling.id),
+                func.sum(Refueling.price_per_liter),
+                func.min(Refueling.price_per_liter),
+                func.max(Refueling.price_per_liter),
+            ).group_by(Refueling.fuel_type),
+            plan, start_dt, end_dt, fuel_type,
+        )
+        where, params = _archive_filters(start_dt, end_dt, fuel_type)
+        rows = await _run(db, plan, "prices", oltp_query, (
+            "CAST(fuel_type AS VARCHAR), count(*), sum(price_per_liter), "
+            "min(price_per_liter), max(price_per_liter)",
+            where, params, "fuel_type",
+        ))
+
+        merged: dict[str, list] = {}
+        for key, count, total, low, high in rows:
+            if not count:
+                continue
+            entry = merged.setdefault(key, [0, Decimal("0"), None, None])
+            entry[0] += count
+            entry[1] += _decimal(total)
+            entry[2] = _decimal(low) if entry[2] is None else min(entry[2], _decimal(low))
+            entry[3] = _decimal(high) if entry[3] is None else max(entry[3], _decimal(high))
+        data = [
+            {
+                "fuel_type": key,
+                "count": count,
+                "avg_price": (total / count).quantize(AVG_PRICE_QUANTUM),
+                "min_price": low,
+                "max_price": high,
+            }
+            for key, (count, total, low, high) in sorted(merged.items())
+        ]
+        return {"sources": plan.sources, "data": data}
+
+    @staticmethod
+    async def volume_by_station_day(db: AsyncSession, start: Optional[date], end: Optional[date],
+                                    station_id: Optional[int] = None) -> dict:
+        start_dt, end_dt = time_range(start, end)
+        plan = plan_query(start_dt)
+        day = utc_date(Refueling.timestamp)
+        oltp_query = _oltp_filters(
+            select(
+                Refueling.station_id,
+                day,
+                func.sum(Refueling.volume_liters),
+                func.count(Refueling.id),
+            ).group_by(Refueling.station_id, day),
+            plan, start_dt, end_dt, station_id=station_id,
+        )
+        where, params = _archive_filters(start_dt, end_dt, station_id=station_id)
+        rows = await _run(db, plan, "volume", oltp_query, (
+            # The date partition is the UTC day of the refueling.
+            "station_id, CAST(date AS VARCHAR), sum(volume_liters), count(*)",
+            where, params, "station_id, date",
+        ))
+
+        merged: dict[tuple[int, str], list] = {}
+        for station, refueling_day, volume, count in rows:
+            key = (station, str(refueling_day)[:10])
+            entry = merged.setdefault(key, [Decimal("0"), 0])
+            entry[0] += _decimal(volume)
+            entry[1] += count
+        data = [
+            {"station_id": station, "date": refueling_day, "total_volume": volume, "count": count}
+            for (station, refueling_day), (volume, count) in sorted(merged.items())
+        ]
+        return {"sources": plan.sources, "data": data}
+
+    @staticmethod
+    async def anomaly_rates(db: AsyncSession, start: Optional[date], end: Optional[date]) -> dict:
+        start_dt, end_dt = time_range(start, end)
+        plan = plan_query(start_dt)
+        oltp_query = _oltp_filters(
+            select(
+                Refueling.fuel_type,
+                func.count(Refueling.id),
+                func.sum(case((Refueling.improper_data.is_(True), 1), else_=0)),
+            ).group_by(Refueling.fuel_type),
+            plan, start_dt, end_dt,
+        )
+        where, params = _archive_filters(start_dt, end_dt)
+        rows = await _run(db, plan, "anomalies", oltp_query, (
+            "CAST(fuel_type AS VARCHAR), count(*), count(*) FILTER (WHERE improper_data)",
+            where, params, "fuel_type",
+        ))
+
+        merged: dict[str, list] = {}
+        for key, total, improper in rows:
+            entry = merged.setdefault(key, [0, 0])
+            entry[0] += total
+            entry[1] += improper or 0
+        data = [
+            {"fuel_type": key, "total": total, "improper": improper, "rate": improper / total if total else 0.0}
+            for key, (total, improper) in sorted(merged.items())
+        ]
+        return {"sources": plan.sources, "data": data}
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import and_, delete, not_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import datalake
+from app.core.logging_config import get_logger
+from app.core.metrics import ARCHIVED_ROWS
+from app.models.abastecimento import Refueling
+from app.services import analytics_service
+from app.services.abastecimento_service import RefuelingService
+
+logger = get_logger(__name__)
+
+ARCHIVAL_ENABLED = os.getenv("ARCHIVAL_ENABLED", "false").lower() == "true"
+# Never shorter than ANALYTICS_HOT_WINDOW_DAYS: ranges inside the hot window
+# are answered from the OLTP tables alone.
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVAL_BATCH = int(os.getenv("ARCHIVAL_BATCH", "5000"))
+# Pause between delete chunks so replication and autovacuum keep up.
+ARCHIVAL_PAUSE_MS = float(os.getenv("ARCHIVAL_PAUSE_MS", "50"))
+ARCHIVAL_INTERVAL_SECONDS = float(os.getenv("ARCHIVAL_INTERVAL_SECONDS", "3600"))
+# include_archived pages merge the top offset+size rows of both sides in
+# memory, so they must end within this many rows.
+ARCHIVE_PAGE_MAX_ROWS = int(os.getenv("ARCHIVE_PAGE_MAX_ROWS", "10000"))
+
+_WINDOW_FILE = "_archive.json"
+
+_COLUMNS = (
+    "id, station_id, epoch_us(timestamp), CAST(fuel_type AS VARCHAR), price_per_liter, "
+    "volume_liters, driver_cpf, improper_data, epoch_us(created_at)"
+)
+
+
+class ArchiveWindow:
+    """Rows with ``timestamp < cutoff`` and ``id <= max_id`` belong to the
+    archive. Both bounds only grow, so the latest window covers every row
+    ever archived; it is written before the rows are deleted."""
+
+    def __init__(self, cutoff: datetime, max_id: int):
+        self.cutoff = cutoff
+        self.max_id = max_id
+
+    def contains(self):
+        return and_(Refueling.timestamp < self.cutoff, Refueling.id <= self.max_id)
+
+
+def read_window(sink: Optional[datalake.ParquetSink] = None) -> Optional[ArchiveWindow]:
+    sink = sink or datalake.datalake_sink
+    try:
+        with open(os.path.join(sink.directory, _WINDOW_FILE)) as f:
+            window = json.load(f)
+    except FileNotFoundError:
+        return None
+    return ArchiveWindow(datetime.fromisoformat(window["cutoff"]), window["max_id"])
+
+
+def _write_window(sink: datalake.ParquetSink, window: ArchiveWindow) -> None:
+    path = os.path.join(sink.directory, _WINDOW_FILE)
+    with sink.lock():
+        with open(path + ".tmp", "w") as f:
+            json.dump({"cutoff": window.cutoff.isoformat(), "max_id": window.max_id}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+
+def _from_epoch(us: int) -> datetime:
+    return datetime.fromtimestamp(us / 1_000_000, tz=timezone.utc)
+
+
+def count_archived(
+    sink: datalake.ParquetSink, window: ArchiveWindow, where: list[str], params: list, threads: int = 1
+) -> int:
+    conditions = " AND ".join(["timestamp < ?", "id <= ?", *where])
+    rows = sink.query(
+        f"SELECT count(*) FROM {{source}} WHERE {conditions}", [window.cutoff, window.max_id, *params], threads
+    )
+    return rows[0][0] if rows else 0
+
+
+def read_archived(
+    sink: datalake.ParquetSink,
+    window: ArchiveWindow,
+    where: list[str],
+    params: list,
+    tail: str = "",
+    threads: int = 1,
+) -> list[dict]:
+    """Archived rows (inside ``window``) matching ``where``, as dicts shaped
+    like the serialized refuelings; ``tail`` is appended to the query
+    (``ORDER BY``, ``LIMIT``) and its parameters go last in ``params``."""
+    conditions = " AND ".join(["timestamp < ?", "id <= ?", *where])
+    rows = sink.query(
+        f"SELECT {_COLUMNS} FROM {{source}} WHERE {conditions} {tail}",
+        [window.cutoff, window.max_id, *params],
+        threads,
+    )
+    return [
+        {
+            "id": row[0],
+            "station_id": row[1],
+            "timestamp": _from_epoch(row[2]),
+            "fuel_type": row[3],
+            "price_per_liter": row[4],
+            "volume_liters": row[5],
+            "driver_cpf": row[6],
+            "improper_data": row[7],
+            "created_at": _from_epoch(row[8]),
+        }
+        for row in rows
+    ]
+
+
+class ArchivalService:
+    @staticmethod
+    async def archive(
+        db: AsyncSession,
+        sink: Optional[datalake.ParquetSink] = None,
+        batch_size: int = ARCHIVAL_BATCH,
+        pause_ms: float = ARCHIVAL_PAUSE_MS,
+        now: Optional[datetime] = None,
+    ) -> int:
+        """Deletes archived rows from ``refuelings``; returns how many.
+
+        Only rows the data-lake sink already exported (``id`` up to its
+        high-water mark) are eligible, so the Parquet files are the archive.
+        Rows go in ascending primary-key chunks, one transaction each.
+        """
+        sink = sink or datalake.datalake_sink
+        horizon = max(ARCHIVE_AFTER_DAYS, analytics_service.ANALYTICS_HOT_WINDOW_DAYS)
+        cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=horizon)
+        high_water_mark = await asyncio.to_thread(lambda: sink.high_water_mark)
+        previous = await asyncio.to_thread(read_window, sink)
+        if previous is not None:
+            cutoff = max(cutoff, previous.cutoff)
+            high_water_mark = max(high_water_mark, previous.max_id)
+        if not high_water_mark:
+            logger.warning("Archival skipped: nothing has been exported to the data lake yet")
+            return 0
+        window = ArchiveWindow(cutoff, high_water_mark)
+        await asyncio.to_thread(_write_window, sink, window)
+
+        archived, last_id = 0, 0
+        while True:
+            ids = (await db.execute(
+                select(Refueling.id)
+                .where(Refueling.id > last_id, window.contains())
+                .order_by(Refueling.id)
+                .limit(batch_size)
+            )).scalars().all()
+            if not ids:
+                break
+            await db.execute(delete(Refueling).where(Refueling.id.in_(ids)))
+            await db.commit()
+            archived += len(ids)
+            last_id = ids[-1]
+            ARCHIVED_ROWS.inc(len(ids))
+            if pause_ms > 0:
+                await asyncio.sleep(pause_ms / 1000)
+        return archived
+
+    @staticmethod
+    async def page_with_archive(
+        db: AsyncSession,
+        oltp_count_query,
+        oltp_data_query,
+        archive_where: list[str],
+        archive_params: list,
+        offset: int,
+        size: int,
+    ) -> tuple[int, list[dict]]:
+        """One page (newest first) over the hot table plus the archive.
+
+        The OLTP queries get the archive window excluded, so rows still being
+        deleted are only read from Parquet; the top ``offset + size`` rows of
+        each side are merged by timestamp, hence the ``ARCHIVE_PAGE_MAX_ROWS``
+        bound (``ValueError`` past it).
+        """
+        if offset + size > ARCHIVE_PAGE_MAX_ROWS:
+            raise ValueError(
+                f"Pages with include_archived must end within the first {ARCHIVE_PAGE_MAX_ROWS} rows"
+            )
+        sink = datalake.datalake_sink
+        window = await asyncio.to_thread(read_window, sink)
+        if window is None:
+            total = (await db.execute(oltp_count_query)).scalar()
+            rows = (await db.execute(oltp_data_query.offset(offset).limit(size))).scalars().all()
+            return total, RefuelingService.serialize_page(rows)
+
+        outside = not_(window.contains())
+        threads = analytics_service.ANALYTICS_DUCKDB_THREADS
+
+        async def hot_side():
+            # One session: its statements cannot run concurrently.
+            total = await db.scalar(oltp_count_query.where(outside))
+            rows = (await db.execute(oltp_data_query.where(outside).limit(offset + size))).scalars().all()
+            return total, RefuelingService.serialize_page(rows)
+
+        (oltp_total, merged), archive_total, archive_rows = await asyncio.gather(
+            hot_side(),
+            asyncio.to_thread(count_archived, sink, window, archive_where, archive_params, threads),
+            asyncio.to_thread(
+                read_archived, sink, window, archive_where,
+                [*archive_params, offset + size], "ORDER BY timestamp DESC, id DESC LIMIT ?", threads,
+            ),
+        )
+        merged += archive_rows
+        merged.sort(key=lambda row: (_aware(row["timestamp"]), row["id"]), reverse=True)
+        return (oltp_total or 0) + archive_total, merged[offset:offset + size]
+
+
+def _aware(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def archive_filters(fuel_type: Optional[str] = None, refueling_date: Optional[date] = None,
+                    cpf: Optional[str] = None) -> tuple[list[str], list]:
+    where, params = [], []
+    if fuel_type:
+        where.append("fuel_type = ?")
+        params.append(fuel_type)
+    if refueling_date:
+        where.append("date = ?")
+        params.append(refueling_date)
+    if cpf:
+        where.append("driver_cpf = ?")
+        params.append(cpf)
+    return where, params
+
+
+async def archive_forever(session_factory, interval: float = ARCHIVAL_INTERVAL_SECONDS) -> None:
+    while True:
+        try:
+            async with session_factory() as session:
+                archived = await ArchivalService.archive(session)
+            if archived:
+                logger.info("Archived %s refuelings older than %s days", archived, ARCHIVE_AFTER_DAYS)
+        except Exception as e:
+            logger.warning("Archival failed, will retry - %s", e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,84 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.logging_config import get_logger
+from app.core.metrics import OUTBOX_PRUNED
+from app.models.abastecimento import Refueling, RefuelingChange
+from app.schemas.abastecimento import RefuelingResponse
+
+logger = get_logger(__name__)
+
+CHANGE_FEED_BATCH = int(os.getenv("CHANGE_FEED_BATCH", "1000"))
+CHANGE_FEED_MAX_BATCH = int(os.getenv("CHANGE_FEED_MAX_BATCH", "10000"))
+# Changes younger than this are held back: a sequence number can be taken by
+# a transaction that commits after a later one, and a consumer that already
+# moved past it would never see it.
+CHANGE_FEED_SETTLE_SECONDS = float(os.getenv("CHANGE_FEED_SETTLE_SECONDS", "2"))
+CHANGE_FEED_RETENTION_HOURS = float(os.getenv("CHANGE_FEED_RETENTION_HOURS", "168"))
+CHANGE_FEED_PRUNE_INTERVAL_SECONDS = float(os.getenv("CHANGE_FEED_PRUNE_INTERVAL_SECONDS", "3600"))
+
+INSERT, UPDATE = "insert", "update"
+
+
+class ChangeFeedService:
+    @staticmethod
+    async def record_inserts(db: AsyncSession, refuelings: list[Refueling]) -> None:
+        """Adds one outbox row per refueling to the caller's transaction.
+
+        Flushes first so the refuelings have ids; the caller commits both
+        together, so a refueling is never visible without its change.
+        """
+        await db.flush()
+        ChangeFeedService._record(db, refuelings, INSERT)
+
+    @staticmethod
+    async def record_updates(db: AsyncSession, refuelings: list[Refueling]) -> None:
+        """Same as ``record_inserts`` for rows changed in place; the payload
+        is the row after the change."""
+        ChangeFeedService._record(db, refuelings, UPDATE)
+
+    @staticmethod
+    def _record(db: AsyncSession, refuelings: list[Refueling], operation: str) -> None:
+        now = datetime.now(timezone.utc)
+        db.add_all([
+            RefuelingChange(
+                refueling_id=refueling.id,
+                operation=operation,
+                payload=RefuelingResponse.model_validate(refueling).model_dump(mode="json"),
+                created_at=now,
+            )
+            for refueling in refuelings
+        ])
+
+    @staticmethod
+    async def fetch_changes(db: AsyncSession, since: int, limit: int) -> list[RefuelingChange]:
+        query = select(RefuelingChange).where(RefuelingChange.seq > since)
+        if CHANGE_FEED_SETTLE_SECONDS > 0:
+            settled = datetime.now(timezone.utc) - timedelta(seconds=CHANGE_FEED_SETTLE_SECONDS)
+            query = query.where(RefuelingChange.created_at <= settled)
+        result = await db.execute(query.order_by(RefuelingChange.seq).limit(limit))
+        return result.scalars().all()
+
+    @staticmethod
+    async def prune(db: AsyncSession, retention_hours: float = CHANGE_FEED_RETENTION_HOURS) -> int:
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=retention_hours)
+        result = await db.execute(delete(RefuelingChange).where(RefuelingChange.created_at < cutoff))
+        await db.commit()
+        OUTBOX_PRUNED.inc(result.rowcount)
+        return result.rowcount
+
+
+async def prune_forever(session_factory, interval: float = CHANGE_FEED_PRUNE_INTERVAL_SECONDS) -> None:
+    while True:
+        try:
+            async with session_factory() as session:
+                pruned = await ChangeFeedService.prune(session)
+            if pruned:
+                logger.info("Pruned %s change feed entries older than %sh", pruned, CHANGE_FEED_RETENTION_HOURS)
+        except Exception as e:
+            logger.warning("Change feed pruning failed, will retry - %s", e)
+        await asyncio.sleep(interval)
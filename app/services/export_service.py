@@ -0,0 +1,427 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import shutil
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import and_, func, not_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import datalake
+from app.core.logging_config import get_logger
+from app.core.metrics import EXPORT_JOBS, EXPORT_ROWS
+from app.models.abastecimento import ExportJob, Refueling
+from app.services import analytics_service, archival_service
+
+logger = get_logger(__name__)
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "./exports")
+# Jobs running at once per process; the rest wait in the table.
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+# Queued plus running jobs accepted before new ones are refused.
+EXPORT_MAX_PENDING = int(os.getenv("EXPORT_MAX_PENDING", "100"))
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "5000"))
+EXPORT_POLL_SECONDS = float(os.getenv("EXPORT_POLL_SECONDS", "1"))
+# A running job whose worker stops renewing this lease is resumed by another.
+EXPORT_LEASE_SECONDS = float(os.getenv("EXPORT_LEASE_SECONDS", "60"))
+EXPORT_MAX_ATTEMPTS = int(os.getenv("EXPORT_MAX_ATTEMPTS", "3"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+COLUMNS = [
+    "id", "station_id", "timestamp", "fuel_type", "price_per_liter", "volume_liters",
+    "driver_cpf", "improper_data", "fraud_flags", "created_at",
+]
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("station_id", pa.int32()),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("fuel_type", pa.string()),
+    ("price_per_liter", pa.decimal128(10, 2)),
+    ("volume_liters", pa.decimal128(10, 2)),
+    ("driver_cpf", pa.string()),
+    ("improper_data", pa.bool_()),
+    ("fraud_flags", pa.list_(pa.string())),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+])
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _utc(value: datetime) -> datetime:
+    # SQLite hands timestamps back without tzinfo; they are stored in UTC.
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def artifact_path(job: ExportJob) -> str:
+    return os.path.join(EXPORT_DIR, f"{job.id}.{job.format}")
+
+
+class _TextWriter:
+    """CSV or NDJSON appended to ``<artifact>.part``; the checkpoint is the
+    byte size after the last committed batch, so a resumed job first cuts
+    off whatever a crashed worker wrote past it."""
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.part = path + ".part"
+        self.format = fmt
+
+    def prepare(self, checkpoint: int) -> bool:
+        os.makedirs(os.path.dirname(self.part) or ".", exist_ok=True)
+        if checkpoint == 0:
+            open(self.part, "wb").close()
+            return True
+        if not os.path.exists(self.part) or os.path.getsize(self.part) < checkpoint:
+            return False
+        os.truncate(self.part, checkpoint)
+        return True
+
+    def _encode(self, rows: list[dict], checkpoint: int) -> bytes:
+        rows = [
+            {column: value.isoformat() if isinstance(value, datetime) else value for column, value in row.items()}
+            for row in rows
+        ]
+        if self.format == "ndjson":
+            return "".join(
+                json.dumps(row, default=str, separators=(",", ":")) + "\n" for row in rows
+            ).encode()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if checkpoint == 0:
+            writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow([
+                "|".join(row[column]) if column == "fraud_flags" else row[column] for column in COLUMNS
+            ])
+        return buffer.getvalue().encode()
+
+    def write(self, rows: list[dict], checkpoint: int) -> int:
+        with open(self.part, "ab") as f:
+            f.write(self._encode(rows, checkpoint))
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def finish(self, checkpoint: int) -> None:
+        if checkpoint == 0:
+            # Nothing matched: a CSV still gets its header.
+            self.write([], 0)
+        os.replace(self.part, self.path)
+
+
+class _ParquetWriter:
+    """One Parquet file per batch under ``<artifact>.parts/``; the checkpoint
+    is how many of them are committed. ``finish`` streams them, in order,
+    into a single file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.parts = path + ".parts"
+
+    def _part(self, index: int) -> str:
+        return os.path.join(self.parts, f"{index:06d}.parquet")
+
+    def prepare(self, checkpoint: int) -> bool:
+        os.makedirs(self.parts, exist_ok=True)
+        if any(not os.path.exists(self._part(index)) for index in range(checkpoint)):
+            return False
+        for name in os.listdir(self.parts):
+            if not name.endswith(".parquet") or int(name.split(".")[0]) >= checkpoint:
+                os.remove(os.path.join(self.parts, name))
+        return True
+
+    def write(self, rows: list[dict], checkpoint: int) -> int:
+        tmp = self._part(checkpoint) + ".tmp"
+        pq.write_table(pa.Table.from_pylist(rows, schema=SCHEMA), tmp)
+        os.replace(tmp, self._part(checkpoint))
+        return checkpoint + 1
+
+    def finish(self, checkpoint: int) -> None:
+        tmp = self.path + ".tmp"
+        with pq.ParquetWriter(tmp, SCHEMA) as writer:
+            if checkpoint == 0:
+                writer.write_table(SCHEMA.empty_table())
+            for index in range(checkpoint):
+                writer.write_table(pq.read_table(self._part(index), schema=SCHEMA))
+        os.replace(tmp, self.path)
+        shutil.rmtree(self.parts, ignore_errors=True)
+
+
+def _writer(job: ExportJob):
+    path = artifact_path(job)
+    return _ParquetWriter(path) if job.format == "parquet" else _TextWriter(path, job.format)
+
+
+def _row(refueling: Refueling) -> dict:
+    return {
+        "id": refueling.id,
+        "station_id": refueling.station_id,
+        "timestamp": _utc(refueling.timestamp),
+        "fuel_type": refueling.fuel_type,
+        "price_per_liter": refueling.price_per_liter,
+        "volume_liters": refueling.volume_liters,
+        "driver_cpf": refueling.driver_cpf,
+        "improper_data": bool(refueling.improper_data),
+        "fraud_flags": refueling.fraud_flags or [],
+        "created_at": _utc(refueling.created_at),
+    }
+
+
+def _time_range(filters: dict) -> tuple[Optional[datetime], Optional[datetime]]:
+    start = date.fromisoformat(filters["start"]) if filters.get("start") else None
+    end = date.fromisoformat(filters["end"]) if filters.get("end") else None
+    return analytics_service.time_range(start, end)
+
+
+def _filtered(query, filters: dict):
+    start_dt, end_dt = _time_range(filters)
+    if start_dt is not None:
+        query = query.where(Refueling.timestamp >= start_dt)
+    if end_dt is not None:
+        query = query.where(Refueling.timestamp < end_dt)
+    if filters.get("fuel_type"):
+        query = query.where(Refueling.fuel_type == filters["fuel_type"])
+    if filters.get("station_id") is not None:
+        query = query.where(Refueling.station_id == filters["station_id"])
+    if filters.get("driver_cpf"):
+        query = query.where(Refueling.driver_cpf == filters["driver_cpf"])
+    return query
+
+
+def _archive_filters(filters: dict) -> tuple[list[str], list]:
+    """``_filtered`` for the archived partitions."""
+    start_dt, end_dt = _time_range(filters)
+    where, params = [], []
+    if start_dt is not None:
+        where.append("timestamp >= ?")
+        params.append(start_dt)
+    if end_dt is not None:
+        where.append("timestamp < ?")
+        params.append(end_dt)
+    if filters.get("fuel_type"):
+        where.append("fuel_type = ?")
+        params.append(filters["fuel_type"])
+    if filters.get("station_id") is not None:
+        where.append("station_id = ?")
+        params.append(filters["station_id"])
+    if filters.get("driver_cpf"):
+        where.append("driver_cpf = ?")
+        params.append(filters["driver_cpf"])
+    return where, params
+
+
+async def _count(db: AsyncSession, filters: dict) -> int:
+    window = await asyncio.to_thread(archival_service.read_window)
+    query = _filtered(select(func.count(Refueling.id)), filters)
+    if window is None:
+        return await db.scalar(query) or 0
+    # Rows still being deleted are counted on the archive side only.
+    hot = await db.scalar(query.where(not_(window.contains()))) or 0
+    where, params = _archive_filters(filters)
+    return hot + await asyncio.to_thread(
+        archival_service.count_archived, datalake.datalake_sink, window, where, params,
+        analytics_service.ANALYTICS_DUCKDB_THREADS,
+    )
+
+
+async def _next_batch(db: AsyncSession, filters: dict, last_id: int, batch_size: int) -> tuple[list[dict], bool]:
+    """The next ``batch_size`` rows past ``last_id`` from the hot table and
+    the archive merged by ``id``, and whether more may follow."""
+    hot = (await db.execute(
+        _filtered(select(Refueling), filters)
+        .where(Refueling.id > last_id)
+        .order_by(Refueling.id)
+        .limit(batch_size)
+    )).scalars().all()
+    # Read after the hot rows: anything archival deleted meanwhile is
+    # inside the window it wrote before deleting.
+    window = await asyncio.to_thread(archival_service.read_window)
+    if window is None:
+        return [_row(refueling) for refueling in hot], len(hot) == batch_size
+    where, params = _archive_filters(filters)
+    archived = await asyncio.to_thread(
+        archival_service.read_archived, datalake.datalake_sink, window,
+        [*where, "id > ?"], [*params, last_id, batch_size], "ORDER BY id LIMIT ?",
+        analytics_service.ANALYTICS_DUCKDB_THREADS,
+    )
+    # Rows pending deletion come from both sides; the hot copy has the fraud flags.
+    by_id = {row["id"]: {**row, "fraud_flags": []} for row in archived}
+    by_id.update({refueling.id: _row(refueling) for refueling in hot})
+    merged = [by_id[row_id] for row_id in sorted(by_id)]
+    more = len(hot) == batch_size or len(archived) == batch_size or len(merged) > batch_size
+    return merged[:batch_size], more
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class ExportService:
+    @staticmethod
+    async def pending(db: AsyncSession) -> int:
+        return await db.scalar(
+            select(func.count(ExportJob.id)).where(ExportJob.status.in_([QUEUED, RUNNING]))
+        ) or 0
+
+    @staticmethod
+    async def create(db: AsyncSession, fmt: str, filters: dict) -> ExportJob:
+        job = ExportJob(
+            id=uuid.uuid4().hex,
+            status=QUEUED,
+            format=fmt,
+            filters=filters,
+            exported_rows=0,
+            last_id=0,
+            checkpoint=0,
+            attempts=0,
+            created_at=datetime.now(timezone.utc),
+        )
+        db.add(job)
+        await db.commit()
+        return job
+
+    @staticmethod
+    async def get(db: AsyncSession, job_id: str) -> Optional[ExportJob]:
+        return await db.get(ExportJob, job_id, populate_existing=True)
+
+    @staticmethod
+    async def claim(db: AsyncSession) -> Optional[tuple[ExportJob, str]]:
+        """Takes the oldest queued job, or a running one whose lease expired
+        (its worker died), with a conditional update so exactly one worker
+        of any process wins it."""
+        now = datetime.now(timezone.utc)
+        claimable = or_(
+            ExportJob.status == QUEUED,
+            and_(ExportJob.status == RUNNING, ExportJob.lease_until < now),
+        )
+        candidates = (await db.execute(
+            select(ExportJob.id).where(claimable).order_by(ExportJob.created_at).limit(5)
+        )).scalars().all()
+        for job_id in candidates:
+            token = uuid.uuid4().hex
+            result = await db.execute(
+                update(ExportJob)
+                .where(ExportJob.id == job_id, claimable)
+                .values(
+                    status=RUNNING,
+                    worker=token,
+                    lease_until=now + timedelta(seconds=EXPORT_LEASE_SECONDS),
+                    started_at=func.coalesce(ExportJob.started_at, now),
+                )
+            )
+            await db.commit()
+            if result.rowcount == 1:
+                return await ExportService.get(db, job_id), token
+        return None
+
+    @staticmethod
+    async def _save(db: AsyncSession, job_id: str, token: str, **values) -> None:
+        """Updates the job only while ``token`` still holds it."""
+        result = await db.execute(
+            update(ExportJob).where(ExportJob.id == job_id, ExportJob.worker == token).values(**values)
+        )
+        await db.commit()
+        if result.rowcount != 1:
+            raise LeaseLost(job_id)
+
+    @staticmethod
+    async def run(
+        db: AsyncSession,
+        job: ExportJob,
+        token: str,
+        batch_size: int = EXPORT_BATCH,
+    ) -> None:
+        """Streams the job's rows to its file in ``id`` order, one committed
+        checkpoint per batch, starting from the last one. Rows already
+        moved to the archive are read from the data lake."""
+        job_id, fmt, filters = job.id, job.format, job.filters
+        last_id, exported, checkpoint = job.last_id, job.exported_rows, job.checkpoint
+        writer = _writer(job)
+        if not await asyncio.to_thread(writer.prepare, checkpoint):
+            logger.warning("Export %s checkpoint missing on disk, restarting from scratch", job_id)
+            last_id, exported, checkpoint = 0, 0, 0
+            await asyncio.to_thread(writer.prepare, 0)
+        if job.total_rows is None:
+            total = await _count(db, filters)
+            await ExportService._save(db, job_id, token, total_rows=total)
+
+        while True:
+            batch, more = await _next_batch(db, filters, last_id, batch_size)
+            if not batch:
+                break
+            checkpoint = await asyncio.to_thread(writer.write, batch, checkpoint)
+            last_id, exported = batch[-1]["id"], exported + len(batch)
+            await ExportService._save(
+                db, job_id, token,
+                last_id=last_id, exported_rows=exported, checkpoint=checkpoint,
+                lease_until=datetime.now(timezone.utc) + timedelta(seconds=EXPORT_LEASE_SECONDS),
+            )
+            EXPORT_ROWS.labels(fmt).inc(len(batch))
+            if not more:
+                break
+
+        await asyncio.to_thread(writer.finish, checkpoint)
+        await ExportService._save(
+            db, job_id, token, status=DONE, lease_until=None, finished_at=datetime.now(timezone.utc)
+        )
+        EXPORT_JOBS.labels(DONE).inc()
+        logger.info("Export %s finished: %s rows as %s", job_id, exported, fmt)
+
+    @staticmethod
+    async def process_next(db: AsyncSession) -> bool:
+        """Claims and runs one job; returns False when there was none."""
+        claimed = await ExportService.claim(db)
+        if claimed is None:
+            return False
+        job, token = claimed
+        job_id, attempts = job.id, job.attempts + 1
+        try:
+            await ExportService.run(db, job, token)
+        except LeaseLost:
+            logger.warning("Export %s was taken over by another worker", job_id)
+        except Exception as e:
+            await db.rollback()
+            failed = attempts >= EXPORT_MAX_ATTEMPTS
+            logger.error("Export %s failed (attempt %s) - %s", job_id, attempts, e)
+            try:
+                # Requeued with its checkpoint: the next attempt resumes.
+                await ExportService._save(
+                    db, job_id, token,
+                    status=FAILED if failed else QUEUED,
+                    attempts=attempts,
+                    error=str(e),
+                    worker=None,
+                    lease_until=None,
+                    finished_at=datetime.now(timezone.utc) if failed else None,
+                )
+            except LeaseLost:
+                pass
+            if failed:
+                EXPORT_JOBS.labels(FAILED).inc()
+        return True
+
+
+async def _export_worker(session_factory) -> None:
+    while True:
+        try:
+            async with session_factory() as session:
+                found = await ExportService.process_next(session)
+        except Exception as e:
+            logger.warning("Export worker failed, will retry - %s", e)
+            found = False
+        if not found:
+            await asyncio.sleep(EXPORT_POLL_SECONDS)
+
+
+async def export_workers_forever(session_factory, workers: int = EXPORT_WORKERS) -> None:
+    await asyncio.gather(*(_export_worker(session_factory) for _ in range(workers)))
@@ -0,0 +1,220 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.logging_config import get_logger
+from app.core.metrics import FRAUD_FLAGS, FRAUD_INDEX_DRIVERS
+from app.models.abastecimento import Refueling
+
+logger = get_logger(__name__)
+
+FRAUD_DETECTION_ENABLED = os.getenv("FRAUD_DETECTION_ENABLED", "true").lower() == "true"
+# Same driver at a different station within this many minutes (<= 0 disables).
+FRAUD_STATION_HOP_MINUTES = float(os.getenv("FRAUD_STATION_HOP_MINUTES", "30"))
+# Liters one driver can plausibly take in 24 hours (<= 0 disables).
+FRAUD_DAILY_VOLUME_LITERS = Decimal(os.getenv("FRAUD_DAILY_VOLUME_LITERS", "500"))
+FRAUD_BUCKET_MINUTES = float(os.getenv("FRAUD_BUCKET_MINUTES", "15"))
+# Refuelings inserted by other workers are pulled into the index this often.
+FRAUD_INDEX_SYNC_SECONDS = float(os.getenv("FRAUD_INDEX_SYNC_SECONDS", "5"))
+FRAUD_INDEX_SYNC_BATCH = int(os.getenv("FRAUD_INDEX_SYNC_BATCH", "10000"))
+
+STATION_HOP, DAILY_VOLUME = "station_hop", "daily_volume"
+DAY_SECONDS = 86400
+
+
+def _epoch(value: datetime) -> float:
+    return (value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value).timestamp()
+
+
+class _Bucket:
+    __slots__ = ("index", "volume", "events")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.volume = Decimal("0")
+        # (timestamp, station_id, volume)
+        self.events: list[tuple[float, int, Decimal]] = []
+
+
+class _DriverRing:
+    """Recent refuelings of one driver in time buckets.
+
+    Bucket ``n`` lives in slot ``n % size``, so a slot is reused once its
+    bucket leaves the window and memory per driver stays bounded.
+    """
+
+    __slots__ = ("slots", "latest")
+
+    def __init__(self):
+        self.slots: dict[int, _Bucket] = {}
+        self.latest = 0.0
+
+
+class FraudIndex:
+    """Sliding-window index of recent refuelings per ``driver_cpf``.
+
+    ``observe`` checks a refueling against the rules and records it in one
+    step, touching only the driver's own ring: a bounded number of buckets
+    with a handful of events each, so the cost does not grow with the table.
+    A refueling seen twice (same timestamp and station) is recorded once.
+    """
+
+    def __init__(
+        self,
+        hop_minutes: float = FRAUD_STATION_HOP_MINUTES,
+        daily_volume: Decimal = FRAUD_DAILY_VOLUME_LITERS,
+        bucket_minutes: float = FRAUD_BUCKET_MINUTES,
+    ):
+        self.hop_seconds = max(hop_minutes, 0) * 60
+        self.daily_volume = daily_volume
+        self.bucket_seconds = bucket_minutes * 60
+        self.window_seconds = max(DAY_SECONDS if daily_volume > 0 else 0, self.hop_seconds)
+        self.size = math.ceil(self.window_seconds / self.bucket_seconds) + 1
+        self._drivers: OrderedDict[str, _DriverRing] = OrderedDict()
+        self.watermark = 0.0
+        self.synced_id: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._drivers)
+
+    def _bucket(self, ring: _DriverRing, index: int) -> Optional[_Bucket]:
+        bucket = ring.slots.get(index % self.size)
+        return bucket if bucket is not None and bucket.index == index else None
+
+    def check(self, cpf: str, timestamp: datetime, station_id: int, volume: Decimal) -> list[str]:
+        ring = self._drivers.get(cpf)
+        flags = []
+        ts = _epoch(timestamp)
+
+        if self.hop_seconds > 0 and ring is not None:
+            first = math.floor((ts - self.hop_seconds) / self.bucket_seconds)
+            last = math.floor((ts + self.hop_seconds) / self.bucket_seconds)
+            if any(
+                abs(other_ts - ts) <= self.hop_seconds and other_station != station_id
+                for index in range(first, last + 1)
+                if (bucket := self._bucket(ring, index)) is not None
+                for other_ts, other_station, _ in bucket.events
+            ):
+                flags.append(STATION_HOP)
+
+        if self.daily_volume > 0:
+            since = ts - DAY_SECONDS
+            total = volume
+            for bucket in (ring.slots.values() if ring is not None else ()):
+                start = bucket.index * self.bucket_seconds
+                end = start + self.bucket_seconds
+                if end <= since or start > ts:
+                    continue
+                if start > since and end <= ts:
+                    total += bucket.volume
+                else:
+                    total += sum((v for other_ts, _, v in bucket.events if since < other_ts <= ts), Decimal("0"))
+            if total > self.daily_volume:
+                flags.append(DAILY_VOLUME)
+        return flags
+
+    def add(self, cpf: str, timestamp: datetime, station_id: int, volume: Decimal) -> None:
+        ts = _epoch(timestamp)
+        # Clamped to the clock so one far-future timestamp cannot evict everyone.
+        self.watermark = min(max(self.watermark, ts), time.time())
+        if ts <= self.watermark - self.window_seconds:
+            return
+        ring = self._drivers.get(cpf)
+        if ring is None:
+            ring = self._drivers[cpf] = _DriverRing()
+        else:
+            self._drivers.move_to_end(cpf)
+
+        index = math.floor(ts / self.bucket_seconds)
+        slot = index % self.size
+        bucket = ring.slots.get(slot)
+        if bucket is None or bucket.index < index:
+            bucket = ring.slots[slot] = _Bucket(index)
+        elif bucket.index > index:
+            # Older than everything the ring still holds for this driver.
+            return
+        if any(other_ts == ts and other_station == station_id for other_ts, other_station, _ in bucket.events):
+            return
+        bucket.events.append((ts, station_id, volume))
+        bucket.volume += volume
+        ring.latest = max(ring.latest, ts)
+        self._evict()
+
+    def observe(self, cpf: str, timestamp: datetime, station_id: int, volume: Decimal) -> list[str]:
+        """Flags for a new refueling, which is then added to the index."""
+        if not FRAUD_DETECTION_ENABLED:
+            return []
+        flags = self.check(cpf, timestamp, station_id, volume)
+        self.add(cpf, timestamp, station_id, volume)
+        for flag in flags:
+            FRAUD_FLAGS.labels(flag).inc()
+        if flags:
+            logger.warning("Suspicious refueling flagged %s - station: %s", flags, station_id)
+        return flags
+
+    def _evict(self) -> None:
+        # Least recently touched drivers first; amortized O(1) per add.
+        horizon = self.watermark - self.window_seconds
+        while self._drivers:
+            cpf, ring = next(iter(self._drivers.items()))
+            if ring.latest > horizon:
+                break
+            del self._drivers[cpf]
+        FRAUD_INDEX_DRIVERS.set(len(self._drivers))
+
+    async def sync(self, db: AsyncSession, batch_size: int = FRAUD_INDEX_SYNC_BATCH) -> int:
+        """Adds refuelings committed since the last sync; returns how many.
+
+        The first call rebuilds the index from the rows inside the window.
+        Rows this process inserted itself are already in and count once.
+        """
+        query = select(
+            Refueling.id, Refueling.driver_cpf, Refueling.timestamp, Refueling.station_id, Refueling.volume_liters
+        )
+        floor = self.synced_id or 0
+        if self.synced_id is None:
+            since = datetime.now(timezone.utc) - timedelta(seconds=self.window_seconds)
+            query = query.where(Refueling.timestamp >= since)
+            # Later syncs start past every row that existed, in the window or not.
+            floor = await db.scalar(select(func.max(Refueling.id))) or 0
+        last_id, loaded = self.synced_id or 0, 0
+        while True:
+            rows = (await db.execute(
+                query.where(Refueling.id > last_id).order_by(Refueling.id).limit(batch_size)
+            )).all()
+            for _, cpf, timestamp, station_id, volume in rows:
+                self.add(cpf, timestamp, station_id, Decimal(str(volume)))
+            loaded += len(rows)
+            if rows:
+                last_id = rows[-1][0]
+            if len(rows) < batch_size:
+                break
+        self.synced_id = max(last_id, floor)
+        return loaded
+
+    def clear(self) -> None:
+        self._drivers.clear()
+        self.watermark = 0.0
+        self.synced_id = None
+        FRAUD_INDEX_DRIVERS.set(0)
+
+
+fraud_index = FraudIndex()
+
+
+async def sync_forever(session_factory, interval: float = FRAUD_INDEX_SYNC_SECONDS) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_factory() as session:
+                await fraud_index.sync(session)
+        except Exception as e:
+            logger.warning("Fraud index sync failed, will retry - %s", e)
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import os
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database, datalake
+from app.core.logging_config import get_logger
+from app.core.sketches import SKETCH_HISTOGRAM_BUCKET, BucketHistogram, sketch_store
+from app.models.abastecimento import Refueling
+from app.services import analytics_service
+from app.services.unique_drivers_service import event_day
+
+logger = get_logger(__name__)
+
+PRICE_HISTOGRAMS = "price_histograms"
+# Newest refueling ids a rebuild checks for gaps (rows still being inserted);
+# deltas for those ids are kept when they arrive after the rebuild.
+HISTOGRAM_REBUILD_GAP_WINDOW = int(os.getenv("HISTOGRAM_REBUILD_GAP_WINDOW", "10000"))
+
+sketch_store.register(PRICE_HISTOGRAMS, BucketHistogram)
+
+
+def _histogram_key(fuel_type: str, station_id: int, day: date) -> str:
+    return f"{fuel_type}:{station_id}:{day.isoformat()}"
+
+
+def record_price_histograms(events: list[dict]) -> None:
+    """Ingest listener: counts each price in its fuel type, station and day histogram."""
+    for event in events:
+        day = event_day(event)
+        key = _histogram_key(event["fuel_type"], event["station_id"], day)
+        sketch_store.pending(PRICE_HISTOGRAMS, key, day, event["id"]).add(Decimal(str(event["price_per_liter"])))
+
+
+class HistogramService:
+    @staticmethod
+    async def price_histogram(
+        db: AsyncSession,
+        start: date,
+        end: date,
+        fuel_type: Optional[str] = None,
+        station_id: Optional[int] = None,
+        bucket_width: Optional[Decimal] = None,
+    ) -> dict:
+        """Price distribution per fuel type over ``[start, end]``: the sum of
+        the daily bucket counters, so the cost depends on the number of
+        stations and days, not on how many refuelings they hold."""
+        prefix = f"{fuel_type}:" if fuel_type else ""
+        if fuel_type and station_id is not None:
+            prefix += f"{station_id}:"
+        stored = await sketch_store.fetch(db, PRICE_HISTOGRAMS, prefix, start, end)
+        merged: dict[str, BucketHistogram] = {}
+        for key, histogram in stored.items():
+            key_fuel, key_station, _ = key.split(":")
+            if station_id is not None and int(key_station) != station_id:
+                continue
+            if key_fuel in merged:
+                merged[key_fuel].merge(histogram)
+            else:
+                merged[key_fuel] = histogram
+
+        data = []
+        for key_fuel, histogram in sorted(merged.items()):
+            if bucket_width is not None and bucket_width != histogram.width:
+                histogram = histogram.coarsen(bucket_width)
+            data.append({
+                "fuel_type": key_fuel,
+                "station_id": station_id,
+                "bucket_width": histogram.width,
+                "count": histogram.n,
+                "buckets": [
+                    {"lower": lower, "upper": upper, "count": count}
+                    for lower, upper, count in histogram.buckets()
+                ],
+            })
+        return {"sources": ["sketch"], "data": data}
+
+    @staticmethod
+    async def rebuild(
+        db: AsyncSession,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        width: Decimal = SKETCH_HISTOGRAM_BUCKET,
+    ) -> int:
+        """Recomputes the price histograms of ``[start, end]`` (everything
+        when open) from the refuelings; returns how many were written.
+
+        Rows are counted per distinct price and UTC day, from the data lake
+        up to its high-water mark and from the OLTP table past it, as the
+        analytics reports do. The counted ids are recorded on the rebuilt
+        rows, so deltas any worker still holds for them are dropped rather
+        than counted twice, and rows committed after the read still count.
+        """
+        start_dt, end_dt = analytics_service.time_range(start, end)
+        plan = analytics_service.plan_query(start_dt)
+        histograms: dict[str, tuple[date, BucketHistogram]] = {}
+
+        async def build():
+            through = (await db.execute(select(func.max(Refueling.id)))).scalar() or 0
+            present = set((await db.execute(
+                select(Refueling.id).where(Refueling.id > through - HISTOGRAM_REBUILD_GAP_WINDOW)
+            )).scalars())
+            missing = [
+                row_id for row_id in range(max(through - HISTOGRAM_REBUILD_GAP_WINDOW, 0) + 1, through + 1)
+                if row_id not in present
+            ]
+            # The ids read above, not whatever commits from now on.
+            day = analytics_service.utc_date(Refueling.timestamp)
+            query = select(
+                Refueling.fuel_type, Refueling.station_id, day, Refueling.price_per_liter, func.count(Refueling.id)
+            ).where(Refueling.id <= through).group_by(
+                Refueling.fuel_type, Refueling.station_id, day, Refueling.price_per_liter
+            )
+            if missing:
+                query = query.where(Refueling.id.notin_(missing))
+            if plan.use_archive:
+                query = query.where(Refueling.id > plan.high_water_mark)
+            if start_dt is not None:
+                query = query.where(Refueling.timestamp >= start_dt)
+            if end_dt is not None:
+                query = query.where(Refueling.timestamp < end_dt)
+            rows = list((await db.execute(query)).all())
+            if plan.use_archive:
+                rows.extend(await _archived_rows(plan.high_water_mark, start_dt, end_dt))
+
+            for fuel, station, refueling_day, price, count in rows:
+                refueling_day = date.fromisoformat(str(refueling_day)[:10])
+                key = _histogram_key(fuel, station, refueling_day)
+                if key not in histograms:
+                    histograms[key] = (refueling_day, BucketHistogram(width))
+                histograms[key][1].add(Decimal(str(price)), count)
+            return histograms, through, missing
+
+        written = await sketch_store.replace(db, PRICE_HISTOGRAMS, build, start, end)
+        logger.info("Rebuilt %s price histograms from %s", written, "+".join(plan.sources))
+        return written
+
+
+async def _archived_rows(high_water_mark: int, start_dt, end_dt) -> list:
+    where, params = ["id <= ?"], [high_water_mark]
+    if start_dt is not None:
+        where.append("timestamp >= ?")
+        params.append(start_dt)
+    if end_dt is not None:
+        where.append("timestamp < ?")
+        params.append(end_dt)
+    return await asyncio.to_thread(
+        datalake.datalake_sink.query,
+        "SELECT CAST(fuel_type AS VARCHAR), station_id, CAST(date AS VARCHAR), price_per_liter, count(*) "
+        f"FROM {{source}} WHERE {' AND '.join(where)} "
+        "GROUP BY fuel_type, station_id, date, price_per_liter",
+        params,
+        analytics_service.ANALYTICS_DUCKDB_THREADS,
+    )
+
+
+async def _rebuild(start: Optional[date], end: Optional[date]) -> None:
+    async with database.AsyncSessionLocal() as session:
+        written = await HistogramService.rebuild(session, start, end)
+    print(f"Rebuilt {written} price histograms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the price histogram counters from the refuelings")
+    parser.add_argument("--start", type=date.fromisoformat, help="First day (inclusive); default: all")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last day (inclusive); default: all")
+    args = parser.parse_args()
+    asyncio.run(_rebuild(args.start, args.end))
@@ -0,0 +1,65 @@
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.sketches import KllSketch, sketch_store
+
+PRICES = "prices"
+PERCENTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))
+PRICE_QUANTUM = Decimal("0.01")
+
+sketch_store.register(PRICES, KllSketch)
+
+
+def _price_key(fuel_type: str, station_id: int) -> str:
+    return f"{fuel_type}:{station_id}"
+
+
+def record_prices(events: list[dict]) -> None:
+    """Ingest listener: adds each price to its fuel type and station sketch."""
+    for event in events:
+        key = _price_key(event["fuel_type"], event["station_id"])
+        sketch_store.pending(PRICES, key).update(float(event["price_per_liter"]))
+
+
+def _price(value: Optional[float]) -> Optional[Decimal]:
+    return None if value is None else Decimal(str(value)).quantize(PRICE_QUANTUM)
+
+
+class PercentileService:
+    @staticmethod
+    async def fuel_sketches(
+        db: AsyncSession, fuel_type: Optional[str] = None, station_id: Optional[int] = None
+    ) -> dict[str, KllSketch]:
+        """Price sketches merged per fuel type (optionally of one station)."""
+        stored = await sketch_store.fetch(db, PRICES, f"{fuel_type}:" if fuel_type else "")
+        merged: dict[str, KllSketch] = {}
+        for key, sketch in stored.items():
+            key_fuel, key_station = key.split(":", 1)
+            if station_id is not None and int(key_station) != station_id:
+                continue
+            if key_fuel in merged:
+                merged[key_fuel].merge(sketch)
+            else:
+                merged[key_fuel] = sketch
+        return merged
+
+    @staticmethod
+    async def price_percentiles(
+        db: AsyncSession, fuel_type: Optional[str] = None, station_id: Optional[int] = None
+    ) -> dict:
+        sketches = await PercentileService.fuel_sketches(db, fuel_type, station_id)
+        data = [
+            {
+                "fuel_type": key,
+                "station_id": station_id,
+                "count": sketch.n,
+                "min_price": _price(sketch.min),
+                **{name: _price(sketch.quantile(q)) for name, q in PERCENTILES},
+                "max_price": _price(sketch.max),
+            }
+            for key, sketch in sorted(sketches.items())
+            if sketch.n
+        ]
+        return {"sources": ["sketch"], "data": data}
@@ -0,0 +1,114 @@
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import desc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.sketches import SpaceSaving, sketch_store
+from app.models.abastecimento import Refueling
+from app.services.unique_drivers_service import event_day
+
+VALUE_QUANTUM = Decimal("0.01")
+
+
+class Leaderboard:
+    """A leaderboard: what is ranked and by which amount, both on ingest
+    (from the serialized refueling) and as exact SQL for verification."""
+
+    def __init__(self, name: str, event_key, event_weight, sql_key, sql_value):
+        self.name = name
+        self.kind = f"top_{name}"
+        self.event_key = event_key
+        self.event_weight = event_weight
+        self.sql_key = sql_key
+        self.sql_value = sql_value
+
+
+LEADERBOARDS = {
+    board.name: board
+    for board in (
+        Leaderboard(
+            "driver_liters",
+            lambda e: e["driver_cpf"], lambda e: float(e["volume_liters"]),
+            Refueling.driver_cpf, func.sum(Refueling.volume_liters),
+        ),
+        Leaderboard(
+            "driver_spend",
+            lambda e: e["driver_cpf"], lambda e: float(e["volume_liters"]) * float(e["price_per_liter"]),
+            Refueling.driver_cpf, func.sum(Refueling.volume_liters * Refueling.price_per_liter),
+        ),
+        Leaderboard(
+            "station_liters",
+            lambda e: str(e["station_id"]), lambda e: float(e["volume_liters"]),
+            Refueling.station_id, func.sum(Refueling.volume_liters),
+        ),
+    )
+}
+
+for _board in LEADERBOARDS.values():
+    sketch_store.register(_board.kind, SpaceSaving)
+
+
+def record_rankings(events: list[dict]) -> None:
+    """Ingest listener: adds each refueling to every daily leaderboard."""
+    for event in events:
+        day = event_day(event)
+        for board in LEADERBOARDS.values():
+            sketch_store.pending(board.kind, day.isoformat(), day).add(board.event_key(event), board.event_weight(event))
+
+
+def _value(value) -> Decimal:
+    return Decimal(str(value)).quantize(VALUE_QUANTUM)
+
+
+class RankingService:
+    @staticmethod
+    async def ranking(
+        db: AsyncSession,
+        metric_name: str,
+        days: int,
+        limit: int,
+        verify: bool = False,
+        today: Optional[date] = None,
+    ) -> dict:
+        """Top ``limit`` keys over the last ``days`` UTC days (today included),
+        from the union of the daily top-K sketches."""
+        board = LEADERBOARDS[metric_name]
+        end = today or datetime.now(timezone.utc).date()
+        start = end - timedelta(days=days - 1)
+
+        union = SpaceSaving()
+        for sketch in (await sketch_store.fetch(db, board.kind, start=start, end=end)).values():
+            union.merge(sketch)
+        data = [
+            {"rank": rank, "key": key, "value": _value(count), "error": _value(error)}
+            for rank, (key, count, error) in enumerate(union.top(limit), start=1)
+        ]
+        result = {"metric": metric_name, "start": start, "end": end, "sources": ["sketch"], "data": data}
+        if verify:
+            exact = await RankingService.exact_ranking(db, board, start, end, limit)
+            result["verification"] = {
+                "exact": exact,
+                "matches": [row["key"] for row in data] == [row["key"] for row in exact],
+            }
+        return result
+
+    @staticmethod
+    async def exact_ranking(db: AsyncSession, board: Leaderboard, start: date, end: date, limit: int) -> list[dict]:
+        """The same ranking with a GROUP BY over ``refuelings`` (hot rows only)."""
+        total = board.sql_value.label("total")
+        rows = (await db.execute(
+            select(board.sql_key, total)
+            .where(
+                Refueling.timestamp >= datetime.combine(start, time.min, tzinfo=timezone.utc),
+                Refueling.timestamp < datetime.combine(end + timedelta(days=1), time.min, tzinfo=timezone.utc),
+            )
+            .group_by(board.sql_key)
+            .order_by(desc(total), desc(board.sql_key))
+            .limit(limit)
+        )).all()
+        return [
+            {"rank": rank, "key": str(key), "value": _value(value), "error": Decimal("0.00")}
+            for rank, (key, value) in enumerate(rows, start=1)
+        ]
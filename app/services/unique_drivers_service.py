@@ -0,0 +1,62 @@
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.sketches import HyperLogLog, sketch_store
+
+DRIVERS = "drivers"
+
+sketch_store.register(DRIVERS, HyperLogLog)
+
+
+def event_day(event: dict) -> date:
+    """UTC day of a serialized refueling (the same day the data lake uses)."""
+    timestamp = datetime.fromisoformat(event["timestamp"])
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc).date()
+
+
+def record_drivers(events: list[dict]) -> None:
+    """Ingest listener: adds each CPF to its station, day and fuel type sketch."""
+    for event in events:
+        day = event_day(event)
+        key = f"{event['station_id']}:{day.isoformat()}:{event['fuel_type']}"
+        sketch_store.pending(DRIVERS, key, day).add(event["driver_cpf"])
+
+
+class UniqueDriversService:
+    @staticmethod
+    async def distinct_drivers(
+        db: AsyncSession,
+        start: date,
+        end: date,
+        station_id: Optional[int] = None,
+        fuel_type: Optional[str] = None,
+    ) -> dict:
+        """Distinct drivers per station over ``[start, end]``: the union of
+        the station's daily sketches, so a driver seen on several days (or
+        fuel types) counts once."""
+        sketches = await sketch_store.fetch(
+            db, DRIVERS, f"{station_id}:" if station_id is not None else "", start, end
+        )
+        unions: dict[int, HyperLogLog] = {}
+        for key, sketch in sketches.items():
+            key_station, _, key_fuel = key.split(":")
+            if fuel_type is not None and key_fuel != fuel_type:
+                continue
+            station = int(key_station)
+            if station in unions:
+                unions[station].merge(sketch)
+            else:
+                unions[station] = sketch
+        data = [
+            {
+                "station_id": station,
+                "distinct_drivers": round(union.estimate()),
+                "standard_error": union.standard_error,
+            }
+            for station, union in sorted(unions.items())
+        ]
+        return {"sources": ["sketch"], "data": data}
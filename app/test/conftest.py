@@ -1,6 +1,8 @@
 import os
 os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///./test.db"
 
+from datetime import datetime, timezone
+
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
@@ -51,3 +53,24 @@ async def client(db_session):
         yield c
 
     app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def refueling_payload():
+    """Builds ``POST /api/v1/abastecimentos`` bodies: ``refueling_payload(cpf,
+    station_id=..., price_per_liter=...)``; ``timestamp`` may be a datetime."""
+    def make(driver_cpf, **fields):
+        payload = {
+            "station_id": 1,
+            "timestamp": datetime.now(timezone.utc),
+            "fuel_type": "GASOLINA",
+            "price_per_liter": "5.40",
+            "volume_liters": "40",
+            "driver_cpf": driver_cpf,
+            **fields,
+        }
+        if isinstance(payload["timestamp"], datetime):
+            payload["timestamp"] = payload["timestamp"].isoformat()
+        return payload
+
+    return make
@@ -4,6 +4,7 @@ from datetime import datetime, timezone
 
 @pytest.mark.asyncio
 async def test_create_refueling_direct_call(db_session):
+    from fastapi import Response
     from app.api.v1.abastecimento import create_refueling
     from app.schemas.abastecimento import RefuelingCreate
     
@@ -16,6 +17,6 @@ async def test_create_refueling_direct_call(db_session):
         driver_cpf="11122233344",
     )
     
-    result = await create_refueling(payload, db=db_session, api_key="test-key")
+    result = await create_refueling(payload, Response(), db=db_session, api_key="test-key")
     assert result.id > 0
     assert hasattr(result, "improper_data")
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+
+import pytest
+
+from app.core import admission as admission_module
+from app.core.admission import AdmissionController, Rejected, RouteClass
+
+
+def _controller(capacity=1, read_cap=1, read_queue=5, read_wait_ms=1000, ingest_queue=5):
+    return AdmissionController(
+        capacity,
+        [
+            RouteClass("ingest", 0, capacity, ingest_queue, 1000),
+            RouteClass("read", 1, read_cap, read_queue, read_wait_ms),
+        ],
+    )
+
+
+@pytest.mark.asyncio
+async def test_waiter_is_admitted_when_slot_frees():
+    controller = _controller(capacity=1)
+    await controller.acquire("read")
+
+    waiting = asyncio.create_task(controller.acquire("read"))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    controller.release("read")
+    assert await waiting >= 0
+    assert controller.active == 1
+
+
+@pytest.mark.asyncio
+async def test_ingestion_waiters_go_before_reads():
+    controller = _controller(capacity=1)
+    await controller.acquire("read")
+    order = []
+
+    async def enter(name):
+        await controller.acquire(name)
+        order.append(name)
+
+    read = asyncio.create_task(enter("read"))
+    await asyncio.sleep(0)
+    ingest = asyncio.create_task(enter("ingest"))
+    await asyncio.sleep(0)
+
+    controller.release("read")
+    await asyncio.sleep(0)
+    controller.release("ingest")
+    await asyncio.gather(read, ingest)
+    assert order == ["ingest", "read"]
+
+
+@pytest.mark.asyncio
+async def test_read_cap_keeps_slots_for_ingestion():
+    controller = _controller(capacity=2, read_cap=1, read_queue=0)
+    await controller.acquire("read")
+    with pytest.raises(Rejected) as exc:
+        await controller.acquire("read")
+    assert exc.value.status_code == 429
+    assert await controller.acquire("ingest") == 0.0
+
+
+@pytest.mark.asyncio
+async def test_wait_budget_exceeded_returns_503():
+    controller = _controller(capacity=1, read_wait_ms=10)
+    await controller.acquire("read")
+    with pytest.raises(Rejected) as exc:
+        await controller.acquire("read")
+    assert exc.value.status_code == 503
+    assert exc.value.retry_after >= 1
+    assert not controller.classes["read"].waiters
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_slot():
+    controller = _controller(capacity=1)
+    await controller.acquire("read")
+    waiting = asyncio.create_task(controller.acquire("read"))
+    await asyncio.sleep(0)
+    waiting.cancel()
+    await asyncio.gather(waiting, return_exceptions=True)
+
+    controller.release("read")
+    assert controller.active == 0
+    assert await controller.acquire("read") == 0.0
+
+
+@pytest.mark.asyncio
+async def test_middleware_sheds_with_retry_after(client, monkeypatch):
+    monkeypatch.setattr(admission_module, "admission", _controller(capacity=0, read_queue=0))
+
+    response = await client.get("/api/v1/abastecimentos")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+    health = await client.get("/health/live")
+    assert health.status_code == 200
+
+
+def test_parse_route_limits_matches_templates():
+    routes = admission_module.parse_route_limits(
+        "GET /api/v1/motoristas/{cpf}/historico=2:3:100, bad, POST /x=1:1"
+    )
+    assert len(routes) == 1
+    method, template, pattern, route_class = routes[0]
+    assert (method, template) == ("GET", "/api/v1/motoristas/{cpf}/historico")
+    assert pattern.match("/api/v1/motoristas/52998224725/historico")
+    assert not pattern.match("/api/v1/motoristas/1/2/historico")
+    assert (route_class.max_concurrency, route_class.max_queue, route_class.max_wait) == (2, 3, 0.1)
+
+
+@pytest.mark.asyncio
+async def test_route_limit_sheds_one_route_only(client, monkeypatch, caplog):
+    routes = admission_module.parse_route_limits("GET /api/v1/motoristas/{cpf}/historico=0:0:100")
+    monkeypatch.setattr(admission_module, "route_limits", routes)
+    monkeypatch.setattr(
+        admission_module,
+        "route_admission",
+        AdmissionController(float("inf"), [route_class for *_, route_class in routes]),
+    )
+
+    with caplog.at_level(logging.WARNING, logger="app.core.admission"):
+        response = await client.get("/api/v1/motoristas/52998224725/historico")
+    assert response.status_code == 429
+    messages = [r.getMessage() for r in caplog.records if r.name == "app.core.admission"]
+    assert any("/api/v1/motoristas/*********25/historico" in m for m in messages)
+    assert not any("52998224725" in m for m in messages)
+
+    response = await client.get("/api/v1/abastecimentos")
+    assert response.status_code == 200
+    assert admission_module.admission.active == 0
@@ -0,0 +1,132 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql
+
+from app.core import datalake
+from app.core.datalake import ParquetSink
+from app.models.abastecimento import Refueling
+from app.services import analytics_service
+
+STATION = 4242
+RANGE = {"start": "2024-02-01", "end": "2024-02-29"}
+
+
+@pytest.fixture
+def lake(tmp_path, monkeypatch):
+    sink = ParquetSink(str(tmp_path))
+    monkeypatch.setattr(datalake, "datalake_sink", sink)
+    monkeypatch.setattr(datalake, "DATALAKE_GAP_TIMEOUT_SECONDS", 0)
+    return sink
+
+
+async def _insert(db_session, rows):
+    refuelings = [
+        Refueling(
+            station_id=STATION,
+            timestamp=datetime(2024, 2, day, 12, tzinfo=timezone.utc),
+            fuel_type=fuel_type,
+            price_per_liter=Decimal(price),
+            volume_liters=Decimal(volume),
+            driver_cpf="11144477735",
+            improper_data=improper,
+            created_at=datetime.now(timezone.utc),
+        )
+        for day, fuel_type, price, volume, improper in rows
+    ]
+    db_session.add_all(refuelings)
+    await db_session.commit()
+    return refuelings
+
+
+def _by(rows, key):
+    return {row[key]: row for row in rows}
+
+
+@pytest.mark.asyncio
+async def test_reports_merge_archive_and_oltp_without_double_counting(client, db_session, lake):
+    await _insert(db_session, [
+        (5, "DIESEL", "4.00", "10.00", False),
+        (5, "DIESEL", "6.00", "20.00", True),
+    ])
+    assert await lake.flush(db_session) > 0
+    # Inserted after the flush: only OLTP has these.
+    await _insert(db_session, [(6, "DIESEL", "5.00", "30.00", False)])
+
+    prices = (await client.get("/api/v1/estatisticas/precos", params={**RANGE, "fuel_type": "DIESEL"})).json()
+    assert prices["sources"] == ["archive", "oltp"]
+    diesel = _by(prices["data"], "fuel_type")["DIESEL"]
+    assert diesel["count"] == 3
+    assert Decimal(diesel["avg_price"]) == Decimal("5.0000")
+    assert Decimal(diesel["min_price"]) == Decimal("4.00")
+    assert Decimal(diesel["max_price"]) == Decimal("6.00")
+
+    volume = (await client.get("/api/v1/estatisticas/volume", params={**RANGE, "station_id": STATION})).json()
+    days = _by(volume["data"], "date")
+    assert Decimal(days["2024-02-05"]["total_volume"]) == Decimal("30.00")
+    assert days["2024-02-05"]["count"] == 2
+    assert Decimal(days["2024-02-06"]["total_volume"]) == Decimal("30.00")
+
+
+@pytest.mark.asyncio
+async def test_station_days_are_utc_days(client, lake):
+    # 22:30 in Brasília is already the next day in UTC, the day the lake partitions by.
+    response = await client.post("/api/v1/abastecimentos", json={
+        "station_id": STATION + 1,
+        "timestamp": "2024-02-11T22:30:00-03:00",
+        "fuel_type": "DIESEL",
+        "price_per_liter": "5.00",
+        "volume_liters": "12.00",
+        "driver_cpf": "11144477735",
+    })
+    assert response.status_code == 201
+    volume = (await client.get("/api/v1/estatisticas/volume", params={**RANGE, "station_id": STATION + 1})).json()
+    assert [row["date"] for row in volume["data"]] == ["2024-02-12"]
+
+    compiled = select(analytics_service.utc_date(Refueling.timestamp)).compile(dialect=postgresql.dialect())
+    assert "timezone('UTC', refuelings.timestamp)" in str(compiled)
+
+
+@pytest.mark.asyncio
+async def test_archived_rows_are_read_from_parquet_only(client, db_session, lake):
+    archived = await _insert(db_session, [
+        (20, "DIESEL", "4.50", "15.00", True),
+        (20, "DIESEL", "4.50", "15.00", False),
+    ])
+    await lake.flush(db_session)
+    before = (await client.get("/api/v1/estatisticas/anomalias", params={"start": "2024-02-20", "end": "2024-02-20"})).json()
+
+    # Gone from the hot table: the report must still see them.
+    await db_session.execute(delete(Refueling).where(Refueling.id.in_([r.id for r in archived])))
+    await db_session.commit()
+    after = (await client.get("/api/v1/estatisticas/anomalias", params={"start": "2024-02-20", "end": "2024-02-20"})).json()
+
+    assert after == before
+    diesel = _by(after["data"], "fuel_type")["DIESEL"]
+    assert diesel["total"] == 2 and diesel["improper"] == 1 and diesel["rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_recent_ranges_stay_on_oltp(lake, monkeypatch):
+    recent = datetime.now(timezone.utc)
+    assert analytics_service.plan_query(recent, lake).sources == ["oltp"]
+
+    monkeypatch.setattr(ParquetSink, "high_water_mark", property(lambda self: 10))
+    assert analytics_service.plan_query(None, lake).sources == ["archive", "oltp"]
+    assert analytics_service.plan_query(datetime(2024, 1, 1, tzinfo=timezone.utc), lake).high_water_mark == 10
+
+
+@pytest.mark.asyncio
+async def test_without_archive_everything_comes_from_oltp(client, db_session, lake):
+    await _insert(db_session, [(27, "DIESEL", "3.00", "5.00", False)])
+    prices = (await client.get("/api/v1/estatisticas/precos", params={"start": "2024-02-27", "end": "2024-02-27"})).json()
+    assert prices["sources"] == ["oltp"]
+    assert _by(prices["data"], "fuel_type")["DIESEL"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_inverted_range_is_rejected(client):
+    response = await client.get("/api/v1/estatisticas/precos", params={"start": "2024-03-01", "end": "2024-02-01"})
+    assert response.status_code == 400
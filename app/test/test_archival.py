@@ -0,0 +1,157 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core import datalake
+from app.core.datalake import ParquetSink
+from app.core.metrics import REFUELINGS_IMPROPER_CLEARED
+from app.core.stale_cache import stale_pages
+from app.models.abastecimento import Refueling
+from app.services import archival_service
+from app.services.archival_service import ArchivalService, ArchiveWindow
+
+CPF = "24681357913"
+NOW = datetime(2023, 6, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def lake(tmp_path, monkeypatch):
+    sink = ParquetSink(str(tmp_path))
+    monkeypatch.setattr(datalake, "datalake_sink", sink)
+    monkeypatch.setattr(datalake, "DATALAKE_GAP_TIMEOUT_SECONDS", 0)
+    monkeypatch.setattr(archival_service, "ARCHIVE_AFTER_DAYS", 30)
+    monkeypatch.setattr(archival_service.analytics_service, "ANALYTICS_HOT_WINDOW_DAYS", 30)
+    return sink
+
+
+async def _insert(db_session, days, month=3, year=2023, cpf=CPF):
+    db_session.add_all([
+        Refueling(
+            station_id=77,
+            timestamp=datetime(year, month, day, 8, tzinfo=timezone.utc),
+            fuel_type="GASOLINA",
+            price_per_liter=Decimal("5.00"),
+            volume_liters=Decimal(str(day)),
+            driver_cpf=cpf,
+            improper_data=False,
+            created_at=datetime.now(timezone.utc),
+        )
+        for day in days
+    ])
+    await db_session.commit()
+
+
+async def _hot_count(db_session):
+    return (await db_session.execute(
+        select(func.count(Refueling.id)).where(Refueling.driver_cpf == CPF)
+    )).scalar()
+
+
+@pytest.mark.asyncio
+async def test_archival_moves_exported_rows_out_in_chunks(client, db_session, lake):
+    await _insert(db_session, [1, 2, 3, 4, 5])
+    # Nothing exported yet: nothing may be deleted.
+    assert await ArchivalService.archive(db_session, lake, now=NOW) == 0
+    assert await _hot_count(db_session) == 5
+
+    await lake.flush(db_session)
+    await _insert(db_session, [6])  # not exported: stays in the hot table
+    await _insert(db_session, [20], month=5)  # inside the horizon
+    assert await ArchivalService.archive(db_session, lake, batch_size=2, pause_ms=0, now=NOW) >= 5
+    assert await _hot_count(db_session) == 2
+
+    url = f"/api/v1/motoristas/{CPF}/historico"
+    hot = (await client.get(url, params={"size": 100})).json()
+    assert hot["total"] == 2
+
+    everything = (await client.get(url, params={"size": 100, "include_archived": "true"})).json()
+    assert everything["total"] == 7
+    days = [row["timestamp"][:10] for row in everything["data"]]
+    assert days == ["2023-05-20", "2023-03-06", "2023-03-05", "2023-03-04",
+                    "2023-03-03", "2023-03-02", "2023-03-01"]
+
+    second_page = (await client.get(url, params={"size": 3, "page": 2, "include_archived": "true"})).json()
+    assert [row["timestamp"][:10] for row in second_page["data"]] == days[3:6]
+    assert second_page["data"][0]["volume_liters"] == "4.00"
+
+
+@pytest.mark.asyncio
+async def test_rows_pending_deletion_are_not_read_twice(client, db_session, lake):
+    await _insert(db_session, [10, 11], month=4, year=2022)
+    await lake.flush(db_session)
+    # Window recorded, crash before any delete: the rows are in both places.
+    archival_service._write_window(lake, ArchiveWindow(datetime(2022, 5, 1, tzinfo=timezone.utc), lake.high_water_mark))
+
+    response = await client.get(
+        "/api/v1/abastecimentos",
+        params={"refueling_date": "2022-04-10", "include_archived": "true"},
+    )
+    body = response.json()
+    assert body["total"] == 1
+    assert [row["driver_cpf"] for row in body["data"]] == [CPF]
+
+
+@pytest.mark.asyncio
+async def test_window_only_grows(db_session, lake):
+    await _insert(db_session, [15], month=1, year=2021)
+    await lake.flush(db_session)
+    await ArchivalService.archive(db_session, lake, pause_ms=0, now=NOW)
+    first = archival_service.read_window(lake)
+
+    await ArchivalService.archive(db_session, lake, pause_ms=0, now=datetime(2021, 1, 1, tzinfo=timezone.utc))
+    second = archival_service.read_window(lake)
+    assert second.cutoff == first.cutoff
+    assert second.max_id == first.max_id
+
+
+@pytest.mark.asyncio
+async def test_deep_archive_pages_are_rejected(client, lake, monkeypatch):
+    monkeypatch.setattr(archival_service, "ARCHIVE_PAGE_MAX_ROWS", 20)
+    url = f"/api/v1/motoristas/{CPF}/historico"
+    assert (await client.get(url, params={"size": 10, "page": 2, "include_archived": "true"})).status_code == 200
+    deep = await client.get(url, params={"size": 10, "page": 3, "include_archived": "true"})
+    assert deep.status_code == 400
+    listing = await client.get("/api/v1/abastecimentos", params={"size": 10, "page": 3, "include_archived": "true"})
+    assert listing.status_code == 400
+    assert (await client.get(url, params={"size": 10, "page": 3})).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_corrections_reach_exported_and_archived_rows(client, db_session, lake, monkeypatch):
+    monkeypatch.setattr(datalake, "CHANGE_FEED_SETTLE_SECONDS", 0)
+    cpf = "52986437109"
+    await _insert(db_session, [7, 8], month=2, year=2020, cpf=cpf)
+    await lake.flush(db_session)
+    await ArchivalService.archive(db_session, lake, pause_ms=0, now=NOW)
+    url = f"/api/v1/motoristas/{cpf}/historico"
+    archived_id, other_id = sorted(row["id"] for row in (await client.get(
+        url, params={"include_archived": "true"}
+    )).json()["data"])
+    stale_pages.put("page", {"data": []})
+
+    response = await client.patch("/api/v1/abastecimentos/bulk", json={"updates": [
+        {"id": archived_id, "improper_data": True},
+    ]})
+    assert response.json()["results"] == [{"id": archived_id, "status": "updated"}]
+    assert stale_pages.get("page") is None
+    await lake.flush(db_session)
+
+    flags = {row["id"]: row["improper_data"] for row in (await client.get(
+        url, params={"include_archived": "true"}
+    )).json()["data"]}
+    assert flags == {archived_id: True, other_id: False}
+    rates = (await client.get("/api/v1/estatisticas/anomalias", params={"start": "2020-02-07", "end": "2020-02-08"})).json()
+    assert [(row["total"], row["improper"]) for row in rates["data"]] == [(2, 1)]
+
+    # Corrected back, merged into one correction file by compaction.
+    cleared = REFUELINGS_IMPROPER_CLEARED.labels("GASOLINA")._value.get()
+    await client.patch("/api/v1/abastecimentos/bulk", json={"updates": [{"id": archived_id, "improper_data": False}]})
+    assert REFUELINGS_IMPROPER_CLEARED.labels("GASOLINA")._value.get() == cleared + 1
+    await lake.flush(db_session)
+    lake.compact(min_files=2)
+    assert len(lake._corrections()) == 1
+    assert lake.fetch([archived_id])[0]["improper_data"] is False
+    missing = await client.patch("/api/v1/abastecimentos/bulk", json={"updates": [{"id": 999999, "improper_data": True}]})
+    assert missing.json()["results"] == [{"id": 999999, "status": "not_found"}]
@@ -0,0 +1,91 @@
+import pytest
+from sqlalchemy import event, select
+
+from app.core.database import CONSISTENCY_HEADER
+from app.models.abastecimento import Refueling, RefuelingChange
+from app.services import abastecimento_service
+
+
+async def _create(client, refueling_payload, count):
+    ids = []
+    for i in range(count):
+        response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            f"9150000000{i}", station_id=91, fuel_type="ETANOL", price_per_liter="4.00", volume_liters="25",
+        ))
+        assert response.status_code == 201
+        ids.append(response.json()["id"])
+    return ids
+
+
+@pytest.mark.asyncio
+async def test_lookup_returns_requested_order_and_missing_ids(client, refueling_payload):
+    first, second = await _create(client, refueling_payload, 2)
+
+    response = await client.post("/api/v1/abastecimentos/lookup", json={"ids": [second, 999999, first, second]})
+    assert response.status_code == 200
+    body = response.json()
+    assert [row["id"] for row in body["data"]] == [second, first]
+    assert body["data"][1]["driver_cpf"] == "91500000000"
+    assert body["missing"] == [999999]
+
+
+@pytest.mark.asyncio
+async def test_lookup_rejects_too_many_ids(client, monkeypatch):
+    monkeypatch.setattr(abastecimento_service, "REFUELING_LOOKUP_MAX_IDS", 2)
+    response = await client.post("/api/v1/abastecimentos/lookup", json={"ids": [1, 2, 3]})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_bulk_correction_updates_in_one_statement_with_change_feed(client, db_session, refueling_payload):
+    flip, keep = await _create(client, refueling_payload, 2)
+    statements = []
+
+    def capture(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db_session.bind.sync_engine
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        response = await client.patch("/api/v1/abastecimentos/bulk", json={"updates": [
+            {"id": flip, "improper_data": True},
+            {"id": keep, "improper_data": False},
+            {"id": 999999, "improper_data": True},
+        ]})
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert response.status_code == 200
+    assert response.headers[CONSISTENCY_HEADER]
+    body = response.json()
+    assert (body["updated"], body["unchanged"], body["not_found"]) == (1, 1, 1)
+    assert body["results"] == [
+        {"id": flip, "status": "updated"},
+        {"id": keep, "status": "unchanged"},
+        {"id": 999999, "status": "not_found"},
+    ]
+    assert sum(1 for statement in statements if statement.lstrip().upper().startswith("UPDATE REFUELINGS")) == 1
+
+    db_session.expire_all()
+    flags = dict((await db_session.execute(
+        select(Refueling.id, Refueling.improper_data).where(Refueling.id.in_([flip, keep]))
+    )).all())
+    assert flags == {flip: True, keep: False}
+    changes = (await db_session.execute(
+        select(RefuelingChange).where(RefuelingChange.refueling_id.in_([flip, keep]), RefuelingChange.operation == "update")
+    )).scalars().all()
+    assert [(change.refueling_id, change.payload["improper_data"]) for change in changes] == [(flip, True)]
+
+    # Applying the same batch again changes nothing.
+    again = await client.patch("/api/v1/abastecimentos/bulk", json={"updates": [{"id": flip, "improper_data": True}]})
+    assert again.json()["results"] == [{"id": flip, "status": "unchanged"}]
+
+
+@pytest.mark.asyncio
+async def test_bulk_correction_rejects_duplicate_and_oversized_batches(client, monkeypatch):
+    duplicated = {"updates": [{"id": 1, "improper_data": True}, {"id": 1, "improper_data": False}]}
+    assert (await client.patch("/api/v1/abastecimentos/bulk", json=duplicated)).status_code == 400
+
+    monkeypatch.setattr(abastecimento_service, "REFUELING_BULK_MAX_UPDATES", 1)
+    oversized = {"updates": [{"id": 1, "improper_data": True}, {"id": 2, "improper_data": True}]}
+    assert (await client.patch("/api/v1/abastecimentos/bulk", json=oversized)).status_code == 400
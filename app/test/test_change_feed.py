@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core import database
+from app.models.abastecimento import Base, Refueling, RefuelingChange
+from app.services import change_feed_service
+from app.services.change_feed_service import ChangeFeedService
+
+
+@pytest.fixture(autouse=True)
+def no_settle(monkeypatch):
+    monkeypatch.setattr(change_feed_service, "CHANGE_FEED_SETTLE_SECONDS", 0)
+
+
+@pytest.mark.asyncio
+async def test_insert_writes_outbox_row_in_same_transaction(client, db_session, refueling_payload):
+    response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "87748248800", station_id=21, fuel_type="DIESEL",
+    ))
+    assert response.status_code == 201
+    created = response.json()
+
+    change = (await db_session.execute(
+        select(RefuelingChange).where(RefuelingChange.refueling_id == created["id"])
+    )).scalar_one()
+    assert change.operation == "insert"
+    assert change.payload["driver_cpf"] == "87748248800"
+    assert change.payload["id"] == created["id"]
+
+
+@pytest.mark.asyncio
+async def test_failed_insert_leaves_no_change(db_session, monkeypatch, refueling_payload):
+    from app.schemas.abastecimento import RefuelingCreate
+    from app.services.abastecimento_service import RefuelingService
+
+    before = (await db_session.execute(select(func.count(RefuelingChange.seq)))).scalar()
+
+    async def failing_commit():
+        raise RuntimeError("commit failed")
+
+    refueling = RefuelingCreate(**refueling_payload("11144477735", station_id=21, fuel_type="DIESEL"))
+    monkeypatch.setattr(db_session, "commit", failing_commit)
+    with pytest.raises(RuntimeError):
+        await RefuelingService.create_refueling(db_session, refueling)
+    await db_session.rollback()
+    monkeypatch.undo()
+
+    after = (await db_session.execute(select(func.count(RefuelingChange.seq)))).scalar()
+    assert after == before
+
+
+@pytest.mark.asyncio
+async def test_consumer_tails_feed_with_persisted_offset(client, refueling_payload):
+    first = await client.get("/api/v1/changes", params={"since": 0, "limit": 100000})
+    assert first.status_code == 200
+    since = first.json()["next_since"]
+
+    for price in ("5.10", "5.20", "5.30"):
+        await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            "62648716050", station_id=21, fuel_type="DIESEL", price_per_liter=price,
+        ))
+
+    seen = []
+    while True:
+        page = (await client.get("/api/v1/changes", params={"since": since, "limit": 2})).json()
+        seen.extend(change["payload"]["price_per_liter"] for change in page["changes"])
+        assert page["next_since"] >= since
+        since = page["next_since"]
+        if not page["has_more"]:
+            break
+
+    assert seen == ["5.10", "5.20", "5.30"]
+    empty = (await client.get("/api/v1/changes", params={"since": since})).json()
+    assert empty == {"since": since, "next_since": since, "has_more": False, "changes": []}
+
+
+@pytest.mark.asyncio
+async def test_feed_reads_from_primary_even_with_replicas(client, tmp_path, refueling_payload):
+    # An empty replica: a feed served from it would miss the new change.
+    url = f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"
+    replica_engine = create_async_engine(url)
+    async with replica_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await replica_engine.dispose()
+
+    since = (await client.get("/api/v1/changes", params={"limit": 100000})).json()["next_since"]
+    await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "38471290588", station_id=21, fuel_type="DIESEL",
+    ))
+    database.configure_replicas([url])
+    try:
+        page = (await client.get("/api/v1/changes", params={"since": since})).json()
+    finally:
+        for engine in database.replica_engines:
+            await engine.dispose()
+        database.configure_replicas([])
+    assert [change["payload"]["driver_cpf"] for change in page["changes"]] == ["38471290588"]
+
+
+@pytest.mark.asyncio
+async def test_unsettled_changes_are_held_back(client, monkeypatch, refueling_payload):
+    since = (await client.get("/api/v1/changes", params={"limit": 100000})).json()["next_since"]
+    await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "04352488016", station_id=21, fuel_type="DIESEL",
+    ))
+
+    monkeypatch.setattr(change_feed_service, "CHANGE_FEED_SETTLE_SECONDS", 60)
+    page = (await client.get("/api/v1/changes", params={"since": since})).json()
+    assert page["changes"] == []
+    assert page["next_since"] == since
+
+
+@pytest.mark.asyncio
+async def test_prune_deletes_changes_past_retention(db_session):
+    old = RefuelingChange(
+        refueling_id=0,
+        operation="insert",
+        payload={},
+        created_at=datetime.now(timezone.utc) - timedelta(hours=200),
+    )
+    db_session.add(old)
+    await db_session.commit()
+    old_seq = old.seq
+
+    assert await ChangeFeedService.prune(db_session, retention_hours=168) >= 1
+    remaining = await db_session.execute(select(RefuelingChange).where(RefuelingChange.seq == old_seq))
+    assert remaining.scalar_one_or_none() is None
+
+
+@pytest.mark.asyncio
+async def test_spool_drain_batch_records_changes(db_session, refueling_payload):
+    from app.schemas.abastecimento import RefuelingCreate
+    from app.services.abastecimento_service import RefuelingService
+
+    payload = refueling_payload("73940787097", station_id=21, fuel_type="DIESEL")
+    records = [("feed%028d" % i, RefuelingCreate(**payload)) for i in range(3)]
+    refuelings = await RefuelingService.create_refuelings(db_session, records)
+    ids = [refueling.id for refueling in refuelings]
+
+    count = await db_session.execute(
+        select(func.count(RefuelingChange.seq)).where(RefuelingChange.refueling_id.in_(ids))
+    )
+    assert count.scalar() == 3
+    assert (await db_session.execute(select(func.count(Refueling.id)).where(Refueling.id.in_(ids)))).scalar() == 3
@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event, exc, func, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core import circuit_breaker, spool
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError, attach_breaker, is_outage_error
+from app.core.stale_cache import STALE_HEADER, stale_pages
+from app.models.abastecimento import Refueling
+from app.services.abastecimento_service import RefuelingService
+
+
+def test_breaker_opens_after_threshold_and_probes_after_reset(monkeypatch):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=10)
+    clock = [100.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: clock[0])
+
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == circuit_breaker.OPEN
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.check()
+    assert error.value.retry_after == 10
+
+    clock[0] += 10
+    breaker.check()
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    breaker.record_failure()
+    assert breaker.state == circuit_breaker.OPEN
+    clock[0] += 10
+    breaker.check()
+    breaker.record_success()
+    assert breaker.state == circuit_breaker.CLOSED
+
+
+def test_outage_errors_are_told_apart_from_statement_errors():
+    assert is_outage_error(CircuitOpenError("primary", 1))
+    assert is_outage_error(exc.OperationalError("SELECT 1", {}, ConnectionRefusedError()))
+
+    class AdminShutdown(Exception):
+        sqlstate = "57P01"
+
+    assert is_outage_error(exc.DBAPIError("SELECT 1", {}, AdminShutdown()))
+    assert not is_outage_error(exc.IntegrityError("INSERT", {}, Exception("duplicate key")))
+    assert not is_outage_error(ValueError("bad cpf"))
+
+    class QueryCanceled(Exception):
+        sqlstate = "57014"
+
+    assert not is_outage_error(exc.DBAPIError("SELECT 1", {}, QueryCanceled()))
+    assert not is_outage_error(exc.OperationalError("SELECT 1", {}, TimeoutError()))
+    assert not is_outage_error(asyncio.TimeoutError())
+
+
+@pytest.mark.asyncio
+async def test_statement_timeout_does_not_trip_breaker(tmp_path, monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "DB_CIRCUIT_FAILURE_THRESHOLD", 1)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/db.sqlite")
+    breaker = attach_breaker(engine, "test-timeout")
+
+    def command_timeout(conn, cursor, statement, *args):
+        if statement == "SELECT 2":
+            raise TimeoutError()
+
+    event.listen(engine.sync_engine, "before_cursor_execute", command_timeout)
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            with pytest.raises(TimeoutError):
+                await conn.execute(text("SELECT 2"))
+        assert breaker.state == circuit_breaker.CLOSED
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_engine_fails_fast_once_circuit_is_open(tmp_path, monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "DB_CIRCUIT_FAILURE_THRESHOLD", 2)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/missing/dir/db.sqlite")
+    breaker = attach_breaker(engine, "test-engine")
+    try:
+        for _ in range(2):
+            with pytest.raises(exc.OperationalError):
+                async with engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+        assert breaker.state == circuit_breaker.OPEN
+
+        with pytest.raises(CircuitOpenError):
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_reads_serve_stale_page_while_database_is_down(client, monkeypatch):
+    stale_pages.clear()
+    url = "/api/v1/abastecimentos?fuel_type=DIESEL&page=1&size=3"
+    fresh = await client.get(url)
+    assert fresh.status_code == 200
+    assert STALE_HEADER not in fresh.headers
+
+    async def circuit_open(db, query):
+        raise CircuitOpenError("primary", 4)
+
+    monkeypatch.setattr(RefuelingService, "count", staticmethod(circuit_open))
+
+    stale = await client.get(url)
+    assert stale.status_code == 200
+    assert stale.headers[STALE_HEADER] == "true"
+    assert stale.json() == fresh.json()
+
+    uncached = await client.get("/api/v1/abastecimentos?fuel_type=DIESEL&page=7&size=3")
+    assert uncached.status_code == 503
+    assert uncached.headers["Retry-After"] == "4"
+    stale_pages.clear()
+
+
+@pytest.mark.asyncio
+async def test_ingestion_spills_to_disk_and_replays(client, db_session, tmp_path, monkeypatch, refueling_payload):
+    from app.api.v1 import abastecimento
+    from app.main import _drain_spooled
+
+    queue = spool.Spool(str(tmp_path / "spool"))
+    monkeypatch.setattr(abastecimento, "ingest_spool", queue)
+    original_create = RefuelingService.create_refueling
+
+    async def circuit_open(db, data):
+        raise CircuitOpenError("primary", 5)
+
+    monkeypatch.setattr(RefuelingService, "create_refueling", staticmethod(circuit_open))
+    cpf = "15350946056"
+    response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        cpf, station_id=4, timestamp="2024-12-20T12:00:00Z", fuel_type="DIESEL",
+        price_per_liter="6.10", volume_liters="30",
+    ))
+    assert response.status_code == 202
+    assert response.json()["id"]
+    assert queue.pending() > 0
+
+    monkeypatch.setattr(RefuelingService, "create_refueling", staticmethod(original_create))
+    assert await queue.drain(_drain_spooled) == 1
+    assert queue.pending() == 0
+    assert await queue.drain(_drain_spooled) == 0
+    await queue.close()
+
+    count = await db_session.execute(
+        select(func.count(Refueling.id)).where(Refueling.driver_cpf == cpf)
+    )
+    assert count.scalar() == 1
+
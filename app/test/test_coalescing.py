@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.core.coalescing import SingleFlight, read_key
+from app.services.abastecimento_service import RefuelingService
+
+
+def _collapsed(query):
+    return REGISTRY.get_sample_value("db_coalesced_calls_total", {"query": query}) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [1, 2, 3]
+
+    before = _collapsed("same")
+    results = await asyncio.gather(*(flight.do(("same",), query) for _ in range(5)))
+
+    assert calls == 1
+    assert all(r == [1, 2, 3] for r in results)
+    assert _collapsed("same") == before + 4
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_and_sequential_calls_are_not_shared():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def query(value):
+        calls.append(value)
+        await asyncio.sleep(0)
+        return value
+
+    assert await asyncio.gather(flight.do(("a",), lambda: query(1)), flight.do(("b",), lambda: query(2))) == [1, 2]
+    assert await flight.do(("a",), lambda: query(3)) == 3
+    assert calls == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_errors_propagate_to_every_waiter():
+    flight = SingleFlight("test")
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("db down")
+
+    results = await asyncio.gather(
+        *(flight.do(("fail",), failing) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.in_flight() == 0
+
+
+def test_read_key_separates_engines():
+    class Session:
+        def __init__(self, bind):
+            self.bind = bind
+
+    primary, replica = object(), object()
+    assert read_key(Session(primary), "list_count", None) != read_key(Session(replica), "list_count", None)
+    assert read_key(Session(primary), "list_count", None) == read_key(Session(primary), "list_count", None)
+
+
+@pytest.mark.asyncio
+async def test_dashboard_fan_out_hits_db_once(client, monkeypatch):
+    calls = {"count": 0, "page": 0}
+    original_count, original_page = RefuelingService.count, RefuelingService.fetch_page
+
+    async def slow_count(db, query):
+        calls["count"] += 1
+        await asyncio.sleep(0.02)
+        return await original_count(db, query)
+
+    async def slow_page(db, query):
+        calls["page"] += 1
+        await asyncio.sleep(0.02)
+        return await original_page(db, query)
+
+    monkeypatch.setattr(RefuelingService, "count", staticmethod(slow_count))
+    monkeypatch.setattr(RefuelingService, "fetch_page", staticmethod(slow_page))
+
+    responses = await asyncio.gather(
+        *(client.get("/api/v1/abastecimentos?fuel_type=DIESEL&page=1&size=5") for _ in range(6))
+    )
+
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.text for r in responses}) == 1
+    assert calls == {"count": 1, "page": 1}
+
+
+@pytest.mark.asyncio
+async def test_call_is_cancelled_only_when_every_waiter_left():
+    flight = SingleFlight("test")
+    started, cancelled = asyncio.Event(), asyncio.Event()
+
+    async def query():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    leader = asyncio.ensure_future(flight.do(("slow",), query))
+    await started.wait()
+    follower = asyncio.ensure_future(flight.do(("slow",), query))
+    await asyncio.sleep(0)
+
+    follower.cancel()
+    await asyncio.gather(follower, return_exceptions=True)
+    assert not cancelled.is_set()
+
+    leader.cancel()
+    await asyncio.gather(leader, return_exceptions=True)
+    assert cancelled.is_set()
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_shared_page_is_plain_data_from_its_own_session(db_session):
+    from datetime import datetime, timezone
+    from decimal import Decimal
+
+    from app.core.coalescing import shared_read
+    from app.schemas.abastecimento import RefuelingCreate
+
+    await RefuelingService.create_refueling(db_session, RefuelingCreate(
+        station_id=9,
+        timestamp=datetime.now(timezone.utc),
+        fuel_type="DIESEL",
+        price_per_liter=Decimal("6.00"),
+        volume_liters=Decimal("20"),
+        driver_cpf="52998224725",
+    ))
+    _, data_query = RefuelingService.list_queries(None, None)
+    sessions = []
+
+    async def fetch(session):
+        sessions.append(session)
+        return await RefuelingService.fetch_page(session, data_query.limit(2))
+
+    rows = await shared_read(db_session, ("plain",), fetch, RefuelingService.serialize_page)
+
+    assert sessions and sessions[0] is not db_session
+    assert rows and all(isinstance(row, dict) for row in rows)
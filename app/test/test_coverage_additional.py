@@ -6,7 +6,7 @@ from fastapi import HTTPException
 
 from app.main import app, startup_event, shutdown_event
 from app.core import database
-from app.core.security import get_api_key
+from app.core.security import get_api_key, reload_api_keys
 from app.core.database import get_db
 from app.services.abastecimento_service import RefuelingService
 from app.models.abastecimento import Refueling
@@ -19,6 +19,7 @@ from datetime import datetime, timezone, date
 @pytest.mark.asyncio
 async def test_get_api_key_accepts_and_rejects():
     os.environ["API_KEY"] = "test-accept-key"
+    reload_api_keys()
     key = await get_api_key("test-accept-key")
     assert key == "test-accept-key"
 
@@ -236,6 +237,7 @@ async def test_create_refueling_success_logs(client):
 
 @pytest.mark.asyncio
 async def test_create_refueling_direct_with_logger(db_session):
+    from fastapi import Response
     from app.api.v1.abastecimento import create_refueling
     
     class DummyRef:
@@ -251,5 +253,5 @@ async def test_create_refueling_direct_with_logger(db_session):
         driver_cpf="11122233344",
     )
     
-    result = await create_refueling(payload, db=db_session, api_key="test-key")
+    result = await create_refueling(payload, Response(), db=db_session, api_key="test-key")
     assert result.id > 0
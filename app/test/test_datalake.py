@@ -0,0 +1,178 @@
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import delete, func, select
+
+from app.core import datalake
+from app.core.datalake import ParquetSink
+from app.models.abastecimento import Refueling
+
+
+@pytest.fixture(autouse=True)
+def no_gap_wait(monkeypatch):
+    monkeypatch.setattr(datalake, "DATALAKE_GAP_TIMEOUT_SECONDS", 0)
+
+
+async def _insert(db_session, count, fuel_type="ETANOL", day=3):
+    db_session.add_all([
+        Refueling(
+            station_id=31,
+            timestamp=datetime(2026, 5, day, 10, i, tzinfo=timezone.utc),
+            fuel_type=fuel_type,
+            price_per_liter=Decimal("3.99"),
+            volume_liters=Decimal("20.50"),
+            driver_cpf="11144477735",
+            improper_data=False,
+            created_at=datetime.now(timezone.utc),
+        )
+        for i in range(count)
+    ])
+    await db_session.commit()
+
+
+def _lake_ids(sink):
+    table = ds.dataset(sink.directory, format="parquet", partitioning="hive",
+                       exclude_invalid_files=True).to_table()
+    return table.column("id").to_pylist()
+
+
+async def _table_ids(db_session):
+    return set((await db_session.execute(select(Refueling.id))).scalars().all())
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_hive_partitions_once(db_session, tmp_path):
+    await _insert(db_session, 3)
+    await _insert(db_session, 2, fuel_type="DIESEL", day=4)
+    sink = ParquetSink(str(tmp_path), compression="zstd")
+
+    exported = await sink.flush(db_session)
+    assert exported == len(await _table_ids(db_session))
+    assert any(path.startswith("fuel_type=ETANOL/date=2026-05-03/") for path in sink.files())
+    assert any(path.startswith("fuel_type=DIESEL/date=2026-05-04/") for path in sink.files())
+    metadata = pq.ParquetFile(tmp_path / sink.files()[0]).metadata
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+    assert "fuel_type" not in metadata.schema.names
+
+    assert await sink.flush(db_session) == 0
+    await _insert(db_session, 1)
+    assert await sink.flush(db_session) == 1
+
+    ids = _lake_ids(sink)
+    assert len(ids) == len(set(ids))
+    assert set(ids) == await _table_ids(db_session)
+    assert sink.high_water_mark == max(ids)
+
+
+@pytest.mark.asyncio
+async def test_crash_after_journal_is_finished_on_restart(db_session, tmp_path, monkeypatch):
+    await _insert(db_session, 4)
+    sink = ParquetSink(str(tmp_path))
+    real_write_state = ParquetSink._write_state
+
+    def crash_after_journal(self, state):
+        real_write_state(self, state)
+        if state.get("pending"):
+            raise OSError("killed while publishing")
+
+    monkeypatch.setattr(ParquetSink, "_write_state", crash_after_journal)
+    with pytest.raises(OSError):
+        await sink.flush(db_session)
+    monkeypatch.undo()
+    monkeypatch.setattr(datalake, "DATALAKE_GAP_TIMEOUT_SECONDS", 0)
+
+    restarted = ParquetSink(str(tmp_path))
+    assert await restarted.flush(db_session) == 0
+    ids = _lake_ids(restarted)
+    assert Counter(ids).most_common(1)[0][1] == 1
+    assert set(ids) == await _table_ids(db_session)
+
+
+@pytest.mark.asyncio
+async def test_crash_before_journal_exports_rows_again(db_session, tmp_path, monkeypatch):
+    await _insert(db_session, 2)
+    sink = ParquetSink(str(tmp_path))
+
+    def crash(self, state):
+        raise OSError("killed before the journal was written")
+
+    monkeypatch.setattr(ParquetSink, "_write_state", crash)
+    with pytest.raises(OSError):
+        await sink.flush(db_session)
+    monkeypatch.undo()
+    monkeypatch.setattr(datalake, "DATALAKE_GAP_TIMEOUT_SECONDS", 0)
+    assert sink.files() == []
+
+    assert await sink.flush(db_session) == len(await _table_ids(db_session))
+    ids = _lake_ids(sink)
+    assert len(ids) == len(set(ids))
+
+
+@pytest.mark.asyncio
+async def test_compaction_merges_small_files_without_losing_rows(db_session, tmp_path):
+    await _insert(db_session, 12, day=9)
+    sink = ParquetSink(str(tmp_path), row_group_size=4)
+    total = (await db_session.execute(select(func.count(Refueling.id)))).scalar()
+    await sink.flush(db_session, batch_size=3)
+    partition = "fuel_type=ETANOL/date=2026-05-09"
+    before = len(sink.files(partition))
+    assert before >= 4
+
+    assert sink.compact(min_files=2) >= before
+    assert len(sink.files(partition)) == 1
+    merged = pq.ParquetFile(tmp_path / sink.files(partition)[0])
+    assert merged.metadata.num_rows == 12
+    assert merged.metadata.num_row_groups == 3
+
+    ids = _lake_ids(sink)
+    assert len(ids) == total == len(set(ids))
+    assert sink.compact(min_files=2) == 0
+
+
+@pytest.mark.asyncio
+async def test_mark_stays_below_an_uncommitted_id(db_session, tmp_path, monkeypatch):
+    await _insert(db_session, 1, day=12)
+    sink = ParquetSink(str(tmp_path))
+    await sink.flush(db_session)
+    mark = sink.high_water_mark
+
+    # mark + 1 was taken by a transaction that has not committed yet; mark + 2 did.
+    await _insert(db_session, 2, day=12)
+    await db_session.execute(delete(Refueling).where(Refueling.id == mark + 1))
+    await db_session.commit()
+    monkeypatch.setattr(datalake, "DATALAKE_GAP_TIMEOUT_SECONDS", 60)
+    assert await sink.flush(db_session) == 0
+    assert sink.high_water_mark == mark
+
+    # The slow transaction commits: both rows go out, nothing is skipped.
+    db_session.add(Refueling(
+        id=mark + 1, station_id=31, timestamp=datetime(2026, 5, 12, 11, tzinfo=timezone.utc),
+        fuel_type="ETANOL", price_per_liter=Decimal("3.99"), volume_liters=Decimal("20.50"),
+        driver_cpf="11144477735", improper_data=False, created_at=datetime.now(timezone.utc),
+    ))
+    await db_session.commit()
+    assert await sink.flush(db_session) == 2
+    assert sorted(_lake_ids(sink))[-3:] == [mark, mark + 1, mark + 2]
+
+
+@pytest.mark.asyncio
+async def test_gap_is_skipped_once_it_times_out(db_session, tmp_path, monkeypatch):
+    await _insert(db_session, 1, day=13)
+    sink = ParquetSink(str(tmp_path))
+    await sink.flush(db_session)
+    mark = sink.high_water_mark
+    await _insert(db_session, 2, day=13)
+    await db_session.execute(delete(Refueling).where(Refueling.id == mark + 1))
+    await db_session.commit()
+
+    monkeypatch.setattr(datalake, "DATALAKE_GAP_TIMEOUT_SECONDS", 60)
+    assert await sink.flush(db_session) == 0
+    clock = time.monotonic() + 61
+    monkeypatch.setattr(datalake.time, "monotonic", lambda: clock)
+    assert await sink.flush(db_session) == 1
+    assert sink.high_water_mark == mark + 2
@@ -0,0 +1,207 @@
+import csv
+import io
+import itertools
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import update
+
+from app.core import datalake
+from app.core.datalake import ParquetSink
+from app.models.abastecimento import ExportJob, Refueling
+from app.services import archival_service, export_service
+from app.services.archival_service import ArchivalService
+from app.services.export_service import ExportService, LeaseLost, _TextWriter
+
+_stations = itertools.count(950)
+
+
+@pytest.fixture(autouse=True)
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(export_service, "EXPORT_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def station():
+    return next(_stations)
+
+
+@pytest.fixture
+async def refuelings(client, station, refueling_payload):
+    ids = []
+    for i in range(5):
+        response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            f"9550000000{i}", station_id=station, fuel_type="DIESEL", price_per_liter="6.10", volume_liters=20 + i,
+        ))
+        assert response.status_code == 201
+        ids.append(response.json()["id"])
+    return ids
+
+
+async def _queue(client, fmt, station):
+    response = await client.post("/api/v1/exports", json={"format": fmt, "station_id": station})
+    assert response.status_code == 202
+    assert response.headers["location"] == f"/api/v1/exports/{response.json()['id']}"
+    return response.json()["id"]
+
+
+async def _drain(db_session):
+    while await ExportService.process_next(db_session):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_csv_export_reports_progress_and_downloads_with_ranges(client, db_session, station, refuelings):
+    job_id = await _queue(client, "csv", station)
+    queued = (await client.get(f"/api/v1/exports/{job_id}")).json()
+    assert queued["status"] == "queued" and queued["progress"] == 0.0
+    assert (await client.get(f"/api/v1/exports/{job_id}/download")).status_code == 409
+
+    await _drain(db_session)
+
+    status = (await client.get(f"/api/v1/exports/{job_id}")).json()
+    assert status["status"] == "done"
+    assert (status["total_rows"], status["exported_rows"], status["progress"]) == (5, 5, 1.0)
+    assert status["filters"] == {"station_id": station}
+
+    download = await client.get(status["download_url"])
+    assert download.status_code == 200
+    assert download.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(download.text)))
+    assert [int(row["id"]) for row in rows] == refuelings
+    assert rows[0]["price_per_liter"] == "6.10" and rows[0]["driver_cpf"] == "95500000000"
+
+    partial = await client.get(status["download_url"], headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.content == download.content[:10]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_and_parquet_exports(client, db_session, station, refuelings):
+    ndjson_id = await _queue(client, "ndjson", station)
+    parquet_id = await _queue(client, "parquet", station)
+    # Several batches: the Parquet parts are stitched into one file.
+    for _ in range(2):
+        job, token = await ExportService.claim(db_session)
+        await ExportService.run(db_session, job, token, batch_size=2)
+    await _drain(db_session)
+
+    lines = (await client.get(f"/api/v1/exports/{ndjson_id}/download")).text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == refuelings
+    assert json.loads(lines[0])["improper_data"] is False
+
+    parquet = await client.get(f"/api/v1/exports/{parquet_id}/download")
+    table = pq.read_table(io.BytesIO(parquet.content))
+    assert table.column("id").to_pylist() == refuelings
+    assert str(table.column("volume_liters")[0].as_py()) == "20.00"
+
+
+@pytest.mark.asyncio
+async def test_interrupted_job_resumes_from_last_checkpoint(client, db_session, station, refuelings, monkeypatch):
+    job_id = await _queue(client, "ndjson", station)
+    job, token = await ExportService.claim(db_session)
+    assert job.id == job_id
+
+    original_write, calls = _TextWriter.write, []
+
+    def crash_on_second_batch(self, rows, checkpoint):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            with open(self.part, "ab") as f:
+                f.write(b'{"half a row')
+            raise OSError("worker killed")
+        return original_write(self, rows, checkpoint)
+
+    monkeypatch.setattr(_TextWriter, "write", crash_on_second_batch)
+    with pytest.raises(OSError):
+        await ExportService.run(db_session, job, token, batch_size=2)
+    monkeypatch.setattr(_TextWriter, "write", original_write)
+
+    # The worker died without releasing its lease; once it expires the job is taken over.
+    await db_session.execute(
+        update(ExportJob).where(ExportJob.id == job_id)
+        .values(lease_until=datetime.now(timezone.utc) - timedelta(seconds=1))
+    )
+    await db_session.commit()
+    job, new_token = await ExportService.claim(db_session)
+    assert (job.id, job.status, job.exported_rows) == (job_id, "running", 2)
+    await ExportService.run(db_session, job, new_token, batch_size=2)
+
+    lines = (await client.get(f"/api/v1/exports/{job_id}/download")).text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == refuelings
+    with pytest.raises(LeaseLost):
+        await ExportService._save(db_session, job_id, token, exported_rows=0)
+
+
+@pytest.mark.asyncio
+async def test_failing_job_is_retried_then_marked_failed(client, db_session, station, monkeypatch):
+    def disk_full(self, checkpoint):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(export_service, "EXPORT_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(_TextWriter, "prepare", disk_full)
+    job_id = await _queue(client, "csv", station)
+
+    assert await ExportService.process_next(db_session)
+    assert (await client.get(f"/api/v1/exports/{job_id}")).json()["status"] == "queued"
+    assert await ExportService.process_next(db_session)
+    status = (await client.get(f"/api/v1/exports/{job_id}")).json()
+    assert (status["status"], status["attempts"], status["error"]) == ("failed", 2, "disk full")
+    assert await ExportService.process_next(db_session) is False
+
+
+@pytest.mark.asyncio
+async def test_export_requests_are_validated(client, monkeypatch):
+    assert (await client.get("/api/v1/exports/nope")).status_code == 404
+    assert (await client.post("/api/v1/exports", json={"format": "xlsx"})).status_code == 422
+    inverted = {"format": "csv", "start": "2026-02-01", "end": "2026-01-01"}
+    assert (await client.post("/api/v1/exports", json=inverted)).status_code == 400
+
+    monkeypatch.setattr(export_service, "EXPORT_MAX_PENDING", 0)
+    full = await client.post("/api/v1/exports", json={"format": "csv"})
+    assert full.status_code == 429
+    assert full.headers["retry-after"] == "60"
+
+
+@pytest.mark.asyncio
+async def test_export_includes_archived_rows(client, db_session, station, tmp_path, monkeypatch, refueling_payload):
+    lake = ParquetSink(str(tmp_path / "lake"))
+    monkeypatch.setattr(datalake, "datalake_sink", lake)
+    monkeypatch.setattr(datalake, "DATALAKE_GAP_TIMEOUT_SECONDS", 0)
+    monkeypatch.setattr(archival_service, "ARCHIVE_AFTER_DAYS", 30)
+    monkeypatch.setattr(archival_service.analytics_service, "ANALYTICS_HOT_WINDOW_DAYS", 30)
+    db_session.add_all([
+        Refueling(
+            station_id=station,
+            timestamp=datetime(2019, month, 1, 8, tzinfo=timezone.utc),
+            fuel_type="DIESEL",
+            price_per_liter=Decimal("6.10"),
+            volume_liters=Decimal("20"),
+            driver_cpf="95500000000",
+            improper_data=False,
+            created_at=datetime.now(timezone.utc),
+        )
+        for month in (1, 2, 3)
+    ])
+    await db_session.commit()
+    await lake.flush(db_session)
+    recent = (await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "95500000001", station_id=station, fuel_type="DIESEL", price_per_liter="6.10", volume_liters="21",
+    ))).json()["id"]
+    assert await ArchivalService.archive(db_session, lake, pause_ms=0, now=datetime(2020, 1, 1, tzinfo=timezone.utc)) >= 3
+
+    job_id = await _queue(client, "ndjson", station)
+    job, token = await ExportService.claim(db_session)
+    await ExportService.run(db_session, job, token, batch_size=2)
+
+    status = (await client.get(f"/api/v1/exports/{job_id}")).json()
+    assert (status["total_rows"], status["exported_rows"]) == (4, 4)
+    lines = [json.loads(line) for line in (await client.get(f"/api/v1/exports/{job_id}/download")).text.splitlines()]
+    assert [line["timestamp"][:7] for line in lines[:3]] == ["2019-01", "2019-02", "2019-03"]
+    assert lines[-1]["id"] == recent
+    assert [line["id"] for line in lines] == sorted(line["id"] for line in lines)
+    assert lines[0]["price_per_liter"] == "6.10" and lines[0]["fraud_flags"] == []
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.models.abastecimento import Refueling
+from app.services.fraud_service import DAILY_VOLUME, STATION_HOP, FraudIndex
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+
+
+def test_station_hop_within_window_is_flagged():
+    index = FraudIndex(hop_minutes=30, daily_volume=Decimal("500"), bucket_minutes=15)
+    assert index.observe("1", NOW, 1, Decimal("40")) == []
+    assert index.observe("1", NOW + timedelta(minutes=20), 2, Decimal("40")) == [STATION_HOP]
+    assert index.observe("1", NOW + timedelta(minutes=90), 3, Decimal("40")) == []
+    assert index.observe("1", NOW + timedelta(minutes=100), 3, Decimal("40")) == []
+    assert index.observe("2", NOW + timedelta(minutes=21), 3, Decimal("40")) == []
+
+
+def test_out_of_order_refueling_is_checked_against_later_ones():
+    index = FraudIndex(hop_minutes=30, daily_volume=Decimal("0"), bucket_minutes=15)
+    index.observe("1", NOW, 1, Decimal("40"))
+    assert index.observe("1", NOW - timedelta(minutes=10), 2, Decimal("40")) == [STATION_HOP]
+
+
+def test_daily_volume_counts_trailing_24_hours():
+    index = FraudIndex(hop_minutes=0, daily_volume=Decimal("100"), bucket_minutes=60)
+    start = NOW - timedelta(hours=30)
+    assert index.observe("1", start, 1, Decimal("60")) == []
+    # 25 hours later the first refueling is out of the window.
+    assert index.observe("1", start + timedelta(hours=25), 1, Decimal("60")) == []
+    assert index.observe("1", start + timedelta(hours=25, minutes=30), 1, Decimal("30")) == []
+    assert index.observe("1", start + timedelta(hours=26), 1, Decimal("20")) == [DAILY_VOLUME]
+
+
+def test_repeated_refueling_counts_once():
+    index = FraudIndex(hop_minutes=30, daily_volume=Decimal("100"), bucket_minutes=15)
+    for _ in range(3):
+        index.add("1", NOW, 1, Decimal("60"))
+    assert index.check("1", NOW + timedelta(minutes=1), 1, Decimal("30")) == []
+
+
+def test_idle_drivers_are_evicted():
+    index = FraudIndex(hop_minutes=30, daily_volume=Decimal("0"), bucket_minutes=15)
+    index.add("1", NOW - timedelta(hours=2), 1, Decimal("40"))
+    index.add("2", NOW, 1, Decimal("40"))
+    assert len(index) == 1
+    # Too old for the window: not indexed at all.
+    index.add("3", NOW - timedelta(hours=3), 1, Decimal("40"))
+    assert len(index) == 1
+
+
+@pytest.mark.asyncio
+async def test_flags_are_stored_next_to_improper_data(client, db_session, refueling_payload):
+    first = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "71428793860", station_id=41, timestamp=NOW, price_per_liter="5.10",
+    ))
+    second = await client.post(
+        "/api/v1/abastecimentos", json=refueling_payload(
+            "71428793860", station_id=42, timestamp=NOW + timedelta(minutes=5), price_per_liter="5.10",
+        )
+    )
+    assert first.status_code == 201
+    assert first.json()["fraud_flags"] == []
+    assert second.json()["fraud_flags"] == [STATION_HOP]
+
+    stored = (await db_session.execute(
+        select(Refueling.fraud_flags, Refueling.improper_data).where(Refueling.id == second.json()["id"])
+    )).one()
+    assert stored.fraud_flags == [STATION_HOP]
+    assert stored.improper_data is False
+
+
+@pytest.mark.asyncio
+async def test_index_rebuilds_from_database(client, db_session, refueling_payload):
+    await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "46818137083", station_id=51, timestamp=NOW, price_per_liter="5.10", volume_liters="300",
+    ))
+
+    index = FraudIndex(hop_minutes=30, daily_volume=Decimal("500"), bucket_minutes=15)
+    assert await index.sync(db_session) >= 1
+    assert index.check("46818137083", NOW + timedelta(minutes=10), 52, Decimal("250")) == [
+        STATION_HOP, DAILY_VOLUME,
+    ]
+
+    # Later syncs only read rows inserted since.
+    await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "46818137083", station_id=53, timestamp=NOW + timedelta(hours=2), price_per_liter="5.10",
+    ))
+    assert await index.sync(db_session) == 1
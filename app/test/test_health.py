@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 from httpx import AsyncClient, ASGITransport
 from unittest.mock import patch, AsyncMock
@@ -78,3 +79,96 @@ async def test_health_endpoint_with_fake_db_error():
     assert resp.status_code == 200
     data = resp.json()
     assert data["database"].startswith("error:")
+
+
+@pytest.mark.asyncio
+async def test_liveness_does_no_io():
+    def fail_get_db():
+        raise AssertionError("liveness must not open a session")
+
+    app.dependency_overrides[get_db] = fail_get_db
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        resp = await ac.get("/health/live")
+    app.dependency_overrides.pop(get_db, None)
+
+    assert resp.status_code == 200
+    assert resp.json() == {"status": "ok"}
+
+
+@pytest.mark.asyncio
+async def test_readiness_503_before_first_check(client):
+    from app.core.health_checker import health_checker
+
+    health_checker.snapshot = None
+    resp = await client.get("/health/ready")
+    assert resp.status_code == 503
+    assert resp.json()["reasons"] == ["starting"]
+
+
+@pytest.mark.asyncio
+async def test_readiness_serves_cached_snapshot(client, monkeypatch):
+    from app.core.health_checker import health_checker
+    from app.core.warmup import warmup_state
+
+    monkeypatch.setattr(warmup_state, "duration_seconds", 0.1)
+    snapshot = await health_checker.refresh()
+    assert snapshot["ready"] is True
+    assert snapshot["checks"]["database"]["status"] == "connected"
+    assert snapshot["checks"]["redis"]["status"] == "disabled"
+    assert "saturation" in snapshot["pool"]
+    assert "event_loop_lag_ms" in snapshot
+
+    with patch("app.core.health_checker.check_database", AsyncMock(side_effect=AssertionError)):
+        resp = await client.get("/health/ready")
+    assert resp.status_code == 200
+    assert resp.json()["checked_at"] == snapshot["checked_at"]
+
+
+@pytest.mark.asyncio
+async def test_readiness_fails_on_extra_check_and_loop_lag(client):
+    from app.core.health_checker import HealthChecker
+
+    checker = HealthChecker()
+
+    async def broken_queue():
+        return {"status": "error: backlog"}
+
+    checker.register_check("write_queue", broken_queue)
+    checker.loop_lag_ms = 10_000
+    snapshot = await checker.refresh()
+    assert snapshot["ready"] is False
+    assert "write_queue" in snapshot["reasons"]
+    assert "event_loop_lag" in snapshot["reasons"]
+
+
+@pytest.mark.asyncio
+async def test_health_checker_start_and_stop():
+    from app.core.health_checker import HealthChecker
+
+    checker = HealthChecker(interval=0.01)
+    checker.start()
+    checker.start()
+    assert len(checker._tasks) == 2
+    await asyncio.sleep(0.05)
+    await checker.stop()
+    assert checker.snapshot is not None
+    assert checker._tasks == []
+
+
+@pytest.mark.asyncio
+async def test_database_check_times_out_while_connecting(monkeypatch):
+    from app.core import health_checker as checker_module
+
+    class HangingEngine:
+        def connect(self):
+            class Hanging:
+                async def __aenter__(self):
+                    await asyncio.sleep(10)
+
+                async def __aexit__(self, *exc):
+                    return False
+            return Hanging()
+
+    monkeypatch.setattr(checker_module, "HEALTH_CHECK_TIMEOUT_SECONDS", 0.01)
+    result = await asyncio.wait_for(checker_module.check_database(HangingEngine()), 1)
+    assert result == {"status": "error: timeout"}
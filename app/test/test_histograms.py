@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import delete
+
+from app.core.sketches import BucketHistogram, sketch_store
+from app.models.abastecimento import Sketch
+from app.services.histogram_service import PRICE_HISTOGRAMS, HistogramService
+
+DAY = datetime(2026, 4, 14, 12, 0, tzinfo=timezone.utc)
+
+
+def test_buckets_merge_and_coarsen_exactly():
+    a, b = BucketHistogram(Decimal("0.01")), BucketHistogram(Decimal("0.01"))
+    for price in ("5.89", "5.89", "5.90", "6.05"):
+        a.add(Decimal(price))
+    b.add(Decimal("5.899"), 3)
+    a.merge(BucketHistogram.from_bytes(b.to_bytes()))
+
+    assert a.n == 7
+    assert a.buckets() == [
+        (Decimal("5.89"), Decimal("5.90"), 5),
+        (Decimal("5.90"), Decimal("5.91"), 1),
+        (Decimal("6.05"), Decimal("6.06"), 1),
+    ]
+    assert a.coarsen(Decimal("0.10")).buckets() == [
+        (Decimal("5.80"), Decimal("5.90"), 5),
+        (Decimal("5.90"), Decimal("6.00"), 1),
+        (Decimal("6.00"), Decimal("6.10"), 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_histogram_merges_days_and_stations(client, db_session, refueling_payload):
+    day1, day2 = DAY, DAY + timedelta(days=1)
+    for payload in [
+        refueling_payload("81400000001", station_id=81, timestamp=day1, price_per_liter="5.89"),
+        refueling_payload("81400000001", station_id=82, timestamp=day1, price_per_liter="5.89"),
+        refueling_payload("81400000001", station_id=81, timestamp=day2, price_per_liter="5.95"),
+        refueling_payload("81400000001", station_id=81, timestamp=day2, fuel_type="ETANOL", price_per_liter="4.10"),
+    ]:
+        response = await client.post("/api/v1/abastecimentos", json=payload)
+        assert response.status_code == 201
+    # Part of the counters stored, part still pending in this process.
+    await sketch_store.flush(db_session)
+    await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "81400000001", station_id=82, timestamp=day2, price_per_liter="5.95",
+    ))
+
+    async def histogram(start, end, **params):
+        response = await client.get(
+            "/api/v1/estatisticas/histograma",
+            params={"start": start.date().isoformat(), "end": end.date().isoformat(), **params},
+        )
+        assert response.status_code == 200
+        return {
+            row["fuel_type"]: [(bucket["lower"], bucket["count"]) for bucket in row["buckets"]]
+            for row in response.json()["data"]
+        }
+
+    assert await histogram(day1, day2, station_id=81) == {
+        "ETANOL": [("4.10", 1)],
+        "GASOLINA": [("5.89", 1), ("5.95", 1)],
+    }
+    assert await histogram(day1, day2, station_id=82, fuel_type="GASOLINA") == {
+        "GASOLINA": [("5.89", 1), ("5.95", 1)],
+    }
+    assert await histogram(day2, day2, fuel_type="GASOLINA", station_id=81) == {"GASOLINA": [("5.95", 1)]}
+
+    coarse = await client.get("/api/v1/estatisticas/histograma", params={
+        "start": day1.date().isoformat(), "end": day2.date().isoformat(),
+        "fuel_type": "GASOLINA", "station_id": 81, "bucket_width": "0.10",
+    })
+    row = coarse.json()["data"][0]
+    assert row["bucket_width"] == "0.10" and row["count"] == 2
+    assert row["buckets"] == [{"lower": "5.80", "upper": "5.90", "count": 1}, {"lower": "5.90", "upper": "6.00", "count": 1}]
+
+
+@pytest.mark.asyncio
+async def test_histogram_rejects_bad_parameters(client):
+    params = {"start": "2026-04-14", "end": "2026-04-15"}
+    assert (await client.get("/api/v1/estatisticas/histograma", params={**params, "bucket_width": "0.015"})).status_code == 400
+    assert (await client.get("/api/v1/estatisticas/histograma", params={"start": "2026-04-15", "end": "2026-04-14"})).status_code == 400
+    assert (await client.get("/api/v1/estatisticas/histograma", params={"start": "2026-04-14"})).status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_rebuild_recomputes_counters_from_refuelings(client, db_session, refueling_payload):
+    day = DAY + timedelta(days=5)
+    for price in ("6.01", "6.01", "6.30"):
+        response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            "81400000001", station_id=83, timestamp=day, price_per_liter=price,
+        ))
+        assert response.status_code == 201
+    await sketch_store.flush(db_session)
+    # Counters lost (or built with another bucket width).
+    await db_session.execute(delete(Sketch).where(Sketch.kind == PRICE_HISTOGRAMS, Sketch.day == day.date()))
+    await db_session.commit()
+
+    assert await HistogramService.rebuild(db_session, day.date(), day.date()) >= 1
+
+    result = await HistogramService.price_histogram(db_session, day.date(), day.date(), "GASOLINA", 83)
+    assert [(bucket["lower"], bucket["count"]) for bucket in result["data"][0]["buckets"]] == [
+        (Decimal("6.01"), 2),
+        (Decimal("6.30"), 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_drops_deltas_it_already_counted_and_keeps_later_ones(client, db_session, refueling_payload):
+    day = DAY + timedelta(days=7)
+
+    async def post(price, when=day):
+        response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            "81400000001", station_id=84, timestamp=when, price_per_liter=price,
+        ))
+        assert response.status_code == 201
+
+    await post("5.10")
+    await sketch_store.flush(db_session)
+    # Still pending in a worker when the rebuild reads the refuelings.
+    await post("5.20")
+    # 22:30 in Brasília is already the next UTC day.
+    await post("5.30", (day + timedelta(days=1)).replace(hour=1, minute=30).astimezone(timezone(timedelta(hours=-3))))
+
+    await HistogramService.rebuild(db_session, day.date(), (day + timedelta(days=1)).date())
+    await post("5.40")
+
+    async def counts():
+        result = await HistogramService.price_histogram(
+            db_session, day.date(), (day + timedelta(days=1)).date(), "GASOLINA", 84
+        )
+        return [(bucket["lower"], bucket["count"]) for bucket in result["data"][0]["buckets"]]
+
+    expected = [(Decimal("5.10"), 1), (Decimal("5.20"), 1), (Decimal("5.30"), 1), (Decimal("5.40"), 1)]
+    assert await counts() == expected
+    await sketch_store.flush(db_session)
+    assert await counts() == expected
+    day_two = await HistogramService.price_histogram(
+        db_session, (day + timedelta(days=1)).date(), (day + timedelta(days=1)).date(), "GASOLINA", 84
+    )
+    assert [bucket["lower"] for bucket in day_two["data"][0]["buckets"]] == [Decimal("5.30")]
@@ -0,0 +1,124 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.core.live_feed import BroadcastHub, FeedFilter, HubFull, encode_sse, live_hub
+from app.routers.live_feed import sse_events, websocket_api_key
+from app.services import abastecimento_service
+
+
+def _event(id, fuel_type="DIESEL", station_id=1, improper=False):
+    return {"id": id, "fuel_type": fuel_type, "station_id": station_id, "improper_data": improper}
+
+
+def test_filter_matches_only_selected_events():
+    feed_filter = FeedFilter(fuel_type="DIESEL", improper=True)
+    assert feed_filter.matches(_event(1, improper=True))
+    assert not feed_filter.matches(_event(2, improper=False))
+    assert not feed_filter.matches(_event(3, fuel_type="ETANOL", improper=True))
+    assert FeedFilter().matches(_event(4))
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_drops_oldest_and_gets_lagged_notice():
+    hub = BroadcastHub(queue_size=2)
+    subscription = hub.subscribe(FeedFilter())
+    hub.publish([_event(1), _event(2), _event(3), _event(4)])
+
+    assert await subscription.next(0.1) == ("lagged", {"missed": 2})
+    assert [(await subscription.next(0.1))[1]["id"] for _ in range(2)] == [3, 4]
+    assert await subscription.next(0.01) is None
+
+
+def test_hub_rejects_subscribers_past_the_limit():
+    hub = BroadcastHub(max_subscribers=1)
+    subscription = hub.subscribe(FeedFilter())
+    with pytest.raises(HubFull):
+        hub.subscribe(FeedFilter())
+    hub.unsubscribe(subscription)
+    hub.subscribe(FeedFilter())
+
+
+@pytest.mark.asyncio
+async def test_posted_refueling_reaches_matching_subscriber(client, refueling_payload):
+    subscription = live_hub.subscribe(FeedFilter(station_id=31))
+    other = live_hub.subscribe(FeedFilter(station_id=32))
+    try:
+        response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            "52998224725", station_id=31, fuel_type="DIESEL",
+        ))
+        assert response.status_code == 201
+
+        kind, event = await subscription.next(1)
+        assert kind == "refueling"
+        assert event["id"] == response.json()["id"]
+        assert event["driver_cpf"] == "52998224725"
+        assert await other.next(0.01) is None
+    finally:
+        live_hub.unsubscribe(subscription)
+        live_hub.unsubscribe(other)
+
+
+@pytest.mark.asyncio
+async def test_failing_listener_does_not_break_ingestion(client, refueling_payload):
+    def broken(events):
+        raise RuntimeError("listener down")
+
+    abastecimento_service.add_ingest_listener(broken)
+    try:
+        response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            "39053344705", station_id=31, fuel_type="DIESEL",
+        ))
+    finally:
+        abastecimento_service.remove_ingest_listener(broken)
+    assert response.status_code == 201
+
+
+class _Request:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+@pytest.mark.asyncio
+async def test_sse_stream_encodes_events_and_keeps_alive():
+    hub_size = len(live_hub)
+    subscription = live_hub.subscribe(FeedFilter())
+    request = _Request()
+    stream = sse_events(request, subscription, keepalive=0.01)
+
+    assert await stream.__anext__() == ": keepalive\n\n"
+    live_hub.publish([_event(7)])
+    chunk = await stream.__anext__()
+    assert chunk == encode_sse("refueling", _event(7))
+    assert chunk.startswith("id: 7\nevent: refueling\ndata: ")
+
+    request.disconnected = True
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+    assert len(live_hub) == hub_size
+
+
+async def _accept_any_key():
+    return "test-key"
+
+
+def test_websocket_receives_published_events():
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        with pytest.raises(WebSocketDisconnect) as rejected:
+            with test_client.websocket_connect("/api/v1/abastecimentos/ws"):
+                pass
+        assert rejected.value.code == 1008
+
+        app.dependency_overrides[websocket_api_key] = _accept_any_key
+        try:
+            with test_client.websocket_connect("/api/v1/abastecimentos/ws?fuel_type=ETANOL") as websocket:
+                assert websocket.receive_json() == {"type": "subscribed"}
+                test_client.portal.call(live_hub.publish, [_event(1), _event(2, fuel_type="ETANOL")])
+                assert websocket.receive_json() == {"type": "refueling", "data": _event(2, fuel_type="ETANOL")}
+        finally:
+            app.dependency_overrides.pop(websocket_api_key, None)
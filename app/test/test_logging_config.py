@@ -0,0 +1,80 @@
+import json
+import logging
+import queue
+
+import pytest
+
+from app.core.logging_config import (
+    DroppingQueueHandler,
+    JsonFormatter,
+    SamplingFilter,
+    _parse_sample_rates,
+    mask_cpf,
+    setup_logging,
+)
+
+
+def _record(name="app.test", level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extras():
+    line = JsonFormatter().format(_record(server_timing={"total_ms": 1.5}))
+    payload = json.loads(line)
+    assert payload["message"] == "hello world"
+    assert payload["level"] == "INFO"
+    assert payload["logger"] == "app.test"
+    assert payload["server_timing"] == {"total_ms": 1.5}
+
+
+def test_sampling_filter_uses_closest_ancestor_and_keeps_warnings():
+    sampler = SamplingFilter({"app.api": 0.0, "app.api.v1.keep": 1.0})
+    assert sampler.filter(_record("app.api.v1.abastecimento")) is False
+    assert sampler.filter(_record("app.api.v1.keep.child")) is True
+    assert sampler.filter(_record("app.routers.health")) is True
+    assert sampler.filter(_record("app.api.v1.abastecimento", level=logging.WARNING)) is True
+
+
+def test_queue_handler_drops_and_counts_when_full():
+    dropped = []
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1), on_drop=dropped.append)
+    handler.handle(_record("app.one"))
+    handler.handle(_record("app.two"))
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped["app.two"] == 1
+    assert dropped == ["app.two"]
+
+
+def test_queue_handler_defers_formatting():
+    handler = DroppingQueueHandler(queue.Queue())
+    handler.handle(_record(msg="cpf %s", args=("11144477735",)))
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "cpf %s"
+    assert queued.args == ("11144477735",)
+
+
+def test_mask_cpf_keeps_last_two_digits():
+    assert mask_cpf("11144477735") == "*********35"
+    assert mask_cpf(None) == ""
+
+
+@pytest.mark.asyncio
+async def test_history_log_lines_do_not_carry_cpf(client, caplog):
+    with caplog.at_level(logging.INFO, logger="app.routers.motoristas"):
+        await client.get("/api/v1/motoristas/11144477735/historico")
+    messages = [r.getMessage() for r in caplog.records if r.name == "app.routers.motoristas"]
+    assert messages
+    assert not any("11144477735" in m for m in messages)
+
+
+def test_parse_sample_rates():
+    assert _parse_sample_rates("app.a=0.1, app.b=0.5,,bad") == {"app.a": 0.1, "app.b": 0.5}
+
+
+def test_setup_logging_installs_queue_handler():
+    handler = setup_logging()
+    assert logging.getLogger().handlers == [handler]
+    assert isinstance(handler, DroppingQueueHandler)
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.coalescing import SingleFlight
+from app.core.metrics import instrument_engine, record_cache
+from app.core.stale_cache import stale_pages, with_stale_fallback
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_exposes_prometheus_text(client):
+    await client.get("/health")
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "http_requests_total" in response.text
+    assert "http_request_duration_seconds_bucket" in response.text
+
+
+@pytest.mark.asyncio
+async def test_request_metrics_use_route_template(client):
+    before = _sample(
+        "http_requests_total",
+        method="GET", route="/api/v1/motoristas/{cpf}/historico", status="200",
+    )
+    await client.get("/api/v1/motoristas/11144477735/historico")
+    after = _sample(
+        "http_requests_total",
+        method="GET", route="/api/v1/motoristas/{cpf}/historico", status="200",
+    )
+    assert after == before + 1
+
+
+@pytest.mark.asyncio
+async def test_db_query_metrics_from_engine_events(db_session):
+    instrument_engine(db_session.bind)
+    instrument_engine(db_session.bind)
+    before = _sample("db_queries_total", operation="SELECT")
+    await db_session.execute(text("SELECT 1"))
+    assert _sample("db_queries_total", operation="SELECT") == before + 1
+    assert _sample("db_query_duration_seconds_count", operation="SELECT") >= 1
+
+
+@pytest.mark.asyncio
+async def test_failed_statement_is_counted_and_does_not_leak_start_time(db_session):
+    instrument_engine(db_session.bind)
+    before = _sample("db_query_errors_total", operation="SELECT")
+    with pytest.raises(Exception):
+        await db_session.execute(text("SELECT * FROM missing_table"))
+    assert _sample("db_query_errors_total", operation="SELECT") == before + 1
+
+    connection = await db_session.connection()
+    assert connection.sync_connection.info.get("query_start_time") == []
+    await db_session.rollback()
+
+
+@pytest.mark.asyncio
+async def test_ingestion_and_improper_counters(client):
+    before = _sample("refuelings_ingested_total", fuel_type="ETANOL")
+    response = await client.post("/api/v1/abastecimentos", json={
+        "station_id": 3,
+        "timestamp": "2024-12-20T12:00:00Z",
+        "fuel_type": "ETANOL",
+        "price_per_liter": "3.90",
+        "volume_liters": "25",
+        "driver_cpf": "11144477735",
+    })
+    assert response.status_code == 201
+    assert _sample("refuelings_ingested_total", fuel_type="ETANOL") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_caches_report_hits_and_misses(client):
+    def lookups(cache):
+        return _sample("cache_requests_total", cache=cache, result="hit") + _sample(
+            "cache_requests_total", cache=cache, result="miss"
+        )
+
+    before = {cache: lookups(cache) for cache in ("price_statistics", "stale_pages")}
+    response = await client.post("/api/v1/abastecimentos", json={
+        "station_id": 3,
+        "timestamp": "2024-12-20T12:00:00Z",
+        "fuel_type": "ETANOL",
+        "price_per_liter": "3.95",
+        "volume_liters": "25",
+        "driver_cpf": "11144477735",
+    })
+    assert response.status_code == 201
+    assert lookups("price_statistics") == before["price_statistics"] + 1
+
+    hits = _sample("cache_requests_total", cache="test_coalescing", result="hit")
+
+    async def query():
+        await asyncio.sleep(0.01)
+
+    flight = SingleFlight("test")
+    await asyncio.gather(*(flight.do(("q",), query) for _ in range(3)))
+    assert _sample("cache_requests_total", cache="test_coalescing", result="hit") == hits + 2
+
+    async def circuit_open():
+        raise CircuitOpenError("primary", 1)
+
+    stale_hits = _sample("cache_requests_total", cache="stale_pages", result="hit")
+    stale_pages.put(("metrics-test",), {"data": []})
+    await with_stale_fallback("test", ("metrics-test",), circuit_open)
+    await with_stale_fallback("test", ("metrics-missing",), circuit_open)
+    assert lookups("stale_pages") == before["stale_pages"] + 2
+    assert _sample("cache_requests_total", cache="stale_pages", result="hit") == stale_hits + 1
+    stale_pages.clear()
+
+
+def test_cache_counters():
+    before = _sample("cache_requests_total", cache="test", result="hit")
+    record_cache("test", hit=True)
+    record_cache("test", hit=False)
+    assert _sample("cache_requests_total", cache="test", result="hit") == before + 1
+    assert _sample("cache_requests_total", cache="test", result="miss") >= 1
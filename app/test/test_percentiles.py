@@ -0,0 +1,116 @@
+import random
+import time
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.core.sketches import KllSketch, SketchStore
+from app.models.abastecimento import Sketch
+from app.services import abastecimento_service
+from app.services.abastecimento_service import price_thresholds
+from app.services.percentile_service import PRICES
+
+
+def _rank(values, value):
+    return sum(1 for v in values if v < value) / len(values)
+
+
+def test_kll_quantiles_stay_within_rank_error_after_merges():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(1.7, 0.2) for _ in range(50000)]
+    parts = [KllSketch(k=200) for _ in range(4)]
+    for i, value in enumerate(values):
+        parts[i % 4].update(value)
+    sketch = parts[0]
+    for part in parts[1:]:
+        sketch.merge(KllSketch.from_bytes(part.to_bytes()))
+
+    assert sketch.n == len(values)
+    assert sketch.min == min(values) and sketch.max == max(values)
+    assert sum(len(level) for level in sketch.levels) < 3 * 200
+    for q in (0.5, 0.9, 0.99):
+        assert abs(_rank(values, sketch.quantile(q)) - q) < 0.02
+
+
+@pytest.mark.asyncio
+async def test_workers_merge_their_deltas_into_one_row(db_session):
+    workers = [SketchStore(), SketchStore()]
+    for store in workers:
+        store.register(PRICES, KllSketch)
+    for i in range(100):
+        workers[i % 2].pending(PRICES, "GASOLINA:9001").update(float(i))
+
+    for store in workers:
+        assert await store.flush(db_session) == 1
+        assert await store.flush(db_session) == 0
+
+    rows = (await db_session.execute(
+        select(Sketch).where(Sketch.kind == PRICES, Sketch.key == "GASOLINA:9001")
+    )).scalars().all()
+    assert len(rows) == 1
+    assert KllSketch.from_bytes(rows[0].payload).n == 100
+
+    # Reads see the stored sketch plus what was not flushed yet.
+    workers[0].pending(PRICES, "GASOLINA:9001").update(500.0)
+    fetched = await workers[0].fetch(db_session, PRICES, "GASOLINA:")
+    assert fetched["GASOLINA:9001"].n == 101
+    assert fetched["GASOLINA:9001"].max == 500.0
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_deltas(db_session, monkeypatch):
+    store = SketchStore()
+    store.register(PRICES, KllSketch)
+    store.pending(PRICES, "DIESEL:9002").update(5.0)
+
+    async def failing_commit():
+        raise RuntimeError("commit failed")
+
+    monkeypatch.setattr(db_session, "commit", failing_commit)
+    with pytest.raises(RuntimeError):
+        await store.flush(db_session)
+    monkeypatch.undo()
+
+    store.pending(PRICES, "DIESEL:9002").update(6.0)
+    assert await store.flush(db_session) == 1
+    fetched = await store.fetch(db_session, PRICES, "DIESEL:9002")
+    assert fetched["DIESEL:9002"].n == 2
+
+
+@pytest.mark.asyncio
+async def test_percentiles_endpoint_reflects_ingested_prices(client, refueling_payload):
+    for i, price in enumerate(["4.00", "4.10", "4.20", "4.30", "9.90"]):
+        response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            f"1234567890{i}", station_id=61, fuel_type="ETANOL", price_per_liter=price, volume_liters="20",
+        ))
+        assert response.status_code == 201
+
+    response = await client.get("/api/v1/estatisticas/percentis", params={"fuel_type": "ETANOL", "station_id": 61})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["sources"] == ["sketch"]
+    [row] = body["data"]
+    assert row["station_id"] == 61
+    assert row["count"] == 5
+    assert Decimal(row["min_price"]) == Decimal("4.00")
+    assert Decimal(row["p50"]) == Decimal("4.20")
+    assert Decimal(row["max_price"]) == Decimal("9.90")
+
+
+@pytest.mark.asyncio
+async def test_percentile_anomaly_rule(client, monkeypatch, refueling_payload):
+    monkeypatch.setattr(abastecimento_service, "ANOMALY_RULE", "percentile")
+    price_thresholds._thresholds = {"ETANOL": Decimal("4.50")}
+    price_thresholds.loaded_at = time.monotonic()
+    try:
+        above = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            "98765432100", station_id=62, fuel_type="ETANOL", price_per_liter="4.60", volume_liters="20",
+        ))
+        below = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            "98765432100", station_id=62, fuel_type="ETANOL", price_per_liter="4.40", volume_liters="20",
+        ))
+    finally:
+        price_thresholds.clear()
+    assert above.json()["improper_data"] is True
+    assert below.json()["improper_data"] is False
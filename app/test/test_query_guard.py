@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from prometheus_client import REGISTRY
+
+from app.core import query_guard
+from app.core.coalescing import SingleFlight
+from app.core.query_guard import HTTP_499_CLIENT_CLOSED_REQUEST, guarded
+from app.services.abastecimento_service import RefuelingService
+
+
+def _sample(name, endpoint):
+    return REGISTRY.get_sample_value(name, {"endpoint": endpoint}) or 0.0
+
+
+class FakeRequest:
+    def __init__(self, disconnected=False):
+        self.disconnected = disconnected
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+class FakeSession:
+    def __init__(self, request=None, timeout_ms=None):
+        self.info = {"request": request, "endpoint": "fake_endpoint", "statement_timeout_ms": timeout_ms}
+        self.rolled_back = False
+
+    async def rollback(self):
+        self.rolled_back = True
+
+
+def test_parse_timeouts_skips_invalid_entries():
+    assert query_guard._parse_timeouts("list_refuelings=2000, historico_por_cpf = 500,bad,x=y") == {
+        "list_refuelings": 2000.0,
+        "historico_por_cpf": 500.0,
+    }
+
+
+def test_timeout_for_uses_override_then_default(monkeypatch):
+    monkeypatch.setattr(query_guard, "endpoint_timeouts", {"list_refuelings": 1500.0, "off": 0.0})
+    monkeypatch.setattr(query_guard, "STATEMENT_TIMEOUT_MS", 5000.0)
+    assert query_guard.timeout_for("list_refuelings") == 1500.0
+    assert query_guard.timeout_for("other") == 5000.0
+    assert query_guard.timeout_for("off") is None
+
+
+@pytest.mark.asyncio
+async def test_unconfigured_session_runs_query_directly():
+    class Plain:
+        pass
+
+    async def query():
+        return 42
+
+    assert await guarded(Plain(), query()) == 42
+
+
+@pytest.mark.asyncio
+async def test_timeout_cancels_query_and_returns_504(monkeypatch):
+    monkeypatch.setattr(query_guard, "CLIENT_TIMEOUT_GRACE_SECONDS", 0)
+    session = FakeSession(FakeRequest(), timeout_ms=20)
+    cancelled = asyncio.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    before = _sample("db_statement_timeouts_total", "fake_endpoint")
+    with pytest.raises(HTTPException) as exc:
+        await guarded(session, slow())
+
+    assert exc.value.status_code == 504
+    assert cancelled.is_set()
+    assert session.rolled_back
+    assert _sample("db_statement_timeouts_total", "fake_endpoint") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_cancels_query(monkeypatch):
+    monkeypatch.setattr(query_guard, "DISCONNECT_POLL_INTERVAL_MS", 5)
+    request = FakeRequest()
+    session = FakeSession(request, timeout_ms=None)
+    cancelled = asyncio.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def disconnect_soon():
+        await asyncio.sleep(0.02)
+        request.disconnected = True
+
+    before = _sample("db_query_cancellations_total", "fake_endpoint")
+    asyncio.ensure_future(disconnect_soon())
+    with pytest.raises(HTTPException) as exc:
+        await guarded(session, slow())
+
+    assert exc.value.status_code == HTTP_499_CLIENT_CLOSED_REQUEST
+    assert cancelled.is_set()
+    assert session.rolled_back
+    assert _sample("db_query_cancellations_total", "fake_endpoint") == before + 1
+
+
+@pytest.mark.asyncio
+async def test_timed_out_leader_does_not_wait_for_shared_query(monkeypatch):
+    monkeypatch.setattr(query_guard, "CLIENT_TIMEOUT_GRACE_SECONDS", 0)
+    flight = SingleFlight("test")
+
+    async def shared_query():
+        await asyncio.sleep(0.3)
+        return "rows"
+
+    leader_session = FakeSession(FakeRequest(), timeout_ms=20)
+    follower_session = FakeSession(FakeRequest(), timeout_ms=5000)
+    loop = asyncio.get_running_loop()
+
+    async def leader():
+        started = loop.time()
+        with pytest.raises(HTTPException) as exc:
+            await guarded(leader_session, flight.do(("shared",), shared_query))
+        return exc.value.status_code, loop.time() - started
+
+    async def follower():
+        await asyncio.sleep(0)
+        return await guarded(follower_session, flight.do(("shared",), shared_query))
+
+    (status_code, elapsed), rows = await asyncio.gather(leader(), follower())
+
+    assert status_code == 504
+    assert elapsed < 0.2
+    assert rows == "rows"
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_list_endpoint_applies_its_timeout(client, monkeypatch):
+    monkeypatch.setattr(query_guard, "endpoint_timeouts", {"list_refuelings": 10.0})
+    monkeypatch.setattr(query_guard, "CLIENT_TIMEOUT_GRACE_SECONDS", 0)
+
+    async def slow_count(db, query):
+        await asyncio.sleep(1)
+        return 0
+
+    monkeypatch.setattr(RefuelingService, "count", staticmethod(slow_count))
+
+    response = await client.get("/api/v1/abastecimentos?fuel_type=ETANOL&page=3")
+    assert response.status_code == 504
@@ -0,0 +1,86 @@
+import random
+from collections import Counter
+from decimal import Decimal
+
+import pytest
+
+from app.core.sketches import SpaceSaving
+
+
+def _stream(seed=5, size=20000):
+    rng = random.Random(seed)
+    # Zipf-like: a few heavy keys and a long tail.
+    return [(f"k{int(rng.paretovariate(1.2))}", rng.uniform(10, 60)) for _ in range(size)]
+
+
+def test_space_saving_keeps_heavy_hitters_within_error():
+    stream = _stream()
+    exact = Counter()
+    sketch = SpaceSaving(capacity=50)
+    for key, weight in stream:
+        exact[key] += weight
+        sketch.add(key, weight)
+
+    assert len(sketch.counters) <= 50
+    top = sketch.top(5)
+    assert [key for key, _, _ in top] == [key for key, _ in exact.most_common(5)]
+    for key, count, error in top:
+        assert count - error <= exact[key] * (1 + 1e-9)
+        assert exact[key] <= count * (1 + 1e-9)
+
+
+def test_merged_sketches_bound_the_union():
+    stream = _stream(seed=9)
+    exact = Counter()
+    parts = [SpaceSaving(capacity=50) for _ in range(3)]
+    for i, (key, weight) in enumerate(stream):
+        exact[key] += weight
+        parts[i % 3].add(key, weight)
+    union = SpaceSaving(capacity=50)
+    for part in parts:
+        union.merge(SpaceSaving.from_bytes(part.to_bytes()))
+
+    assert union.total == pytest.approx(sum(exact.values()))
+    for key, count, error in union.top(5):
+        assert count - error <= exact[key] * (1 + 1e-9)
+        assert exact[key] <= count * (1 + 1e-9)
+    assert {key for key, _, _ in union.top(3)} == {key for key, _ in exact.most_common(3)}
+
+
+@pytest.mark.asyncio
+async def test_ranking_endpoint_matches_exact_sql(client, refueling_payload):
+    for cpf, station_id, volume in [
+        ("61700000001", 81, "5000"),
+        ("61700000002", 82, "4000"),
+        ("61700000001", 82, "1500"),
+        ("61700000003", 81, "3000"),
+    ]:
+        response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            cpf, station_id=station_id, fuel_type="DIESEL", price_per_liter="6.00", volume_liters=volume,
+        ))
+        assert response.status_code == 201
+
+    response = await client.get(
+        "/api/v1/estatisticas/ranking", params={"metric": "driver_liters", "days": 1, "limit": 2, "verify": True}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert [(row["key"], Decimal(row["value"])) for row in body["data"]] == [
+        ("61700000001", Decimal("6500.00")),
+        ("61700000002", Decimal("4000.00")),
+    ]
+    assert body["verification"]["matches"] is True
+    assert [row["key"] for row in body["verification"]["exact"]] == ["61700000001", "61700000002"]
+
+    response = await client.get("/api/v1/estatisticas/ranking", params={"metric": "driver_spend", "limit": 1})
+    assert response.json()["data"][0]["key"] == "61700000001"
+    assert "verification" not in response.json()
+
+    response = await client.get("/api/v1/estatisticas/ranking", params={"metric": "station_liters", "limit": 2})
+    assert [row["key"] for row in response.json()["data"]] == ["81", "82"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_metric_is_rejected(client):
+    response = await client.get("/api/v1/estatisticas/ranking", params={"metric": "fuel_liters"})
+    assert response.status_code == 422
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core import database
+from app.models.abastecimento import Base
+
+
+@pytest_asyncio.fixture
+async def replica(tmp_path, monkeypatch):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"
+    replica_engine = create_async_engine(url)
+    async with replica_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await replica_engine.dispose()
+
+    database.configure_replicas([url])
+    monkeypatch.setattr(database, "REPLICA_MAX_LAG_SECONDS", 60.0)
+    monkeypatch.setattr(database, "REPLICA_WAIT_TIMEOUT_SECONDS", 0.0)
+    yield url
+    for engine in database.replica_engines:
+        await engine.dispose()
+    database.configure_replicas([])
+
+
+@pytest.mark.asyncio
+async def test_write_returns_consistency_token(client, refueling_payload):
+    response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "52998224725", timestamp="2024-12-20T12:00:00Z", price_per_liter="5.50",
+    ))
+    assert response.status_code == 201
+    assert response.headers[database.CONSISTENCY_HEADER].startswith("ts:")
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica_by_default(client, replica, refueling_payload):
+    cpf = "39053344705"
+    await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        cpf, timestamp="2024-12-20T12:00:00Z", price_per_liter="5.50",
+    ))
+
+    response = await client.get(f"/api/v1/motoristas/{cpf}/historico")
+    assert response.status_code == 200
+    assert response.json()["total"] == 0
+
+
+@pytest.mark.asyncio
+async def test_consistency_token_reads_from_primary_when_replica_lags(client, replica, refueling_payload):
+    cpf = "86288366757"
+    created = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        cpf, timestamp="2024-12-20T12:00:00Z", price_per_liter="5.50",
+    ))
+    token = created.headers[database.CONSISTENCY_HEADER]
+
+    response = await client.get(
+        f"/api/v1/motoristas/{cpf}/historico",
+        headers={database.CONSISTENCY_HEADER: token},
+    )
+    assert response.json()["total"] == 1
+
+    response = await client.get(
+        "/api/v1/abastecimentos",
+        headers={database.CONSISTENCY_HEADER: database.PRIMARY_TOKEN},
+    )
+    assert response.json()["total"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_replica_used_once_token_is_older_than_max_lag(client, replica, monkeypatch, refueling_payload):
+    monkeypatch.setattr(database, "REPLICA_MAX_LAG_SECONDS", 0.0)
+    cpf = "71428793860"
+    created = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        cpf, timestamp="2024-12-20T12:00:00Z", price_per_liter="5.50",
+    ))
+
+    response = await client.get(
+        f"/api/v1/motoristas/{cpf}/historico",
+        headers={database.CONSISTENCY_HEADER: created.headers[database.CONSISTENCY_HEADER]},
+    )
+    assert response.json()["total"] == 0
+
+
+@pytest.mark.asyncio
+async def test_lagging_replica_session_is_closed_before_primary_read(replica):
+    closed = []
+
+    class TrackedSession(database.AsyncSession):
+        async def close(self):
+            closed.append(self)
+            await super().close()
+
+    replica_engine = database.replica_engines[0]
+    # Set directly: the fixture's teardown resets the cycle with configure_replicas.
+    database._replica_cycle = iter([sessionmaker(bind=replica_engine, class_=TrackedSession)])
+
+    class Request:
+        headers = {database.CONSISTENCY_HEADER: "lsn:0/0"}
+        scope = {}
+
+    primary = object()
+    generator = database.get_read_db(Request(), primary)
+    assert await generator.__anext__() is primary
+    assert len(closed) == 1
+    await generator.aclose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("token", ["lsn:garbage", "lsn:0/0'; --", "ts:soon", "other:1"])
+async def test_malformed_token_falls_back_without_querying(token):
+    class Session:
+        async def execute(self, *args, **kwargs):
+            raise AssertionError("malformed token reached the database")
+
+    assert await database._wait_for_replica(Session(), token) is False
+
+
+@pytest.mark.asyncio
+async def test_fresh_timestamp_token_skips_the_wait(monkeypatch):
+    monkeypatch.setattr(database, "REPLICA_MAX_LAG_SECONDS", 60.0)
+    monkeypatch.setattr(database, "REPLICA_WAIT_TIMEOUT_SECONDS", 5.0)
+    started = time.monotonic()
+    assert await database._wait_for_replica(None, f"ts:{time.time():.6f}") is False
+    assert time.monotonic() - started < 1
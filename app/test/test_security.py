@@ -1,13 +1,25 @@
+import json
 import os
 import pytest
 from fastapi import HTTPException
+from prometheus_client import REGISTRY
 
-from app.core.security import get_api_key
+from app.core import security
+from app.core.security import (
+    ApiKey,
+    RedisTokenBucketLimiter,
+    TokenBucketLimiter,
+    get_api_key,
+    hash_key,
+    load_registry,
+    reload_api_keys,
+)
 
 
 @pytest.mark.asyncio
 async def test_get_api_key_accepts_valid_key():
     os.environ["API_KEY"] = "test-accept-key"
+    reload_api_keys()
     key = await get_api_key("test-accept-key")
     assert key == "test-accept-key"
 
@@ -15,6 +27,7 @@ async def test_get_api_key_accepts_valid_key():
 @pytest.mark.asyncio
 async def test_get_api_key_rejects_invalid_key():
     os.environ["API_KEY"] = "valid-key"
+    reload_api_keys()
     with pytest.raises(HTTPException) as exc:
         await get_api_key("wrong-key")
     assert exc.value.status_code == 403
@@ -26,3 +39,99 @@ async def test_get_api_key_rejects_none():
     with pytest.raises(HTTPException) as exc:
         await get_api_key(None)
     assert exc.value.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_registry_loads_hashed_keys(monkeypatch):
+    monkeypatch.setenv("API_KEYS", json.dumps([
+        {"name": "station-a", "key_sha256": hash_key("key-a"), "rate": 5, "burst": 5},
+    ]))
+    monkeypatch.setenv("API_KEY", "legacy")
+    registry = load_registry()
+
+    assert len(registry) == 2
+    assert registry.lookup("key-a").name == "station-a"
+    assert registry.lookup("legacy").name == "default"
+    assert registry.lookup("key-b") is None
+    assert registry.lookup(None) is None
+
+
+def test_registry_has_no_builtin_key(monkeypatch):
+    monkeypatch.delenv("API_KEY", raising=False)
+    monkeypatch.setenv("API_KEYS", json.dumps([
+        {"name": "station-a", "key_sha256": hash_key("key-a")},
+    ]))
+    registry = load_registry()
+    assert len(registry) == 1
+    assert registry.lookup("vlab-secret-key") is None
+
+    monkeypatch.delenv("API_KEYS")
+    assert len(load_registry()) == 0
+
+
+@pytest.mark.asyncio
+async def test_api_key_not_read_from_env_per_request(monkeypatch):
+    monkeypatch.setenv("API_KEY", "first-key")
+    reload_api_keys()
+    monkeypatch.setenv("API_KEY", "second-key")
+
+    assert await get_api_key("first-key") == "first-key"
+    with pytest.raises(HTTPException):
+        await get_api_key("second-key")
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_each_key_separately():
+    limiter = TokenBucketLimiter()
+    noisy = ApiKey("noisy", hash_key("n"), rate=1, burst=2)
+    quiet = ApiKey("quiet", hash_key("q"), rate=1, burst=2)
+
+    assert await limiter.acquire(noisy) == 0
+    assert await limiter.acquire(noisy) == 0
+    assert await limiter.acquire(noisy) > 0
+    assert await limiter.acquire(quiet) == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_key_gets_429_with_retry_after(monkeypatch):
+    monkeypatch.setenv("API_KEYS", json.dumps([
+        {"name": "tiny", "key_sha256": hash_key("tiny-key"), "rate": 0.5, "burst": 1},
+    ]))
+    reload_api_keys()
+    monkeypatch.setattr(security, "rate_limiter", TokenBucketLimiter())
+
+    assert await get_api_key("tiny-key") == "tiny-key"
+    with pytest.raises(HTTPException) as exc:
+        await get_api_key("tiny-key")
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "2"
+
+    sample = REGISTRY.get_sample_value("api_key_requests_total", {"key": "tiny", "result": "limited"})
+    assert sample >= 1
+
+
+def test_registry_rejects_zero_rate(monkeypatch):
+    monkeypatch.setenv("API_KEYS", json.dumps([
+        {"name": "frozen", "key_sha256": hash_key("k"), "rate": 0, "burst": 5},
+    ]))
+    with pytest.raises(ValueError):
+        load_registry()
+
+
+@pytest.mark.asyncio
+async def test_redis_limiter_falls_back_to_memory_when_redis_fails():
+    from redis.exceptions import ConnectionError as RedisConnectionError
+
+    class BrokenRedis:
+        def register_script(self, script):
+            async def run(keys, args):
+                raise RedisConnectionError("redis down")
+            return run
+
+    limiter = RedisTokenBucketLimiter(BrokenRedis())
+    key = ApiKey("fallback", hash_key("f"), rate=1, burst=1)
+    before = REGISTRY.get_sample_value("rate_limit_fallbacks_total") or 0.0
+
+    assert await limiter.acquire(key) == 0
+    assert await limiter.acquire(key) > 0
+    assert REGISTRY.get_sample_value("rate_limit_fallbacks_total") == before + 2
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from app.core import slow_query
+from app.core.metrics import instrument_engine
+
+
+@pytest.fixture
+def capture_everything(db_session, monkeypatch):
+    instrument_engine(db_session.bind)
+    monkeypatch.setattr(slow_query, "SLOW_QUERY_THRESHOLD_MS", 0.000001)
+    monkeypatch.setattr(slow_query, "SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 0.0)
+    slow_query.slow_queries.clear()
+    yield
+    slow_query.slow_queries.clear()
+
+
+@pytest.mark.asyncio
+async def test_slow_statement_recorded_with_endpoint(client, capture_everything):
+    await client.get("/api/v1/motoristas/11144477735/historico?page=1")
+
+    entries = slow_query.recent_slow_queries()
+    assert entries
+    assert any("refuelings" in e["statement"] for e in entries)
+    assert all(e["endpoint"] == "GET /api/v1/motoristas/{cpf}/historico" for e in entries)
+    assert not any("11144477735" in e["parameters"] for e in entries)
+    assert any(slow_query.REDACTED in e["parameters"] for e in entries)
+
+
+@pytest.mark.asyncio
+async def test_sampled_statement_gets_query_plan(db_session, capture_everything, monkeypatch):
+    monkeypatch.setattr(slow_query, "SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 1.0)
+
+    await db_session.execute(text("SELECT * FROM refuelings WHERE driver_cpf = :cpf"), {"cpf": "1"})
+    await asyncio.gather(*slow_query._explain_tasks)
+
+    entry = slow_query.recent_slow_queries(1)[0]
+    assert entry["endpoint"] is None
+    assert "driver_cpf" in entry["plan"] or "refuelings" in entry["plan"]
+    assert len(slow_query.slow_queries) == 1
+
+
+@pytest.mark.asyncio
+async def test_non_positive_threshold_disables_log(db_session, capture_everything, monkeypatch):
+    monkeypatch.setattr(slow_query, "SLOW_QUERY_THRESHOLD_MS", 0)
+    await db_session.execute(text("SELECT 1"))
+    assert slow_query.recent_slow_queries() == []
+
+
+@pytest.mark.asyncio
+async def test_debug_endpoint_lists_recent_entries(client, capture_everything):
+    await client.get("/api/v1/abastecimentos")
+
+    response = await client.get("/debug/slow-queries?limit=1")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["total"] == 1
+    assert body["data"][0]["endpoint"] == "GET /api/v1/abastecimentos"
+
+
+def test_redact_parameters_masks_pii():
+    class Compiled:
+        positiontup = ["driver_cpf_1", "param_1"]
+
+    class Context:
+        compiled = Compiled()
+
+    redact = slow_query._redact_parameters
+    assert redact(("52998224725", 10), Context(), False) == (slow_query.REDACTED, 10)
+    assert redact({"cpf": "1", "limit": 5}, None, False) == {"cpf": slow_query.REDACTED, "limit": 5}
+    assert redact([("529.982.247-25", "DIESEL")], None, True) == [(slow_query.REDACTED, "DIESEL")]
+
+
+def test_explain_statement_by_dialect():
+    assert slow_query._explain_statement("sqlite", "SELECT 1") == "EXPLAIN QUERY PLAN SELECT 1"
+    assert slow_query._explain_statement("postgresql", "SELECT 1").startswith("EXPLAIN (ANALYZE, BUFFERS)")
+    assert slow_query._explain_statement("postgresql", "INSERT INTO t VALUES (1)") == "EXPLAIN INSERT INTO t VALUES (1)"
+    assert slow_query._explain_statement("mysql", "SELECT 1") is None
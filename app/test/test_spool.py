@@ -0,0 +1,214 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core import spool
+from app.core.spool import Spool
+from app.models.abastecimento import Refueling
+
+
+@pytest.mark.asyncio
+async def test_concurrent_appends_share_fsync_and_drain_in_order(tmp_path, monkeypatch):
+    fsyncs = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(spool.os, "fsync", lambda fd: (fsyncs.append(fd), real_fsync(fd)))
+    log = Spool(str(tmp_path), fsync_interval_ms=10)
+
+    ids = await asyncio.gather(*(log.append({"n": i}) for i in range(50)))
+    assert len(set(ids)) == 50
+    # One directory fsync on open plus a handful of grouped data fsyncs.
+    assert len(fsyncs) < 10
+
+    batches = []
+
+    async def handler(records):
+        batches.append([payload["n"] for _, payload in records])
+
+    assert await log.drain(handler, batch_size=20) == 50
+    assert [len(batch) for batch in batches] == [20, 20, 10]
+    assert sorted(sum(batches, [])) == list(range(50))
+    assert log.pending() == 0
+    await log.close()
+
+
+@pytest.mark.asyncio
+async def test_segments_rotate_and_drained_ones_are_deleted(tmp_path):
+    log = Spool(str(tmp_path), segment_bytes=200, fsync_interval_ms=0)
+    for i in range(10):
+        await log.append({"n": i, "pad": "x" * 50})
+    assert len(log._segments()) > 3
+
+    async def handler(records):
+        pass
+
+    assert await log.drain(handler) == 10
+    assert len(log._segments()) == 1
+    await log.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_handler_keeps_records_for_the_next_drain(tmp_path):
+    log = Spool(str(tmp_path), fsync_interval_ms=0)
+    for i in range(3):
+        await log.append({"n": i})
+
+    async def failing(records):
+        raise RuntimeError("database went away")
+
+    with pytest.raises(RuntimeError):
+        await log.drain(failing)
+
+    seen = []
+
+    async def handler(records):
+        seen.extend(payload["n"] for _, payload in records)
+
+    assert await log.drain(handler) == 3
+    assert seen == [0, 1, 2]
+    await log.close()
+
+
+@pytest.mark.asyncio
+async def test_reopen_truncates_torn_tail_and_replays_unacknowledged(tmp_path):
+    log = Spool(str(tmp_path), fsync_interval_ms=0)
+    await log.append({"n": 1})
+    await log.append({"n": 2})
+    await log.close()
+    with open(log._segment_path(1), "ab") as f:
+        f.write(b"\x00\x00\x01\x00garbage")  # crash in the middle of a frame
+
+    reopened = Spool(str(tmp_path), fsync_interval_ms=0)
+    await reopened.open()
+    await reopened.append({"n": 3})
+    seen = []
+
+    async def handler(records):
+        seen.extend(payload["n"] for _, payload in records)
+
+    assert await reopened.drain(handler) == 3
+    assert seen == [1, 2, 3]
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_corrupt_frame_is_not_replayed(tmp_path):
+    log = Spool(str(tmp_path), fsync_interval_ms=0)
+    await log.append({"n": 1})
+    await log.close()
+    path = log._segment_path(1)
+    data = bytearray(open(path, "rb").read())
+    data[-2] ^= 0xFF
+    open(path, "wb").write(bytes(data))
+
+    seen = []
+
+    async def handler(records):
+        seen.extend(records)
+
+    assert await Spool(str(tmp_path)).drain(handler) == 0
+    assert seen == []
+
+
+@pytest.mark.asyncio
+async def test_replay_after_crash_before_checkpoint_is_exactly_once(
+    tmp_path, db_session, monkeypatch, refueling_payload
+):
+    from app.main import _drain_spooled
+
+    cpf = "40823591091"
+    log = Spool(str(tmp_path), fsync_interval_ms=0)
+    for price in ("5.40", "5.50"):
+        await log.append(refueling_payload(cpf, station_id=8, price_per_liter=price, volume_liters="25"))
+
+    def crash(*args):
+        raise OSError("killed before the checkpoint was written")
+
+    monkeypatch.setattr(log, "_write_checkpoint", crash)
+    with pytest.raises(OSError):
+        await log.drain(_drain_spooled)
+    monkeypatch.undo()
+
+    assert await log.drain(_drain_spooled) == 2
+    count = await db_session.execute(
+        select(func.count(Refueling.id)).where(Refueling.driver_cpf == cpf)
+    )
+    assert count.scalar() == 2
+    await log.close()
+
+
+@pytest.mark.asyncio
+async def test_spool_mode_acknowledges_before_the_database(client, tmp_path, monkeypatch, refueling_payload):
+    from app.api.v1 import abastecimento
+
+    log = Spool(str(tmp_path), fsync_interval_ms=0)
+    monkeypatch.setattr(abastecimento, "INGEST_MODE", "spool")
+    monkeypatch.setattr(abastecimento, "ingest_spool", log)
+
+    response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "86734725005", station_id=8, volume_liters="25",
+    ))
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    assert log.pending() > 0
+    await log.close()
+
+
+@pytest.mark.asyncio
+async def test_processes_sharing_a_root_get_their_own_directory(tmp_path):
+    first = Spool(str(tmp_path), fsync_interval_ms=0)
+    second = Spool(str(tmp_path), fsync_interval_ms=0)
+    await first.open()
+    await second.open()
+    assert first.directory != second.directory
+    await first.append({"n": 1})
+    await second.append({"n": 2})
+    # A half-written frame of the first one is not the second one's to cut.
+    with open(first._segment_path(1), "ab") as f:
+        f.write(b"\x00\x00\x01\x00partial")
+    size = os.path.getsize(first._segment_path(1))
+
+    seen = []
+
+    async def handler(records):
+        seen.extend(payload["n"] for _, payload in records)
+
+    assert await second.drain(handler) == 1
+    assert seen == [2]
+    assert os.path.getsize(first._segment_path(1)) == size
+    await first.close()
+    await second.close()
+
+    # A restarted worker takes over the free directory and what it left pending.
+    restarted = Spool(str(tmp_path), fsync_interval_ms=0)
+    assert await restarted.drain(handler) == 1
+    assert restarted.directory == first.directory
+    assert seen == [2, 1]
+    await restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_poison_record_is_dead_lettered_after_the_retry_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_MAX_ATTEMPTS", 2)
+    log = Spool(str(tmp_path), fsync_interval_ms=0)
+    for i in range(3):
+        await log.append({"n": i})
+
+    stored = []
+
+    async def handler(records):
+        if any(payload["n"] == 1 for _, payload in records):
+            raise ValueError("invalid refueling")
+        stored.extend(payload["n"] for _, payload in records)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await log.drain(handler)
+    assert stored == []
+
+    assert await log.drain(handler) == 3
+    assert stored == [0, 2]
+    assert [payload["n"] for _, payload in log.dead_letters()] == [1]
+    assert log.pending() == 0
+    await log.close()
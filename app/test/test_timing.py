@@ -0,0 +1,74 @@
+import logging
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from app.api.v1.abastecimento import router as abastecimento_router
+from app.core.database import get_db
+from app.core.metrics import instrument_engine
+from app.core.timing import RequestTiming, record_statement, server_timing_middleware, timed_phase
+from app.routers.motoristas import router as motoristas_router
+
+
+@pytest.fixture
+def timed_app(db_session):
+    instrument_engine(db_session.bind)
+
+    async def override_get_db():
+        yield db_session
+
+    timed = FastAPI()
+    timed.middleware("http")(server_timing_middleware)
+    timed.include_router(abastecimento_router, prefix="/api/v1")
+    timed.include_router(motoristas_router, prefix="/api/v1")
+    timed.dependency_overrides[get_db] = override_get_db
+    return timed
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header_reports_phases(timed_app):
+    async with AsyncClient(transport=ASGITransport(app=timed_app), base_url="http://test") as ac:
+        response = await ac.get("/api/v1/abastecimentos?fuel_type=GASOLINA")
+
+    assert response.status_code == 200
+    header = response.headers["Server-Timing"]
+    for metric in ("count;dur=", "page;dur=", "db;dur=", "orm;dur=", "serialize;dur=", "total;dur="):
+        assert metric in header
+    assert 'desc="1 stmt' in header
+
+
+@pytest.mark.asyncio
+async def test_timing_log_line_uses_route_template(timed_app, caplog):
+    with caplog.at_level(logging.INFO, logger="app.core.timing"):
+        async with AsyncClient(transport=ASGITransport(app=timed_app), base_url="http://test") as ac:
+            await ac.get("/api/v1/motoristas/11144477735/historico")
+    messages = [r.getMessage() for r in caplog.records if r.name == "app.core.timing"]
+    assert any("/api/v1/motoristas/{cpf}/historico" in m for m in messages)
+    assert not any("11144477735" in m for m in messages)
+
+
+@pytest.mark.asyncio
+async def test_no_header_without_middleware(client):
+    response = await client.get("/api/v1/motoristas/11144477735/historico")
+    assert "Server-Timing" not in response.headers
+
+
+def test_phase_and_statements_are_noops_without_request():
+    with timed_phase("count"):
+        record_statement(0.5)
+
+
+def test_request_timing_attributes_statements_to_current_phase():
+    timing = RequestTiming()
+    record = timing.record_statement
+    record(0.001)
+    with timing.phase("count"):
+        record(0.002)
+        record(0.003)
+
+    summary = timing.summary()
+    assert summary["statements"] == 3
+    assert summary["phases"]["count"]["statements"] == 2
+    assert summary["phases"]["other"]["statements"] == 1
+    assert summary["db_ms"] == pytest.approx(6.0)
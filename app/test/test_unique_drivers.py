@@ -0,0 +1,85 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core.sketches import HyperLogLog, sketch_store
+
+DAY = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def test_estimates_stay_within_error_bound():
+    sketch = HyperLogLog(p=12)
+    for i in range(20000):
+        sketch.add(f"{i:011d}")
+    assert abs(sketch.estimate() - 20000) < 3 * sketch.standard_error * 20000
+
+
+def test_merge_is_the_union_of_registers():
+    rng = random.Random(3)
+    a, b = HyperLogLog(p=10), HyperLogLog(p=10)
+    for i in range(5000):
+        a.add(str(rng.random()))
+    for i in range(300):
+        b.add(str(rng.random()))
+    expected = bytearray(map(max, a.registers, b.registers))
+
+    a.merge(b)
+    assert a.registers == expected
+    with pytest.raises(ValueError):
+        a.merge(HyperLogLog(p=11))
+
+
+def test_small_sketches_serialize_sparse():
+    sketch = HyperLogLog(p=12)
+    for i in range(50):
+        sketch.add(str(i))
+    payload = sketch.to_bytes()
+    assert len(payload) < 200
+    assert HyperLogLog.from_bytes(payload).registers == sketch.registers
+
+    for i in range(5000):
+        sketch.add(str(i))
+    assert len(sketch.to_bytes()) == 2 + 4096
+    assert HyperLogLog.from_bytes(sketch.to_bytes()).registers == sketch.registers
+
+
+@pytest.mark.asyncio
+async def test_range_union_counts_each_driver_once(client, db_session, refueling_payload):
+    day1, day2 = DAY, DAY + timedelta(days=1)
+    for cpf, day in [("81300000001", day1), ("81300000002", day1), ("81300000001", day2), ("81300000003", day2)]:
+        response = await client.post("/api/v1/abastecimentos", json=refueling_payload(
+            cpf, station_id=71, timestamp=day, fuel_type="DIESEL", price_per_liter="5.80", volume_liters="50",
+        ))
+        assert response.status_code == 201
+    # Part of the sketches stored, part still pending in this process.
+    await sketch_store.flush(db_session)
+    await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "81300000004", station_id=71, timestamp=day2, price_per_liter="5.80", volume_liters="50",
+    ))
+    await client.post("/api/v1/abastecimentos", json=refueling_payload(
+        "81300000005", station_id=72, timestamp=day2, fuel_type="DIESEL", price_per_liter="5.80", volume_liters="50",
+    ))
+
+    async def count(start, end, **params):
+        response = await client.get(
+            "/api/v1/estatisticas/motoristas-unicos",
+            params={"start": start.date().isoformat(), "end": end.date().isoformat(), **params},
+        )
+        assert response.status_code == 200
+        return {row["station_id"]: row["distinct_drivers"] for row in response.json()["data"]}
+
+    assert await count(day1, day1, station_id=71) == {71: 2}
+    assert await count(day1, day2, station_id=71) == {71: 4}
+    assert await count(day1, day2, station_id=71, fuel_type="DIESEL") == {71: 3}
+    assert await count(day2, day2) == {71: 3, 72: 1}
+
+
+@pytest.mark.asyncio
+async def test_range_is_validated(client):
+    response = await client.get(
+        "/api/v1/estatisticas/motoristas-unicos", params={"start": "2026-03-12", "end": "2026-03-10"}
+    )
+    assert response.status_code == 400
+    response = await client.get("/api/v1/estatisticas/motoristas-unicos", params={"end": "2026-03-10"})
+    assert response.status_code == 422
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+from decimal import Decimal
+from datetime import datetime, timezone
+from sqlalchemy import func, select
+
+from app.core.health_checker import HealthChecker
+from app.core.warmup import warm_up, warm_up_until_ready, warmup_state
+from app.models.abastecimento import Refueling
+from app.schemas.abastecimento import RefuelingCreate
+from app.services.abastecimento_service import RefuelingService, price_statistics
+
+
+@pytest.fixture
+def clean_warmup():
+    yield
+    price_statistics.clear()
+    warmup_state.duration_seconds = None
+    warmup_state.error = None
+
+
+async def _count(db_session):
+    return (await db_session.execute(select(func.count(Refueling.id)))).scalar()
+
+
+@pytest.mark.asyncio
+async def test_warm_up_prepares_without_persisting_rows(db_session, clean_warmup):
+    before = await _count(db_session)
+
+    state = await warm_up(connections=2)
+
+    assert state.is_warm
+    assert state.error is None
+    assert state.duration_seconds > 0
+    assert price_statistics.is_fresh
+    assert await _count(db_session) == before
+
+
+@pytest.mark.asyncio
+async def test_readiness_waits_for_warmup(clean_warmup):
+    warmup_state.duration_seconds = None
+    snapshot = await HealthChecker().refresh()
+    assert "warming_up" in snapshot["reasons"]
+
+    await warm_up(connections=1)
+    snapshot = await HealthChecker().refresh()
+    assert snapshot["warmup"]["warm"] is True
+    assert "warming_up" not in snapshot["reasons"]
+
+
+@pytest.mark.asyncio
+async def test_preloaded_statistics_replace_avg_query(db_session, clean_warmup):
+    price_statistics._totals = {"DIESEL": [Decimal("4.00"), 1]}
+    price_statistics.loaded_at = time.monotonic()
+
+    payload = RefuelingCreate(
+        station_id=9,
+        timestamp=datetime.now(timezone.utc),
+        fuel_type="DIESEL",
+        price_per_liter=Decimal("5.10"),
+        volume_liters=Decimal("10"),
+        driver_cpf="11144477735",
+    )
+    result = await RefuelingService.create_refueling(db_session, payload)
+
+    assert result.improper_data is True
+    assert price_statistics.average("DIESEL") == Decimal("4.55")
+
+
+def test_price_statistics_running_average():
+    stats = price_statistics.__class__()
+    stats.add("ETANOL", Decimal("3.00"))
+    assert stats.average("ETANOL") is None
+
+    stats.loaded_at = 0.0
+    stats.add("ETANOL", Decimal("3.00"))
+    stats.add("ETANOL", Decimal("4.00"))
+    assert stats.average("ETANOL") == Decimal("3.50")
+
+
+@pytest.mark.asyncio
+async def test_failed_warmup_keeps_readiness_red_and_retries(clean_warmup, monkeypatch):
+    attempts = []
+
+    async def flaky_load(session):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(price_statistics, "load", flaky_load)
+    state = await warm_up(connections=0)
+    assert not state.is_warm
+    snapshot = await HealthChecker().refresh()
+    assert "warmup_failed" in snapshot["reasons"]
+    assert not snapshot["ready"]
+
+    await warm_up_until_ready(retry_seconds=0)
+    assert warmup_state.is_warm
+    assert len(attempts) == 2
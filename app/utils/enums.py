@@ -3,4 +3,16 @@ from enum import Enum
 class FuelType(str, Enum):
     GASOLINA = "GASOLINA"
     ETANOL = "ETANOL"
-    DIESEL = "DIESEL"
\ No newline at end of file
+    DIESEL = "DIESEL"
+
+
+class RankingMetric(str, Enum):
+    DRIVER_LITERS = "driver_liters"
+    DRIVER_SPEND = "driver_spend"
+    STATION_LITERS = "station_liters"
+
+
+class ExportFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+    PARQUET = "parquet"